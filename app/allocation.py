@@ -0,0 +1,104 @@
+from typing import Sequence, Tuple
+
+import numpy as np
+
+# Un véhicule qui consomme moins que sa limite (batterie presque pleine,
+# chargeur embarqué limité) ne reçoit que sa consommation plus cette marge ;
+# la puissance libérée est redistribuée aux autres connecteurs
+DEMAND_HEADROOM = 0.1
+
+
+def allocate(capacity: float, active: np.ndarray, demand: np.ndarray, minimum: np.ndarray, weight: np.ndarray) -> np.ndarray:
+    """
+    Répartit `capacity` watts entre les connecteurs actifs, en une passe vectorisée.
+
+    Chaque connecteur admis reçoit d'abord son minimum, puis le reste est
+    partagé équitablement au prorata de `weight` (partage max-min pondéré,
+    par remplissage) sans dépasser `demand`. Si la somme des minimums
+    dépasse la capacité, les connecteurs de plus faible poids sont mis en
+    pause (0 W). Retourne la puissance allouée à chaque connecteur.
+    """
+    allocation = np.zeros(demand.shape[0])
+    index = np.flatnonzero(active & (demand > 0))
+    if not index.size:
+        return allocation
+    demand = demand[index]
+    minimum = np.minimum(minimum[index], demand)
+    weight = np.maximum(weight[index], 1e-9)
+    if minimum.sum() > capacity:
+        # Admission par poids décroissant, tant que les minimums tiennent dans la capacité
+        order = np.argsort(-weight, kind="stable")
+        admitted = np.zeros(index.size, dtype=bool)
+        admitted[order[np.cumsum(minimum[order]) <= capacity]] = True
+        index, demand, minimum, weight = index[admitted], demand[admitted], minimum[admitted], weight[admitted]
+        if not index.size:
+            return allocation
+    remaining = capacity - minimum.sum()
+    headroom = demand - minimum
+    # Niveau λ tel que Σ min(headroom, λ·weight) = remaining : les points de
+    # rupture sont les ratios headroom/weight, triés une seule fois
+    ratio = headroom / weight
+    order = np.argsort(ratio)
+    ratio, sorted_headroom, sorted_weight = ratio[order], headroom[order], weight[order]
+    capped = np.concatenate(([0.0], np.cumsum(sorted_headroom)[:-1]))
+    weight_above = np.cumsum(sorted_weight[::-1])[::-1]
+    total = capped + ratio * weight_above
+    k = np.searchsorted(total, remaining)
+    if k >= ratio.size:
+        extra = headroom
+    else:
+        level = (remaining - capped[k]) / weight_above[k]
+        extra = np.minimum(headroom, level * weight)
+    allocation[index] = minimum + extra
+    return allocation
+
+
+class SiteState:
+    """
+    État des connecteurs d'un site, en colonnes NumPy : une ligne par
+    connecteur, dans l'ordre de configuration.
+    """
+
+    def __init__(self, capacity: float, charge_point_ids: Sequence[str], connector_ids: Sequence[int], rating: Sequence[float], minimum: Sequence[float], priority: Sequence[float]):
+        size = len(charge_point_ids)
+        self.capacity = capacity
+        self.charge_point_ids = list(charge_point_ids)
+        self.connector_ids = np.asarray(connector_ids, dtype=np.int32)
+        # Puissance maximale du connecteur, limite annoncée pour le véhicule et minimum de charge (W)
+        self.rating = np.asarray(rating, dtype=float)
+        self.ev_limit = np.full(size, np.inf)
+        self.minimum = np.asarray(minimum, dtype=float)
+        self.priority = np.asarray(priority, dtype=float)
+        # Puissance mesurée par MeterValues (NaN tant qu'aucune mesure n'est reçue)
+        self.power = np.full(size, np.nan)
+        self.active = np.zeros(size, dtype=bool)
+        self.transaction_ids = np.full(size, -1, dtype=np.int64)
+        # Dernière limite acceptée par le point de charge (NaN : aucune)
+        self.limit = np.full(size, np.nan)
+        # Répartition issue du dernier recalcul
+        self.allocation = np.zeros(size)
+
+    def __len__(self):
+        return len(self.charge_point_ids)
+
+    def demand(self) -> np.ndarray:
+        """Puissance que chaque connecteur peut absorber, d'après ses limites et sa consommation mesurée."""
+        cap = np.minimum(self.rating, self.ev_limit)
+        limited = np.where(np.isnan(self.limit), cap, np.minimum(self.limit, cap))
+        # Consommation sous la limite en vigueur, marge comprise : le véhicule se limite lui-même.
+        # Une limite égale à la consommation plus la marge reste stable d'un recalcul à l'autre
+        # (tolérance de 1 W pour l'arrondi des limites envoyées).
+        self_limited = np.isfinite(self.power) & (self.power * (1 + DEMAND_HEADROOM) <= limited + 1)
+        return np.where(self_limited, np.maximum(self.power * (1 + DEMAND_HEADROOM), self.minimum), cap)
+
+    def rebalance(self, threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Recalcule la répartition et retourne les indices des connecteurs
+        actifs dont la limite change d'au moins `threshold` watts, avec
+        leur nouvelle limite.
+        """
+        allocation = self.allocation = allocate(self.capacity, self.active, self.demand(), self.minimum, self.priority)
+        changed = np.flatnonzero(self.active & (np.isnan(self.limit) | (np.abs(allocation - self.limit) >= threshold)))
+        # Les limites des sessions terminées sont oubliées
+        self.limit[~self.active] = np.nan
+        return changed, allocation[changed]
@@ -1,19 +1,41 @@
-from fastapi import APIRouter, Query, Body
-import websockets
-import asyncio
+from fastapi import APIRouter, Query, Body, Depends
 import logging
-from dotenv import load_dotenv
 import os
 import json
+import time
 from pydantic import BaseModel, Field
 from typing import Optional, List
+from app.env import load_dotenv
+from app.circuit_breaker import CircuitOpenError
+from app.connection import ConnectionManager
+from app.deadlines import CallTimeoutError
+from app.scheduler import QueueFullError
+from app.validation import PayloadValidationError
+from app.registry import get_session
+from app.status_store import status_store
+from app.auth_cache import authorization_cache
+from app.config_cache import configuration_cache
+from app.journal import transaction_journal
+from app.offline_queue import offline_queue
 
 
 router = APIRouter()
 
 load_dotenv()
-WEBSOCKET_URL = os.getenv("WEBSOCKET_URL_LOCALHOST")
   
+# Erreurs laissées aux gestionnaires de app.main, qui les traduisent en statut HTTP (503, 504, 429, 422)
+HTTP_ERRORS = (CircuitOpenError, CallTimeoutError, QueueFullError, PayloadValidationError)
+
+# Valeurs des champs du StatusNotification que l'appelant de `/status` ne précise pas
+STATUS_DEFAULTS = {
+    "errorCode": "NoError",
+    "status": "Available",
+    "timestamp": "2023-05-21T15:00:00Z",
+    "info": "Additional information about the status",
+    "vendorId": "Vendor123",
+    "vendorErrorCode": "VendorError456",
+}
+
 
 class StatusResponse(BaseModel):
     connectorId: int = Field(..., description="ID du connecteur")
@@ -23,9 +45,12 @@ class StatusResponse(BaseModel):
     info: Optional[str] = Field(None, description="Informations supplémentaires", example="Test")
     vendorId: Optional[str] = Field(None, description="ID du fournisseur", example="Vendor")
     vendorErrorCode: Optional[str] = Field(None, description="Code d'erreur fournisseur", example="NoError")
+    updatedAt: Optional[str] = Field(None, description="Date de la dernière mise à jour en mémoire", example="2023-05-21T15:00:01+00:00")
+    age: Optional[float] = Field(None, description="Ancienneté du statut en secondes", example=0.5)
 
 class StartChargingResponse(BaseModel):
     message: str = Field(..., description="Message indiquant le début de la charge", example="Charging started")
+    transactionId: Optional[int] = Field(None, description="Identifiant de la transaction attribué par le serveur central", example=42)
     error: Optional[str] = Field(None, description="Message d'erreur, le cas échéant", example="Error message")
 
 class StopChargingResponse(BaseModel):
@@ -35,8 +60,14 @@ class StopChargingResponse(BaseModel):
 class HeartbeatResponse(BaseModel):
     current_time: str
 
+class MeterValuesRequest(BaseModel):
+    connector_id: int = Field(1, description="L'identifiant du connecteur")
+    transaction_id: Optional[int] = Field(None, description="Identifiant de la transaction en cours")
+    meter_value: List[dict] = Field(..., description="Relevés OCPP (`timestamp` et `sampledValue`)")
+
 class MeterValuesResponse(BaseModel):
     meter_value: dict
+    queued: Optional[bool] = None
 
 class AuthorizeRequest(BaseModel):
     id_tag: str
@@ -82,22 +113,32 @@ class ChangeConfigurationResponse(BaseModel):
     status: Optional[str] = None
     error: Optional[str] = None
 
-async def send_command(message: str):
+async def send_command(session: ConnectionManager, action: str, payload: dict):
     try:
-        async with websockets.connect(WEBSOCKET_URL, subprotocols=["ocpp1.6"]) as websocket:
-            logging.info(f"Envoi de la commande: {message}")
-            await websocket.send(message)
-            response = await websocket.recv()
-            logging.info(f"Réponse reçue: {response}")
-            return json.loads(response)  # Assurez-vous de retourner la réponse sous forme de dictionnaire
+        response = await session.call(action, payload)
+        return response
+    except HTTP_ERRORS:
+        raise
     except Exception as e:
-        logging.error(f"Erreur de connexion WebSocket: {e}")
+        logging.error("Erreur de connexion WebSocket: %s", e)
         return {"error": str(e)}
 
+async def change_configuration(session: ConnectionManager, key: str, value: str):
+    response = await send_command(session, "ChangeConfiguration", {
+        "key": key,
+        "value": value
+    })
+    if isinstance(response, dict):
+        return response
+    if response.is_error:
+        return {"error": response.error_code}
+    return response.payload
+
 @router.get("/test-websocket", summary="Tester la connexion WebSocket", description="Ce endpoint permet de tester la connexion WebSocket avec le serveur de gestion des points de charge. Il envoie un message de `BootNotification` au serveur pour vérifier si la connexion est correctement établie et si le serveur répond comme attendu. Ce message inclut des informations de base sur le modèle et le fournisseur du point de charge, extraites des variables d'environnement configurées. Ce test est essentiel pour valider la communication initiale entre le point de charge et le serveur central.")
 async def test_websocket_endpoint(
     charge_point_vendor: str = Query(os.getenv("CHARGE_POINT_VENDOR", "Vendor_Y"), description="Le fournisseur du point de charge"),
-    charge_point_model: str = Query(os.getenv("CHARGE_POINT_MODEL", "Model_X"), description="Le modèle du point de charge")
+    charge_point_model: str = Query(os.getenv("CHARGE_POINT_MODEL", "Model_X"), description="Le modèle du point de charge"),
+    session: ConnectionManager = Depends(get_session)
 ):
     """
     Teste la connexion WebSocket avec un message BootNotification.
@@ -106,35 +147,29 @@ async def test_websocket_endpoint(
     - **chargePointModel**: Le modèle du point de charge
     """
     try:
-        async with websockets.connect(WEBSOCKET_URL, subprotocols=["ocpp1.6"]) as ws:
-            logging.info("Connexion WebSocket établie")
-            boot_notification_message = json.dumps([
-                2,  # MessageTypeId (2 = CALL)
-                "uniqueId123",  # Unique ID for the message
-                "BootNotification",  # Action
-                {
-                    "chargePointVendor": charge_point_vendor,
-                    "chargePointModel": charge_point_model
-                }
-            ])
-            await ws.send(boot_notification_message)
-            response = await ws.recv()
-            logging.info(f"Réponse reçue: {response}")
-            return {"message": response}
+        response = await session.call("BootNotification", {
+            "chargePointVendor": charge_point_vendor,
+            "chargePointModel": charge_point_model
+        })
+        return {"message": json.dumps(response.to_list())}
+    except HTTP_ERRORS:
+        raise
     except Exception as e:
-        logging.error(f"Erreur lors de la connexion WebSocket: {e}")
+        logging.error("Erreur lors de la connexion WebSocket: %s", e)
         return {"error": str(e)}
 
 
-@router.get("/status", summary="Récupérer le statut actuel du connecteur", description="Ce endpoint permet de récupérer des informations détaillées sur le statut actuel d'un connecteur de charge. Il envoie un message `StatusNotification` au serveur via WebSocket pour obtenir le statut en temps réel. La réponse inclut des détails tels que l'ID du connecteur, le code d'erreur, le statut (par exemple, disponible ou occupé), un horodatage, ainsi que des informations supplémentaires fournies par le fournisseur du point de charge. Cette fonctionnalité est cruciale pour surveiller et diagnostiquer l'état opérationnel des points de charge.", response_model=StatusResponse)
+@router.get("/status", summary="Récupérer le statut actuel du connecteur", description="Ce endpoint permet de récupérer des informations détaillées sur le statut actuel d'un connecteur de charge. Il envoie un message `StatusNotification` au serveur via WebSocket pour obtenir le statut en temps réel. La réponse inclut des détails tels que l'ID du connecteur, le code d'erreur, le statut (par exemple, disponible ou occupé), un horodatage, ainsi que des informations supplémentaires fournies par le fournisseur du point de charge. Cette fonctionnalité est cruciale pour surveiller et diagnostiquer l'état opérationnel des points de charge. Si aucun champ de statut n'est fourni et qu'un statut est déjà connu pour ce connecteur, il est renvoyé depuis la mémoire sans aller-retour OCPP, avec sa date de mise à jour et son ancienneté ; dès qu'un champ est fourni (ou avec `refresh=true`), le `StatusNotification` est envoyé, les champs absents prenant leur valeur par défaut.", response_model=StatusResponse)
 async def get_status(
     connector_id: int = Query(1, description="L'identifiant du connecteur"),
-    error_code: str = Query("NoError", description="Code d'erreur"),
-    status: str = Query("Available", description="Statut actuel du connecteur"),
-    timestamp: str = Query("2023-05-21T15:00:00Z", description="Horodatage de la requête"),
-    info: Optional[str] = Query("Additional information about the status", description="Informations supplémentaires"),
-    vendor_id: Optional[str] = Query("Vendor123", description="Identifiant du fournisseur"),
-    vendor_error_code: Optional[str] = Query("VendorError456", description="Code d'erreur spécifique au fournisseur")
+    error_code: Optional[str] = Query(None, description="Code d'erreur (NoError par défaut)"),
+    status: Optional[str] = Query(None, description="Statut actuel du connecteur (Available par défaut)"),
+    timestamp: Optional[str] = Query(None, description="Horodatage de la requête"),
+    info: Optional[str] = Query(None, description="Informations supplémentaires"),
+    vendor_id: Optional[str] = Query(None, description="Identifiant du fournisseur"),
+    vendor_error_code: Optional[str] = Query(None, description="Code d'erreur spécifique au fournisseur"),
+    refresh: bool = Query(False, description="Envoyer le StatusNotification même si un statut est connu"),
+    session: ConnectionManager = Depends(get_session)
 ):
     """
     Récupère le statut actuel du connecteur avec des informations détaillées.
@@ -146,31 +181,40 @@ async def get_status(
     - **info**: Informations supplémentaires
     - **vendorId**: Identifiant du fournisseur
     - **vendorErrorCode**: Code d'erreur spécifique au fournisseur
+    - **refresh**: Ignorer le statut connu en mémoire
     """
+    fields = {
+        "errorCode": error_code,
+        "status": status,
+        "timestamp": timestamp,
+        "info": info,
+        "vendorId": vendor_id,
+        "vendorErrorCode": vendor_error_code
+    }
+    if not refresh and all(value is None for value in fields.values()):
+        # Simple lecture : le statut connu suffit
+        known_status = status_store.get(session.charge_point_id, connector_id)
+        if known_status is not None:
+            return known_status.as_dict()
     try:
-        payload = {
-            "connectorId": connector_id,
-            "errorCode": error_code,
-            "status": status,
-            "timestamp": timestamp,
-            "info": info,
-            "vendorId": vendor_id,
-            "vendorErrorCode": vendor_error_code
-        }
-        message = json.dumps([2, "uniqueId123", "StatusNotification", payload])
-        response = await send_command(message)
+        payload = {"connectorId": connector_id}
+        payload.update((key, STATUS_DEFAULTS[key] if value is None else value) for key, value in fields.items())
+        response = await send_command(session, "StatusNotification", payload)
         
         # Assurez-vous que la réponse est un dictionnaire conforme au modèle
         return payload
+    except HTTP_ERRORS:
+        raise
     except Exception as e:
         return {"error": str(e)}
 
-@router.post("/start", summary="Démarrer une session de charge", description="Ce endpoint initie une session de charge pour un véhicule électrique en envoyant un message `StartTransaction` au serveur. Les paramètres incluent l'ID du connecteur, l'identifiant de la carte RFID (`idTag`) utilisée pour authentifier la session de charge, la valeur initiale du compteur électrique (`meterStart`), et un horodatage. Ce processus démarre officiellement la transaction de charge, permettant au véhicule de commencer à recevoir de l'énergie. La réponse du serveur indiquera si la session a été démarrée avec succès et fournira des détails supplémentaires si nécessaire.")
+@router.post("/start", summary="Démarrer une session de charge", description="Ce endpoint initie une session de charge pour un véhicule électrique en envoyant un message `StartTransaction` au serveur. Les paramètres incluent l'ID du connecteur, l'identifiant de la carte RFID (`idTag`) utilisée pour authentifier la session de charge, la valeur initiale du compteur électrique (`meterStart`), et un horodatage. Ce processus démarre officiellement la transaction de charge, permettant au véhicule de commencer à recevoir de l'énergie. La réponse du serveur indiquera si la session a été démarrée avec succès et fournira des détails supplémentaires si nécessaire. La transaction est enregistrée dans le journal local et son `transactionId` est renvoyé ; une demande identique (même connecteur, `idTag` et horodatage) pour une transaction encore ouverte renvoie la même transaction sans nouvel envoi. Si le serveur central est injoignable, le message est conservé dans la file hors ligne et rejoué à la reconnexion (`queued: true`).")
 async def start_charging(
     connector_id: int = Query(1, description="L'identifiant du connecteur"),
     id_tag: str = Query("ABC123", description="Identifiant de la carte RFID"),
     meter_start: int = Query(0, description="Valeur initiale du compteur"),
-    timestamp: str = Query("2023-05-21T15:00:00Z", description="Horodatage de la requête")
+    timestamp: str = Query("2023-05-21T15:00:00Z", description="Horodatage de la requête"),
+    session: ConnectionManager = Depends(get_session)
 ):
     """
     Démarre une session de charge.
@@ -181,23 +225,39 @@ async def start_charging(
     - **timestamp**: Horodatage de la requête
     """
     try:
+        transaction_id = transaction_journal.find_start(session.charge_point_id, connector_id, id_tag, timestamp)
+        if transaction_id is not None:
+            return {"message": "Charging already started", "transactionId": transaction_id}
         payload = {
             "connectorId": connector_id,
             "idTag": id_tag,
             "meterStart": meter_start,
             "timestamp": timestamp
         }
-        message = json.dumps([2, "uniqueId123", "StartTransaction", payload])
-        response = await send_command(message)
-        return {"message": f"Charging started for {response}"}
+        response = await transaction_journal.once(
+            (session.charge_point_id, "StartTransaction", connector_id, id_tag, timestamp),
+            lambda: offline_queue.send_or_enqueue(session, "StartTransaction", payload)
+        )
+        if response is None:
+            return {"message": "Charging start queued", "queued": True}
+        if response.is_error:
+            return {"error": response.error_code}
+        return {
+            "message": "Charging started",
+            "transactionId": response.payload.get("transactionId"),
+            "idTagInfo": response.payload.get("idTagInfo")
+        }
+    except HTTP_ERRORS:
+        raise
     except Exception as e:
         return {"error": str(e)}
 
-@router.post("/stop", summary="Arrêter une session de charge", description="Ce endpoint arrête une session de charge en cours pour un véhicule électrique en envoyant un message `StopTransaction` au serveur. Les paramètres incluent l'ID de la transaction en cours, la valeur finale du compteur électrique (`meterStop`), et un horodatage. Cette action met fin à la transaction de charge, et la réponse du serveur fournira des détails sur la session de charge terminée.")
+@router.post("/stop", summary="Arrêter une session de charge", description="Ce endpoint arrête une session de charge en cours pour un véhicule électrique en envoyant un message `StopTransaction` au serveur. Les paramètres incluent l'ID de la transaction en cours, la valeur finale du compteur électrique (`meterStop`), et un horodatage. Cette action met fin à la transaction de charge, et la réponse du serveur fournira des détails sur la session de charge terminée. La fin de transaction est enregistrée dans le journal local ; un second arrêt de la même transaction renvoie le résultat déjà connu sans nouvel envoi. Si le serveur central est injoignable, le message (dont `meterStop`) est conservé dans la file hors ligne et rejoué à la reconnexion (`queued: true`).")
 async def stop_charging(
     transaction_id: int = Query(1, description="L'identifiant de la transaction"),
     meter_stop: int = Query(10, description="Valeur finale du compteur"),
-    timestamp: str = Query("2023-05-21T16:00:00Z", description="Horodatage de la requête")
+    timestamp: str = Query("2023-05-21T16:00:00Z", description="Horodatage de la requête"),
+    session: ConnectionManager = Depends(get_session)
 ):
     """
     Arrête une session de charge.
@@ -207,112 +267,125 @@ async def stop_charging(
     - **timestamp**: Horodatage de la requête
     """
     try:
+        stopped = await transaction_journal.find_stop(session.charge_point_id, transaction_id)
+        if stopped is not None:
+            return {"message": "Charging already stopped", "transactionId": transaction_id, "idTagInfo": stopped.get("idTagInfo")}
         payload = {
             "transactionId": transaction_id,
             "meterStop": meter_stop,
             "timestamp": timestamp
         }
-        message = json.dumps([2, "uniqueId123", "StopTransaction", payload])
-        response = await send_command(message)
-        return {"message": f"Charging stopped for {response}"}
+        response = await transaction_journal.once(
+            (session.charge_point_id, "StopTransaction", transaction_id),
+            lambda: offline_queue.send_or_enqueue(session, "StopTransaction", payload)
+        )
+        if response is None:
+            return {"message": "Charging stop queued", "transactionId": transaction_id, "queued": True}
+        if response.is_error:
+            return {"error": response.error_code}
+        return {
+            "message": "Charging stopped",
+            "transactionId": transaction_id,
+            "idTagInfo": response.payload.get("idTagInfo")
+        }
+    except HTTP_ERRORS:
+        raise
     except Exception as e:
         return {"error": str(e)}
 
 @router.get("/heartbeat", response_model=HeartbeatResponse, summary="Envoyer un Heartbeat", description="Ce endpoint envoie un message Heartbeat au serveur via WebSocket pour vérifier la connexion.")
-async def heartbeat():
+async def heartbeat(session: ConnectionManager = Depends(get_session)):
     """
     Envoie un message Heartbeat au serveur via WebSocket.
 
     - **current_time**: L'heure actuelle renvoyée par le serveur
     """
     try:
-        async with websockets.connect(WEBSOCKET_URL, subprotocols=["ocpp1.6"]) as ws:
-            logging.info("Connexion WebSocket établie pour Heartbeat")
-            heartbeat_message = json.dumps([
-                2,  # MessageTypeId (2 = CALL)
-                "uniqueIdHeartbeat",  # Unique ID for the message
-                "Heartbeat",  # Action
-                {}
-            ])
-            await ws.send(heartbeat_message)
-            response = await ws.recv()
-            logging.info(f"Réponse Heartbeat reçue: {response}")
-            return {"current_time": json.loads(response)[2]["currentTime"]}
+        response = await session.call("Heartbeat", {})
+        return {"current_time": response.payload["currentTime"]}
+    except HTTP_ERRORS:
+        raise
     except Exception as e:
-        logging.error(f"Erreur lors de la connexion WebSocket pour Heartbeat: {e}")
+        logging.error("Erreur lors de la connexion WebSocket pour Heartbeat: %s", e)
         return {"error": str(e)}
     
-@router.post("/meter-values", response_model=MeterValuesResponse, summary="Envoyer des valeurs de compteur", description="Ce endpoint envoie des valeurs de compteur au serveur via WebSocket.")
-async def meter_values():
+@router.post("/meter-values", response_model=MeterValuesResponse, summary="Envoyer des valeurs de compteur", description="Ce endpoint envoie des valeurs de compteur au serveur via WebSocket : les relevés fournis dans le corps de la requête, ou à défaut un relevé d'énergie à 0 Wh. Chaque échantillon accepté par le serveur central est aussi conservé dans le stockage colonne des valeurs de compteur (`GET /meter-store`). Si le serveur central est injoignable, les valeurs sont conservées dans la file hors ligne et rejouées à la reconnexion (`queued: true`).")
+async def meter_values(
+    request: Optional[MeterValuesRequest] = Body(None, description="Relevés à envoyer ; sans corps, un relevé d'énergie à 0 Wh"),
+    session: ConnectionManager = Depends(get_session)
+):
     """
     Envoie des valeurs de compteur au serveur via WebSocket.
 
-    - **meter_value**: Les valeurs de compteur renvoyées par le serveur
+    - **connector_id**: (Optionnel) L'identifiant du connecteur
+    - **transaction_id**: (Optionnel) Identifiant de la transaction en cours
+    - **meter_value**: (Optionnel) Relevés OCPP à envoyer
     """
     try:
-        async with websockets.connect(WEBSOCKET_URL, subprotocols=["ocpp1.6"]) as ws:
-            logging.info("Connexion WebSocket établie pour Meter Values")
-            meter_values_message = json.dumps([
-                2,  # MessageTypeId (2 = CALL)
-                "uniqueIdMeterValues",  # Unique ID for the message
-                "MeterValues",  # Action
-                {
-                    "connectorId": 1,
-                    "meterValue": [
-                        {
-                            "timestamp": "2023-01-01T00:00:00Z",
-                            "sampledValue": [
-                                {
-                                    "value": "0",
-                                    "context": "Sample.Periodic",
-                                    "format": "Raw",
-                                    "measurand": "Energy.Active.Import.Register",
-                                    "unit": "Wh"
-                                }
-                            ]
-                        }
-                    ]
-                }
-            ])
-            await ws.send(meter_values_message)
-            response = await ws.recv()
-            logging.info(f"Réponse Meter Values reçue: {response}")
-            return {"meter_value": json.loads(response)[2]}
+        if request is None:
+            payload = {
+                "connectorId": 1,
+                "meterValue": [
+                    {
+                        "timestamp": "2023-01-01T00:00:00Z",
+                        "sampledValue": [
+                            {
+                                "value": "0",
+                                "context": "Sample.Periodic",
+                                "format": "Raw",
+                                "measurand": "Energy.Active.Import.Register",
+                                "unit": "Wh"
+                            }
+                        ]
+                    }
+                ]
+            }
+        else:
+            payload = {"connectorId": request.connector_id, "meterValue": request.meter_value}
+            if request.transaction_id is not None:
+                payload["transactionId"] = request.transaction_id
+        response = await offline_queue.send_or_enqueue(session, "MeterValues", payload)
+        if response is None:
+            return {"meter_value": {}, "queued": True}
+        return {"meter_value": response.payload}
+    except HTTP_ERRORS:
+        raise
     except Exception as e:
-        logging.error(f"Erreur lors de la connexion WebSocket pour Meter Values: {e}")
+        logging.error("Erreur lors de la connexion WebSocket pour Meter Values: %s", e)
         return {"error": str(e)}
     
 @router.post("/authorize", response_model=AuthorizeResponse, summary="Autoriser un utilisateur", description="Ce endpoint envoie une demande d'autorisation au serveur via WebSocket.")
 async def authorize(
-    request: AuthorizeRequest = Body(..., description="Requête d'autorisation contenant l'identifiant de la carte RFID")
+    request: AuthorizeRequest = Body(..., description="Requête d'autorisation contenant l'identifiant de la carte RFID"),
+    session: ConnectionManager = Depends(get_session)
 ):
     """
     Envoie une demande d'autorisation au serveur via WebSocket.
 
     - **idTag**: Identifiant de la carte RFID
+
+    Un idTag accepté récemment est servi depuis le cache d'autorisation, sans aller-retour OCPP.
     """
     try:
-        async with websockets.connect(WEBSOCKET_URL, subprotocols=["ocpp1.6"]) as ws:
-            logging.info("Connexion WebSocket établie pour Authorize")
-            authorize_message = json.dumps([
-                2,  # MessageTypeId (2 = CALL)
-                "uniqueIdAuthorize",  # Unique ID for the message
-                "Authorize",  # Action
-                {
-                    "idTag": request.id_tag
-                }
-            ])
-            await ws.send(authorize_message)
-            response = await ws.recv()
-            logging.info(f"Réponse Authorize reçue: {response}")
-            return {"id_tag_info": json.loads(response)[2]}
+        id_tag_info = authorization_cache.get(request.id_tag)
+        if id_tag_info is not None:
+            return {"id_tag_info": {"idTagInfo": id_tag_info}}
+        started = time.perf_counter()
+        response = await session.call("Authorize", {
+            "idTag": request.id_tag
+        })
+        authorization_cache.record_upstream(time.perf_counter() - started)
+        return {"id_tag_info": response.payload}
+    except HTTP_ERRORS:
+        raise
     except Exception as e:
-        logging.error(f"Erreur lors de la connexion WebSocket pour Authorize: {e}")
+        logging.error("Erreur lors de la connexion WebSocket pour Authorize: %s", e)
         return {"error": str(e)}
     
 @router.post("/unlock-connector", response_model=UnlockConnectorResponse, summary="Déverrouiller un connecteur", description="Ce endpoint envoie une demande de déverrouillage de connecteur au serveur via WebSocket.")
 async def unlock_connector(
-    request: UnlockConnectorRequest = Body(..., description="Requête de déverrouillage contenant l'identifiant du connecteur")
+    request: UnlockConnectorRequest = Body(..., description="Requête de déverrouillage contenant l'identifiant du connecteur"),
+    session: ConnectionManager = Depends(get_session)
 ):
     """
     Envoie une demande de déverrouillage de connecteur au serveur via WebSocket.
@@ -320,30 +393,22 @@ async def unlock_connector(
     - **connectorId**: Identifiant du connecteur à déverrouiller
     """
     try:
-        async with websockets.connect(WEBSOCKET_URL, subprotocols=["ocpp1.6"]) as ws:
-            logging.info("Connexion WebSocket établie pour Unlock Connector")
-            unlock_connector_message = json.dumps([
-                2,  # MessageTypeId (2 = CALL)
-                "uniqueIdUnlockConnector",  # Unique ID for the message
-                "UnlockConnector",  # Action
-                {
-                    "connectorId": request.connector_id
-                }
-            ])
-            await ws.send(unlock_connector_message)
-            response = await ws.recv()
-            logging.info(f"Réponse Unlock Connector reçue: {response}")
-            response_data = json.loads(response)
-            if response_data[0] == 4:  # MessageTypeId (4 = CALLERROR)
-                return {"error": response_data[2]}
-            return {"status": response_data[2].get("status")}
+        response = await session.call("UnlockConnector", {
+            "connectorId": request.connector_id
+        })
+        if response.is_error:
+            return {"error": response.error_code}
+        return {"status": response.payload.get("status")}
+    except HTTP_ERRORS:
+        raise
     except Exception as e:
-        logging.error(f"Erreur lors de la connexion WebSocket pour Unlock Connector: {e}")
+        logging.error("Erreur lors de la connexion WebSocket pour Unlock Connector: %s", e)
         return {"error": str(e)}
     
 @router.post("/remote-start-transaction", response_model=RemoteStartTransactionResponse, summary="Démarrer une transaction à distance", description="Ce endpoint envoie une demande de démarrage de transaction à distance au serveur via WebSocket.")
 async def remote_start_transaction(
-    request: RemoteStartTransactionRequest = Body(..., description="Requête de démarrage de transaction contenant l'identifiant de la carte RFID et éventuellement l'identifiant du connecteur")
+    request: RemoteStartTransactionRequest = Body(..., description="Requête de démarrage de transaction contenant l'identifiant de la carte RFID et éventuellement l'identifiant du connecteur"),
+    session: ConnectionManager = Depends(get_session)
 ):
     """
     Envoie une demande de démarrage de transaction à distance au serveur via WebSocket.
@@ -352,31 +417,23 @@ async def remote_start_transaction(
     - **connectorId**: (Optionnel) Identifiant du connecteur 
     """ 
     try:
-        async with websockets.connect(WEBSOCKET_URL, subprotocols=["ocpp1.6"]) as ws:
-            logging.info("Connexion WebSocket établie pour Remote Start Transaction")
-            remote_start_transaction_message = json.dumps([
-                2,  # MessageTypeId (2 = CALL)
-                "uniqueIdRemoteStartTransaction",  # Unique ID for the message
-                "RemoteStartTransaction",  # Action
-                {
-                    "idTag": request.id_tag,
-                    "connectorId": request.connector_id
-                }
-            ])
-            await ws.send(remote_start_transaction_message)
-            response = await ws.recv()
-            logging.info(f"Réponse Remote Start Transaction reçue: {response}")
-            response_data = json.loads(response)
-            if response_data[0] == 4:  # MessageTypeId (4 = CALLERROR)
-                return {"error": response_data[2]}
-            return {"status": response_data[2].get("status")}
+        payload = {"idTag": request.id_tag}
+        if request.connector_id is not None:
+            payload["connectorId"] = request.connector_id
+        response = await session.call("RemoteStartTransaction", payload)
+        if response.is_error:
+            return {"error": response.error_code}
+        return {"status": response.payload.get("status")}
+    except HTTP_ERRORS:
+        raise
     except Exception as e:
-        logging.error(f"Erreur lors de la connexion WebSocket pour Remote Start Transaction: {e}")
+        logging.error("Erreur lors de la connexion WebSocket pour Remote Start Transaction: %s", e)
         return {"error": str(e)}
     
 @router.post("/remote-stop-transaction", response_model=RemoteStopTransactionResponse, summary="Arrêter une transaction à distance", description="Ce endpoint envoie une demande d'arrêt de transaction à distance au serveur via WebSocket.")
 async def remote_stop_transaction(
-    request: RemoteStopTransactionRequest = Body(..., description="Requête d'arrêt de transaction contenant l'identifiant de la transaction")
+    request: RemoteStopTransactionRequest = Body(..., description="Requête d'arrêt de transaction contenant l'identifiant de la transaction"),
+    session: ConnectionManager = Depends(get_session)
 ):
     """
     Envoie une demande d'arrêt de transaction à distance au serveur via WebSocket.
@@ -384,64 +441,55 @@ async def remote_stop_transaction(
     - **transactionId**: Identifiant de la transaction à arrêter
     """
     try:
-        async with websockets.connect(WEBSOCKET_URL, subprotocols=["ocpp1.6"]) as ws:
-            logging.info("Connexion WebSocket établie pour Remote Stop Transaction")
-            remote_stop_transaction_message = json.dumps([
-                2,  # MessageTypeId (2 = CALL)
-                "uniqueIdRemoteStopTransaction",  # Unique ID for the message
-                "RemoteStopTransaction",  # Action
-                {
-                    "transactionId": request.transaction_id
-                }
-            ])
-            await ws.send(remote_stop_transaction_message)
-            response = await ws.recv()
-            logging.info(f"Réponse Remote Stop Transaction reçue: {response}")
-            response_data = json.loads(response)
-            if response_data[0] == 4:  # MessageTypeId (4 = CALLERROR)
-                return {"error": response_data[2]}
-            return {"status": response_data[2].get("status")}
+        response = await session.call("RemoteStopTransaction", {
+            "transactionId": request.transaction_id
+        })
+        if response.is_error:
+            return {"error": response.error_code}
+        return {"status": response.payload.get("status")}
+    except HTTP_ERRORS:
+        raise
     except Exception as e:
-        logging.error(f"Erreur lors de la connexion WebSocket pour Remote Stop Transaction: {e}")
+        logging.error("Erreur lors de la connexion WebSocket pour Remote Stop Transaction: %s", e)
         return {"error": str(e)}
     
-@router.post("/get-configuration", response_model=GetConfigurationResponse, summary="Obtenir la configuration", description="Ce endpoint envoie une demande pour obtenir la configuration de la station de charge via WebSocket.")
+@router.post("/get-configuration", response_model=GetConfigurationResponse, summary="Obtenir la configuration", description="Ce endpoint envoie une demande pour obtenir la configuration de la station de charge via WebSocket. Une fois la configuration complète lue, les clés connues sont servies depuis le cache de configuration du point de charge sans aller-retour OCPP, et relues en arrière-plan quand elles vieillissent. `refresh=true` force l'envoi.")
 async def get_configuration(
-    request: GetConfigurationRequest = Body(..., description="Requête pour obtenir la configuration contenant éventuellement une liste de clés")
+    request: GetConfigurationRequest = Body(..., description="Requête pour obtenir la configuration contenant éventuellement une liste de clés"),
+    refresh: bool = Query(False, description="Envoyer le GetConfiguration même si la configuration est en cache"),
+    session: ConnectionManager = Depends(get_session)
 ):
     """
     Envoie une demande pour obtenir la configuration de la station de charge via WebSocket.
 
     - **key**: (Optionnel) Liste des clés de configuration à obtenir
+    - **refresh**: Ignorer la configuration en cache
     """
+    cached = None if refresh else configuration_cache.lookup(session.charge_point_id, request.key)
+    if cached is not None:
+        if configuration_cache.needs_refresh(session.charge_point_id):
+            configuration_cache.refresh(session)
+        configuration_key, unknown_key = cached
+        return {"configuration_key": configuration_key, "unknown_key": unknown_key}
     try:
-        async with websockets.connect(WEBSOCKET_URL, subprotocols=["ocpp1.6"]) as ws:
-            logging.info("Connexion WebSocket établie pour Get Configuration")
-            get_configuration_message = json.dumps([
-                2,  # MessageTypeId (2 = CALL)
-                "uniqueIdGetConfiguration",  # Unique ID for the message
-                "GetConfiguration",  # Action
-                {
-                    "key": request.key
-                }
-            ])
-            await ws.send(get_configuration_message)
-            response = await ws.recv()
-            logging.info(f"Réponse Get Configuration reçue: {response}")
-            response_data = json.loads(response)
-            if response_data[0] == 4:  # MessageTypeId (4 = CALLERROR)
-                return {"error": response_data[2]}
-            return {
-                "configuration_key": response_data[2].get("configurationKey"),
-                "unknown_key": response_data[2].get("unknownKey")
-            }
+        # `key` est facultatif mais ne peut pas être null dans le schéma OCPP 1.6
+        response = await session.call("GetConfiguration", {"key": request.key} if request.key else {})
+        if response.is_error:
+            return {"error": response.error_code}
+        return {
+            "configuration_key": response.payload.get("configurationKey"),
+            "unknown_key": response.payload.get("unknownKey")
+        }
+    except HTTP_ERRORS:
+        raise
     except Exception as e:
-        logging.error(f"Erreur lors de la connexion WebSocket pour Get Configuration: {e}")
+        logging.error("Erreur lors de la connexion WebSocket pour Get Configuration: %s", e)
         return {"error": str(e)}
     
 @router.post("/change-configuration", response_model=ChangeConfigurationResponse, summary="Changer la configuration", description="Ce endpoint envoie une demande de changement de configuration au serveur via WebSocket.")
 async def change_configuration_endpoint(
-    request: ChangeConfigurationRequest = Body(..., description="Requête de changement de configuration contenant la clé et la valeur")
+    request: ChangeConfigurationRequest = Body(..., description="Requête de changement de configuration contenant la clé et la valeur"),
+    session: ConnectionManager = Depends(get_session)
 ):
     """
     Envoie une demande de changement de configuration au serveur via WebSocket.
@@ -450,12 +498,12 @@ async def change_configuration_endpoint(
     - **value**: Nouvelle valeur pour la clé de configuration
     """
     try:
-        async with websockets.connect(WEBSOCKET_URL, subprotocols=["ocpp1.6"]) as ws:
-            logging.info("Connexion WebSocket établie pour Change Configuration")
-            response = await change_configuration(ws, request.key, request.value)
-            if "error" in response:
-                return {"error": response["error"]}
-            return {"status": response.get("status")}
+        response = await change_configuration(session, request.key, request.value)
+        if "error" in response:
+            return {"error": response["error"]}
+        return {"status": response.get("status")}
+    except HTTP_ERRORS:
+        raise
     except Exception as e:
-        logging.error(f"Erreur lors de la connexion WebSocket pour Change Configuration: {e}")
+        logging.error("Erreur lors de la connexion WebSocket pour Change Configuration: %s", e)
         return {"error": str(e)}
\ No newline at end of file
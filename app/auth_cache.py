@@ -0,0 +1,166 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Request
+
+from app.cluster import forwarder, is_forwarded, other_workers
+from app.connection import observe
+from app.env import load_dotenv
+
+load_dotenv()
+
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+# Durée de vie d'une autorisation sans expiryDate, en secondes
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "3600"))
+
+router = APIRouter()
+
+
+def parse_expiry_date(expiry_date: Optional[str]) -> Optional[float]:
+    if not expiry_date:
+        return None
+    try:
+        return datetime.fromisoformat(expiry_date.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        logging.warning("expiryDate invalide ignorée: %s", expiry_date)
+        return None
+
+
+class AuthorizationCache:
+    """
+    Cache d'autorisation OCPP : `idTagInfo` par idTag.
+
+    Seules les autorisations `Accepted` sont gardées, jusqu'à leur
+    `expiryDate` ou au plus `ttl` secondes. Un résultat `Blocked`, `Invalid`,
+    `Expired` ou `ConcurrentTx` retire l'idTag du cache. Au-delà de
+    `max_entries`, les entrées les moins récemment utilisées sont évincées.
+    """
+
+    def __init__(self, max_entries: int = AUTH_CACHE_MAX_ENTRIES, ttl: float = AUTH_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.upstream_calls = 0
+        self.upstream_seconds = 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, id_tag: str) -> Optional[dict]:
+        entry = self._entries.get(id_tag)
+        if entry is not None:
+            id_tag_info, expires_at = entry
+            if expires_at > time.time():
+                self._entries.move_to_end(id_tag)
+                self.hits += 1
+                return id_tag_info
+            del self._entries[id_tag]
+        self.misses += 1
+        return None
+
+    def put(self, id_tag: str, id_tag_info: dict):
+        if id_tag_info.get("status") != "Accepted":
+            self.invalidate(id_tag)
+            return
+        expires_at = time.time() + self.ttl
+        expiry_date = parse_expiry_date(id_tag_info.get("expiryDate"))
+        if expiry_date is not None:
+            expires_at = min(expires_at, expiry_date)
+        self._entries[id_tag] = (id_tag_info, expires_at)
+        self._entries.move_to_end(id_tag)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, id_tag: str):
+        self._entries.pop(id_tag, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def record_upstream(self, seconds: float):
+        """Enregistre la durée d'un Authorize envoyé au serveur central (cache manqué)."""
+        self.upstream_calls += 1
+        self.upstream_seconds += seconds
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        average_upstream = self.upstream_seconds / self.upstream_calls if self.upstream_calls else 0.0
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "upstream_calls": self.upstream_calls,
+            "average_upstream_ms": round(average_upstream * 1000, 3),
+            # Chaque succès évite un aller-retour de durée moyenne
+            "latency_saved_ms": round(self.hits * average_upstream * 1000, 3),
+        }
+
+
+authorization_cache = AuthorizationCache()
+
+
+def merge_stats(stats: List[dict]) -> dict:
+    """Statistiques cumulées des caches de plusieurs workers (mode cluster)."""
+    if len(stats) == 1:
+        return stats[0]
+    merged = {key: sum(entry[key] for entry in stats) for key in ("entries", "max_entries", "hits", "misses", "evictions", "upstream_calls")}
+    lookups = merged["hits"] + merged["misses"]
+    merged["hit_rate"] = round(merged["hits"] / lookups, 4) if lookups else 0.0
+    upstream_ms = sum(entry["average_upstream_ms"] * entry["upstream_calls"] for entry in stats)
+    merged["average_upstream_ms"] = round(upstream_ms / merged["upstream_calls"], 3) if merged["upstream_calls"] else 0.0
+    merged["latency_saved_ms"] = round(sum(entry["latency_saved_ms"] for entry in stats), 3)
+    return merged
+
+
+@observe("Authorize")
+def cache_authorize(session, payload: dict, result: dict):
+    if "idTagInfo" in result:
+        authorization_cache.put(payload["idTag"], result["idTagInfo"])
+
+
+@observe("StartTransaction")
+def cache_start_transaction(session, payload: dict, result: dict):
+    if "idTagInfo" in result:
+        authorization_cache.put(payload["idTag"], result["idTagInfo"])
+
+
+@observe("StopTransaction")
+def cache_stop_transaction(session, payload: dict, result: dict):
+    # idTag est facultatif dans StopTransaction : sans lui, rien à mettre à jour
+    if payload.get("idTag") and "idTagInfo" in result:
+        authorization_cache.put(payload["idTag"], result["idTagInfo"])
+
+
+@router.get("/authorization-cache", summary="Statistiques du cache d'autorisation", description="Ce endpoint renvoie l'état du cache d'autorisation placé devant `/authorize` : nombre d'entrées, succès et échecs, taux de succès, évictions LRU, durée moyenne d'un Authorize envoyé au serveur central et latence totale économisée.")
+async def authorization_cache_stats(request: Request):
+    """
+    Renvoie les statistiques du cache d'autorisation.
+    """
+    stats = [authorization_cache.stats()]
+    if not is_forwarded(request.headers):
+        # En mode cluster, chaque worker a son propre cache
+        stats += await forwarder.gather(other_workers(), "GET", "/authorization-cache")
+    return merge_stats(stats)
+
+
+@router.delete("/authorization-cache", summary="Vider le cache d'autorisation", description="Ce endpoint vide le cache d'autorisation : les prochains `/authorize` seront envoyés au serveur central.")
+async def clear_authorization_cache(request: Request):
+    """
+    Vide le cache d'autorisation.
+    """
+    authorization_cache.clear()
+    stats = [authorization_cache.stats()]
+    if not is_forwarded(request.headers):
+        stats += await forwarder.gather(other_workers(), "DELETE", "/authorization-cache")
+    return merge_stats(stats)
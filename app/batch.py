@@ -0,0 +1,92 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from fastapi import APIRouter, Body
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+
+from app.env import load_dotenv
+from app.registry import registry
+
+load_dotenv()
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "50"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "500"))
+
+router = APIRouter()
+
+
+class BatchTarget(BaseModel):
+    cp_id: str = Field(..., description="Identifiant du point de charge")
+    payload: Optional[Dict[str, Any]] = Field(None, description="Payload propre à ce point de charge, fusionné avec le payload commun")
+
+class BatchRequest(BaseModel):
+    action: str = Field(..., description="Action OCPP à envoyer", example="RemoteStopTransaction")
+    payload: Dict[str, Any] = Field(default_factory=dict, description="Payload commun à toutes les cibles")
+    targets: List[BatchTarget] = Field(..., description="Points de charge ciblés")
+    concurrency: Optional[int] = Field(None, ge=1, description="Nombre maximal d'appels simultanés")
+
+
+async def fan_out(items: Iterable, worker: Callable[[Any], Awaitable[dict]], concurrency: int) -> AsyncIterator[dict]:
+    """
+    Exécute `worker` sur chaque élément avec au plus `concurrency` appels
+    simultanés, et produit les résultats dans leur ordre d'achèvement.
+
+    Les tâches restantes sont annulées si le consommateur s'arrête avant la
+    fin (client HTTP déconnecté, par exemple).
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(item):
+        async with semaphore:
+            return await worker(item)
+
+    tasks = [asyncio.create_task(run(item)) for item in items]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def send_to_target(action: str, payload: dict, target: BatchTarget) -> dict:
+    """Envoie l'action à un point de charge et retourne une ligne de résultat."""
+    started = time.perf_counter()
+    result = {"cp_id": target.cp_id}
+    try:
+        response = await registry.call(target.cp_id, action, {**payload, **(target.payload or {})})
+        if response.is_error:
+            result["error"] = response.error_code
+        else:
+            result["response"] = response.payload
+    except Exception as e:
+        logging.error("Erreur lors de l'envoi de %s à %s: %s", action, target.cp_id, e)
+        result["error"] = str(e)
+    result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    return result
+
+
+@router.post("/batch", summary="Envoyer une commande à plusieurs points de charge", description="Ce endpoint envoie la même action OCPP (par exemple `RemoteStopTransaction`, `ChangeConfiguration` ou `UnlockConnector`) à une liste de points de charge, en parallèle dans la limite de `concurrency` appels simultanés. Les résultats sont renvoyés au fil de l'eau au format NDJSON (une ligne JSON par point de charge), dans l'ordre où les réponses arrivent.")
+async def batch_command(
+    request: BatchRequest = Body(..., description="Action, payload commun et liste des points de charge ciblés")
+):
+    """
+    Envoie une action OCPP à plusieurs points de charge et diffuse les résultats.
+
+    - **action**: Action OCPP à envoyer
+    - **payload**: Payload commun à toutes les cibles
+    - **targets**: Points de charge ciblés, avec un payload propre facultatif
+    - **concurrency**: (Optionnel) Nombre maximal d'appels simultanés
+    """
+    concurrency = min(request.concurrency or BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+
+    async def lines():
+        async for result in fan_out(request.targets, lambda target: send_to_target(request.action, request.payload, target), concurrency):
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
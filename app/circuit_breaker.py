@@ -0,0 +1,111 @@
+import logging
+import os
+import random
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from app.env import load_dotenv
+
+load_dotenv()
+
+# Échecs de connexion consécutifs avant d'ouvrir le circuit
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "3"))
+# Délai de reconnexion à l'ouverture du circuit, doublé à chaque nouvel échec
+# (par défaut RECONNECT_INTERVAL, le délai utilisé tant que le circuit est fermé)
+CIRCUIT_BACKOFF_BASE = float(os.getenv("CIRCUIT_BACKOFF_BASE", os.getenv("RECONNECT_INTERVAL", "10")))
+CIRCUIT_BACKOFF_MAX = float(os.getenv("CIRCUIT_BACKOFF_MAX", "300"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(ConnectionError):
+    """Le serveur central est considéré injoignable : l'appel échoue sans tentative de connexion."""
+
+    def __init__(self, url: str, retry_after: float):
+        super().__init__(f"Serveur central injoignable ({url}), nouvelle tentative dans {retry_after:.1f} s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur de la liaison vers le serveur central.
+
+    Fermé, les connexions sont tentées normalement. Après `failure_threshold`
+    échecs consécutifs il s'ouvre : les appels échouent aussitôt pendant un
+    délai exponentiel avec gigue (`backoff_base` × 2ⁿ, plafonné à
+    `backoff_max`). Le délai écoulé, il passe à demi-ouvert et laisse passer
+    une seule tentative : un succès le referme, un échec le rouvre avec un
+    délai doublé.
+    """
+
+    __slots__ = ("name", "failure_threshold", "backoff_base", "backoff_max", "state", "failures", "opened", "retry_at", "transitions")
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, backoff_base: float = CIRCUIT_BACKOFF_BASE, backoff_max: float = CIRCUIT_BACKOFF_MAX):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.state = CLOSED
+        self.failures = 0
+        # Ouvertures consécutives, qui fixent l'exposant du délai
+        self.opened = 0
+        self.retry_at = 0.0
+        self.transitions = deque(maxlen=20)
+
+    def _transition(self, state: str, reason: str):
+        self.transitions.append({"from": self.state, "to": state, "reason": reason, "at": datetime.now(timezone.utc).isoformat()})
+        log = logging.warning if state == OPEN else logging.info
+        log("Disjoncteur %s: %s -> %s (%s)", self.name, self.state, state, reason)
+        self.state = state
+
+    def retry_in(self) -> float:
+        """Secondes avant la prochaine tentative autorisée."""
+        return max(self.retry_at - time.monotonic(), 0.0) if self.state == OPEN else 0.0
+
+    def allow(self) -> bool:
+        """Indique si une tentative de connexion peut avoir lieu maintenant."""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() >= self.retry_at:
+            self._transition(HALF_OPEN, "délai écoulé, tentative de reconnexion")
+            return True
+        # Demi-ouvert : une seule tentative à la fois
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened = 0
+        if self.state != CLOSED:
+            self._transition(CLOSED, "connexion rétablie")
+
+    def record_failure(self, error: Exception):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            delay = min(self.backoff_base * 2 ** self.opened, self.backoff_max)
+            # Gigue : les sessions d'une même flotte ne se reconnectent pas toutes au même instant
+            delay *= random.uniform(0.5, 1.0)
+            self.opened += 1
+            self.retry_at = time.monotonic() + delay
+            self._transition(OPEN, f"{self.failures} échec(s) consécutif(s): {error}")
+
+    def abort_probe(self):
+        """
+        Tentative demi-ouverte interrompue sans résultat (appel annulé, délai
+        dépassé) : le circuit redevient ouvert, une nouvelle tentative étant
+        aussitôt permise, plutôt que de rester demi-ouvert sans tentative en cours.
+        """
+        if self.state == HALF_OPEN:
+            self.retry_at = time.monotonic()
+            self._transition(OPEN, "tentative de reconnexion interrompue")
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "state": self.state,
+            "failures": self.failures,
+            "retry_in": round(self.retry_in(), 3),
+            "transitions": list(self.transitions),
+        }
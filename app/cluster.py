@@ -0,0 +1,296 @@
+"""
+Mode multi-processus : N workers se partagent le port HTTP, chacun
+propriétaire d'une partie des points de charge.
+
+Chaque point de charge est attribué à un worker par hachage cohérent de son
+identifiant : sa connexion au serveur central, son disjoncteur, ses caches
+et le rejeu de sa file hors ligne n'existent que dans ce worker. Une requête
+reçue par un autre worker lui est transmise par un socket Unix local.
+
+    python -m app.cluster --workers 4 --port 8001
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import signal
+import socket
+import tempfile
+import time
+from bisect import bisect
+from typing import Callable, List, Optional
+
+from app.env import load_dotenv
+
+load_dotenv()
+
+# Nombre de workers et rang du worker courant, fixés par le lanceur pour chaque processus
+CLUSTER_WORKERS = int(os.getenv("CLUSTER_WORKERS", "1"))
+CLUSTER_WORKER_INDEX = int(os.getenv("CLUSTER_WORKER_INDEX", "0"))
+CLUSTER_SOCKET_DIR = os.getenv("CLUSTER_SOCKET_DIR", "")
+# Points virtuels par worker sur l'anneau : plus il y en a, plus la répartition est régulière
+CLUSTER_VNODES = int(os.getenv("CLUSTER_VNODES", "160"))
+
+# En-tête posé sur une requête transmise, pour qu'elle soit traitée sur place par le worker cible
+FORWARDED_HEADER = b"x-cluster-forwarded"
+
+CHARGE_POINT_PATH = re.compile(r"^/charge-points/([^/]+)(?:/|$)")
+
+# En-têtes propres à une connexion, à ne pas recopier d'un saut à l'autre
+HOP_BY_HOP_HEADERS = {b"connection", b"keep-alive", b"transfer-encoding", b"upgrade", b"content-length", b"host"}
+
+
+class HashRing:
+    """
+    Anneau de hachage cohérent : chaque worker y occupe `vnodes` positions,
+    et un point de charge appartient au worker de la première position qui
+    suit le hachage de son identifiant. Passer de N à N+1 workers ne déplace
+    qu'environ 1/(N+1) des points de charge.
+    """
+
+    def __init__(self, workers: int, vnodes: int = CLUSTER_VNODES):
+        self.workers = workers
+        points = sorted((self._hash(f"worker-{worker}#{vnode}"), worker) for worker in range(workers) for vnode in range(vnodes))
+        self._keys = [key for key, _ in points]
+        self._owners = [worker for _, worker in points]
+        self._cache = {}
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+    def owner(self, charge_point_id: str) -> int:
+        worker = self._cache.get(charge_point_id)
+        if worker is None:
+            if self.workers <= 1:
+                return 0
+            index = bisect(self._keys, self._hash(charge_point_id)) % len(self._keys)
+            worker = self._cache[charge_point_id] = self._owners[index]
+        return worker
+
+
+ring = HashRing(CLUSTER_WORKERS)
+
+
+def owns(charge_point_id: Optional[str]) -> bool:
+    """Indique si le worker courant est propriétaire du point de charge (toujours vrai hors mode cluster)."""
+    return CLUSTER_WORKERS <= 1 or charge_point_id is None or ring.owner(charge_point_id) == CLUSTER_WORKER_INDEX
+
+
+def other_workers(charge_point_id: Optional[str] = None) -> List[int]:
+    """
+    Workers à interroger en plus du worker courant pour une route globale :
+    tous, ou seulement le propriétaire de `charge_point_id` s'il est précisé.
+    """
+    if CLUSTER_WORKERS <= 1:
+        return []
+    if charge_point_id is not None:
+        worker = ring.owner(charge_point_id)
+        return [] if worker == CLUSTER_WORKER_INDEX else [worker]
+    return [worker for worker in range(CLUSTER_WORKERS) if worker != CLUSTER_WORKER_INDEX]
+
+
+def is_forwarded(headers) -> bool:
+    """Indique si la requête a été transmise par un autre worker (à traiter sur place, sans nouvelle transmission)."""
+    return FORWARDED_HEADER.decode() in headers
+
+
+def socket_path(socket_dir: str, worker: int) -> str:
+    return os.path.join(socket_dir, f"worker-{worker}.sock")
+
+
+class Forwarder:
+    """Transmet une requête ASGI à un autre worker par son socket Unix."""
+
+    def __init__(self, socket_dir: str = CLUSTER_SOCKET_DIR):
+        self.socket_dir = socket_dir
+        self._clients = {}
+        self._loop = None
+
+    def client(self, worker: int):
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Clients liés à la boucle qui les a créés
+            self._loop = loop
+            self._clients = {}
+        client = self._clients.get(worker)
+        if client is None:
+            transport = httpx.AsyncHTTPTransport(uds=socket_path(self.socket_dir, worker))
+            client = self._clients[worker] = httpx.AsyncClient(transport=transport, base_url="http://worker", timeout=None)
+        return client
+
+    async def __call__(self, worker: int, scope, receive, send):
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        headers = [(name, value) for name, value in scope["headers"] if name not in HOP_BY_HOP_HEADERS]
+        headers.append((FORWARDED_HEADER, str(CLUSTER_WORKER_INDEX).encode()))
+        path = scope.get("raw_path") or scope["path"].encode()
+        if scope.get("query_string"):
+            path += b"?" + scope["query_string"]
+        client = self.client(worker)
+        request = client.build_request(scope["method"], path.decode("latin-1"), headers=headers, content=body)
+        try:
+            response = await client.send(request, stream=True)
+        except OSError as e:
+            logging.error("Worker %s injoignable: %s", worker, e)
+            await send({"type": "http.response.start", "status": 502, "headers": [(b"content-type", b"application/json")]})
+            await send({"type": "http.response.body", "body": json.dumps({"error": f"Worker {worker} injoignable: {e}"}).encode()})
+            return
+        try:
+            await send({
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": [(name.lower(), value) for name, value in response.headers.raw if name.lower() not in HOP_BY_HOP_HEADERS],
+            })
+            async for chunk in response.aiter_raw():
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            await response.aclose()
+
+    async def request(self, worker: int, method: str, path: str, **kwargs):
+        """Envoie une requête à un autre worker, qui la traite sur place."""
+        headers = {**kwargs.pop("headers", {}), FORWARDED_HEADER.decode(): str(CLUSTER_WORKER_INDEX)}
+        return await self.client(worker).request(method, path, headers=headers, **kwargs)
+
+    def stream(self, worker: int, method: str, path: str, **kwargs):
+        """Comme `request`, pour une réponse lue au fil de l'eau (`async with`)."""
+        headers = {**kwargs.pop("headers", {}), FORWARDED_HEADER.decode(): str(CLUSTER_WORKER_INDEX)}
+        return self.client(worker).stream(method, path, headers=headers, **kwargs)
+
+    async def gather(self, workers: List[int], method: str, path: str, **kwargs) -> list:
+        """Réponses JSON de plusieurs workers ; un worker injoignable est ignoré."""
+        responses = await asyncio.gather(*(self.request(worker, method, path, **kwargs) for worker in workers), return_exceptions=True)
+        results = []
+        for worker, response in zip(workers, responses):
+            if isinstance(response, Exception):
+                logging.error("Worker %s injoignable: %s", worker, response)
+                continue
+            results.append(response.json())
+        return results
+
+    async def close(self):
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients = {}
+
+
+forwarder = Forwarder()
+
+
+class ClusterMiddleware:
+    """
+    Middleware ASGI : les requêtes qui visent un point de charge dont le
+    worker courant n'est pas propriétaire sont transmises au bon worker.
+
+    Le point de charge est celui du préfixe `/charge-points/{cp_id}`, ou
+    `default_charge_point` pour les routes historiques (`default_paths`).
+    Les autres routes (métriques, journal, ...) sont servies par le worker
+    qui reçoit la requête ; celles qui couvrent toute la flotte (`/batch`,
+    `/rollouts`, `/events`, `/statuses`, ...) interrogent elles-mêmes les
+    autres workers (`registry.call`, `Forwarder.gather`).
+    """
+
+    def __init__(self, app, default_charge_point: Optional[str] = None, default_paths=(), ring: HashRing = ring,
+                 index: int = CLUSTER_WORKER_INDEX, forward: Optional[Callable] = None):
+        self.app = app
+        self.default_charge_point = default_charge_point
+        self.default_paths = set(default_paths)
+        self.ring = ring
+        self.index = index
+        self.forward = forward or forwarder
+
+    def charge_point_id(self, scope) -> Optional[str]:
+        match = CHARGE_POINT_PATH.match(scope["path"])
+        if match:
+            return match.group(1)
+        if scope["path"] in self.default_paths:
+            return self.default_charge_point
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not any(name == FORWARDED_HEADER for name, _ in scope["headers"]):
+            charge_point_id = self.charge_point_id(scope)
+            if charge_point_id is not None:
+                worker = self.ring.owner(charge_point_id)
+                if worker != self.index:
+                    await self.forward(worker, scope, receive, send)
+                    return
+        await self.app(scope, receive, send)
+
+
+def run_worker(index: int, workers: int, socket_dir: str, sock: socket.socket, host: str, port: int, log_level: str):
+    """Point d'entrée d'un processus worker : sert le port partagé et son socket Unix."""
+    os.environ.update(CLUSTER_WORKERS=str(workers), CLUSTER_WORKER_INDEX=str(index), CLUSTER_SOCKET_DIR=socket_dir)
+    import uvicorn
+
+    # Une ligne de log par requête transmise coûterait plus cher que la transmission
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    path = socket_path(socket_dir, index)
+    if os.path.exists(path):
+        os.unlink(path)
+    unix_sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    unix_sock.bind(path)
+    server = uvicorn.Server(uvicorn.Config("app.main:app", host=host, port=port, log_level=log_level))
+    server.run(sockets=[sock, unix_sock])
+
+
+def main():
+    import multiprocessing
+
+    parser = argparse.ArgumentParser(description="Lance l'API OCPP sur plusieurs workers")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Nombre de processus workers")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8001")))
+    parser.add_argument("--socket-dir", default=CLUSTER_SOCKET_DIR or None, help="Répertoire des sockets Unix entre workers")
+    parser.add_argument("--log-level", default="warning", help="Niveau de log d'uvicorn")
+    args = parser.parse_args()
+
+    socket_dir = args.socket_dir or tempfile.mkdtemp(prefix="ocpp-cluster-")
+    sock = socket.socket(socket.AF_INET6 if ":" in args.host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.set_inheritable(True)
+
+    context = multiprocessing.get_context("spawn")
+    stopping = False
+
+    def spawn(index):
+        process = context.Process(target=run_worker, args=(index, args.workers, socket_dir, sock, args.host, args.port, args.log_level), name=f"worker-{index}")
+        process.start()
+        return process
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    processes = [spawn(index) for index in range(args.workers)]
+    logging.warning("%s worker(s) sur %s:%s, sockets dans %s", args.workers, args.host, args.port, socket_dir)
+    while not stopping:
+        time.sleep(0.5)
+        for index, process in enumerate(processes):
+            if not process.is_alive() and not stopping:
+                # Un worker mort est relancé au même rang : ses points de charge ne changent pas de propriétaire
+                logging.error("Worker %s arrêté (code %s), relance", index, process.exitcode)
+                processes[index] = spawn(index)
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join()
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import json
+import os
+from typing import Optional
+
+from app.env import load_dotenv
+
+load_dotenv()
+
+# Backend JSON des trames OCPP-J : orjson ou msgspec quand ils sont installés,
+# sinon le module json de la bibliothèque standard ("auto"), ou un backend imposé
+OCPP_JSON_BACKEND = os.getenv("OCPP_JSON_BACKEND", "auto")
+
+# MessageTypeId OCPP-J
+CALL = 2
+CALLRESULT = 3
+CALLERROR = 4
+
+
+def _json_backend():
+    return "json", lambda obj: json.dumps(obj, separators=(",", ":")), json.loads
+
+
+def _orjson_backend():
+    import orjson
+    return "orjson", orjson.dumps, orjson.loads
+
+
+def _msgspec_backend():
+    import msgspec
+    return "msgspec", msgspec.json.encode, msgspec.json.decode
+
+
+BACKENDS = {
+    "orjson": _orjson_backend,
+    "msgspec": _msgspec_backend,
+    "json": _json_backend,
+}
+
+
+def load_backend(name: str = "auto"):
+    """
+    Retourne `(nom, dumps, loads)` pour le backend demandé.
+
+    `dumps` retourne `str` ou `bytes` selon le backend ; `loads` accepte les deux.
+    """
+    if name != "auto":
+        return BACKENDS[name]()
+    for candidate in BACKENDS.values():
+        try:
+            return candidate()
+        except ImportError:
+            continue
+
+
+BACKEND, dumps, loads = load_backend(OCPP_JSON_BACKEND)
+
+
+class FrameError(ValueError):
+    """Trame OCPP-J mal formée."""
+
+
+class Frame:
+    """
+    Trame OCPP-J décodée : CALL, CALLRESULT ou CALLERROR.
+
+    Chaque trame reçue est décodée une seule fois ; ses champs sont ensuite
+    lus directement au lieu d'indexer à nouveau la liste JSON.
+    """
+
+    __slots__ = ("message_type", "unique_id", "action", "payload", "error_code", "error_description", "error_details")
+
+    def __init__(self, message_type: int, unique_id: str, action: Optional[str] = None, payload: Optional[dict] = None,
+                 error_code: Optional[str] = None, error_description: str = "", error_details: Optional[dict] = None):
+        self.message_type = message_type
+        self.unique_id = unique_id
+        self.action = action
+        self.payload = payload
+        self.error_code = error_code
+        self.error_description = error_description
+        self.error_details = error_details
+
+    @classmethod
+    def call(cls, unique_id: str, action: str, payload: dict) -> "Frame":
+        return cls(CALL, unique_id, action, payload)
+
+    @classmethod
+    def result(cls, unique_id: str, payload: dict) -> "Frame":
+        return cls(CALLRESULT, unique_id, payload=payload)
+
+    @classmethod
+    def error(cls, unique_id: str, error_code: str, error_description: str = "", error_details: Optional[dict] = None) -> "Frame":
+        return cls(CALLERROR, unique_id, error_code=error_code, error_description=error_description, error_details=error_details or {})
+
+    @property
+    def is_error(self) -> bool:
+        return self.message_type == CALLERROR
+
+    @classmethod
+    def from_list(cls, message) -> "Frame":
+        try:
+            message_type = message[0]
+            if message_type == CALL:
+                _, unique_id, action, payload = message
+                return cls(CALL, unique_id, action, payload)
+            if message_type == CALLRESULT:
+                _, unique_id, payload = message
+                return cls(CALLRESULT, unique_id, payload=payload)
+            if message_type == CALLERROR:
+                _, unique_id, error_code, error_description, error_details = message
+                return cls(CALLERROR, unique_id, error_code=error_code, error_description=error_description, error_details=error_details)
+        except (TypeError, ValueError, IndexError, KeyError) as e:
+            raise FrameError(f"Trame OCPP-J invalide: {message!r}") from e
+        raise FrameError(f"MessageTypeId inconnu: {message!r}")
+
+    @classmethod
+    def decode(cls, raw) -> "Frame":
+        """Décode une trame reçue (texte ou octets)."""
+        try:
+            message = loads(raw)
+        except ValueError as e:
+            raise FrameError(f"JSON invalide: {e}") from e
+        return cls.from_list(message)
+
+    def to_list(self) -> list:
+        if self.message_type == CALL:
+            return [CALL, self.unique_id, self.action, self.payload]
+        if self.message_type == CALLRESULT:
+            return [CALLRESULT, self.unique_id, self.payload]
+        return [CALLERROR, self.unique_id, self.error_code, self.error_description, self.error_details]
+
+    def encode(self):
+        """Encode la trame pour l'envoi (texte ou octets selon le backend)."""
+        return dumps(self.to_list())
+
+    def __repr__(self):
+        return f"Frame({self.to_list()!r})"
+
+
+async def send_frame(ws, frame: Frame):
+    """Envoie une trame en message texte, comme l'exige OCPP-J, quel que soit le backend."""
+    data = frame.encode()
+    if isinstance(data, bytes):
+        await ws.send(data, text=True)
+    else:
+        await ws.send(data)
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import os
+import time
+from typing import List, Optional, Tuple
+
+from app.connection import ConnectionManager, observe
+from app.env import load_dotenv
+
+load_dotenv()
+
+# Âge au-delà duquel une configuration complète servie depuis le cache est relue en
+# arrière-plan, et au-delà duquel une clé lue seule n'est plus servie depuis le cache
+CONFIG_CACHE_MAX_AGE = float(os.getenv("CONFIG_CACHE_MAX_AGE", "300"))
+
+
+class ChargePointConfiguration:
+    """Clés de configuration connues d'un point de charge."""
+
+    __slots__ = ("keys", "fetched", "stale", "complete", "fetched_at")
+
+    def __init__(self):
+        self.keys = {}
+        # Clé -> date (monotone) de la dernière valeur connue
+        self.fetched = {}
+        self.stale = set()
+        self.complete = False
+        self.fetched_at = 0.0
+
+
+class ConfigurationCache:
+    """
+    Cache de configuration par point de charge.
+
+    Il est rempli par les réponses GetConfiguration ; une réponse sans filtre
+    de clés rend la liste complète, ce qui permet aussi de répondre aux clés
+    inconnues sans aller-retour. Un ChangeConfiguration `Accepted` met la
+    valeur à jour (write-through) ; `RebootRequired` marque la clé comme
+    périmée jusqu'à la prochaine lecture auprès du point de charge.
+
+    Une configuration complète plus ancienne que `max_age` reste servie et
+    est relue en arrière-plan ; une clé connue par une lecture filtrée
+    n'est plus servie au-delà de `max_age`, elle est relue à la demande.
+    """
+
+    def __init__(self, max_age: float = CONFIG_CACHE_MAX_AGE):
+        self.max_age = max_age
+        self._by_charge_point = {}
+        self._refreshing = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._by_charge_point)
+
+    def charge_point_ids(self) -> List[str]:
+        return list(self._by_charge_point)
+
+    def get(self, charge_point_id: str) -> Optional[ChargePointConfiguration]:
+        return self._by_charge_point.get(charge_point_id)
+
+    def store(self, charge_point_id: str, configuration_keys: List[dict], complete: bool):
+        entry = self._by_charge_point.get(charge_point_id)
+        if entry is None or complete:
+            entry = self._by_charge_point[charge_point_id] = ChargePointConfiguration()
+        now = time.monotonic()
+        for configuration_key in configuration_keys:
+            entry.keys[configuration_key["key"]] = configuration_key
+            entry.fetched[configuration_key["key"]] = now
+            entry.stale.discard(configuration_key["key"])
+        if complete:
+            entry.complete = True
+            entry.fetched_at = now
+
+    def write(self, charge_point_id: str, key: str, value: str, stale: bool = False):
+        entry = self._by_charge_point.get(charge_point_id)
+        if entry is None:
+            return
+        known = entry.keys.get(key, {"key": key, "readonly": False})
+        entry.keys[key] = {**known, "value": value}
+        entry.fetched[key] = time.monotonic()
+        if stale:
+            entry.stale.add(key)
+        else:
+            entry.stale.discard(key)
+
+    def lookup(self, charge_point_id: str, keys: Optional[List[str]] = None) -> Optional[Tuple[List[dict], List[str]]]:
+        """
+        Retourne `(configurationKey, unknownKey)` si la demande peut être
+        servie depuis le cache, sinon None.
+        """
+        entry = self._by_charge_point.get(charge_point_id)
+        result = self._lookup(entry, keys) if entry is not None else None
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def _lookup(self, entry: ChargePointConfiguration, keys: Optional[List[str]]):
+        if not keys:
+            if not entry.complete or entry.stale:
+                return None
+            return list(entry.keys.values()), []
+        if any(key in entry.stale or self._expired(entry, key) for key in keys):
+            return None
+        return [entry.keys[key] for key in keys if key in entry.keys], [key for key in keys if key not in entry.keys]
+
+    def _expired(self, entry: ChargePointConfiguration, key: str) -> bool:
+        # Sans lecture complète, une clé absente est inconnue du cache et non du point de charge
+        if entry.complete:
+            return False
+        return key not in entry.keys or time.monotonic() - entry.fetched.get(key, 0.0) > self.max_age
+
+    def needs_refresh(self, charge_point_id: str) -> bool:
+        """Indique si la configuration complète servie depuis le cache doit être relue en arrière-plan."""
+        entry = self._by_charge_point.get(charge_point_id)
+        return (
+            entry is not None and entry.complete
+            and time.monotonic() - entry.fetched_at > self.max_age
+            and charge_point_id not in self._refreshing
+        )
+
+    def refresh(self, session: ConnectionManager):
+        """Relit toute la configuration du point de charge en arrière-plan."""
+        charge_point_id = session.charge_point_id
+        if charge_point_id in self._refreshing:
+            return
+        task = asyncio.create_task(self._refresh(session))
+        self._refreshing[charge_point_id] = task
+        task.add_done_callback(lambda _: self._refreshing.pop(charge_point_id, None))
+
+    async def _refresh(self, session: ConnectionManager):
+        try:
+            # La réponse est enregistrée par l'observateur GetConfiguration
+            await session.call("GetConfiguration", {})
+        except Exception as e:
+            logging.warning("Rafraîchissement de la configuration de %s impossible: %s", session.charge_point_id, e)
+
+    def invalidate(self, charge_point_id: str):
+        self._by_charge_point.pop(charge_point_id, None)
+
+    def clear(self):
+        self._by_charge_point.clear()
+
+
+configuration_cache = ConfigurationCache()
+
+
+@observe("GetConfiguration")
+def record_configuration(session, payload: dict, result: dict):
+    configuration_cache.store(session.charge_point_id, result.get("configurationKey") or [], complete=not payload.get("key"))
+
+
+@observe("ChangeConfiguration")
+def record_configuration_change(session, payload: dict, result: dict):
+    status = result.get("status")
+    if status == "Accepted":
+        configuration_cache.write(session.charge_point_id, payload["key"], payload["value"])
+    elif status == "RebootRequired":
+        configuration_cache.write(session.charge_point_id, payload["key"], payload["value"], stale=True)
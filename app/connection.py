@@ -0,0 +1,320 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Optional
+
+import websockets
+from websockets.protocol import State
+
+from app.circuit_breaker import CircuitBreaker, CircuitOpenError, OPEN
+from app.codec import CALL, CALLRESULT, Frame, FrameError, send_frame
+from app.deadlines import CallTimeoutError, call_budget
+from app.env import load_dotenv
+from app.logs import payload_log_policy
+from app.metrics import ocpp_call_duration, ocpp_call_errors, ocpp_call_timeouts
+from app.scheduler import CallScheduler, schedule
+from app.validation import PayloadValidationError, schema_validation
+
+load_dotenv()
+
+WEBSOCKET_URL = os.getenv("WEBSOCKET_URL_LOCALHOST")
+CHARGE_POINT_ID = os.getenv("CHARGE_POINT_ID")
+PING_INTERVAL = float(os.getenv("PING_INTERVAL", "5"))
+RECONNECT_INTERVAL = float(os.getenv("RECONNECT_INTERVAL", "10"))
+OCPP_SUBPROTOCOL = "ocpp1.6"
+
+# Gestionnaires des CALL non sollicités envoyés par le serveur central, par action
+call_handlers = {}
+
+# Observateurs des appels aboutis (CALLRESULT reçu), par action
+call_observers = {}
+
+# Observateurs de tous les CALL entrants, quelle que soit l'action
+inbound_call_observers = []
+
+
+def on_call(action: str):
+    """
+    Enregistre un gestionnaire pour les CALL entrants d'une action donnée.
+
+    Le gestionnaire reçoit la connexion et le payload, et retourne le payload
+    du CALLRESULT à renvoyer.
+    """
+    def decorator(handler):
+        call_handlers[action] = handler
+        return handler
+    return decorator
+
+
+def observe(action: str):
+    """
+    Enregistre un observateur appelé après chaque CALLRESULT reçu pour une action.
+
+    L'observateur reçoit la connexion, le payload envoyé et le payload de la
+    réponse. Il est appelé dans la boucle d'événements : il doit être rapide
+    et ne rien attendre.
+    """
+    def decorator(observer):
+        call_observers.setdefault(action, []).append(observer)
+        return observer
+    return decorator
+
+
+def observe_inbound(observer):
+    """Enregistre un observateur appelé pour chaque CALL reçu du serveur central."""
+    inbound_call_observers.append(observer)
+    return observer
+
+
+class ConnectionManager:
+    """
+    Connexion WebSocket OCPP persistante, partagée par toutes les routes.
+
+    La connexion est ouverte à la première utilisation (ou au démarrage de
+    l'application), surveillée par une tâche de fond qui la rétablit si elle
+    tombe, puis réutilisée par chaque requête HTTP au lieu d'un nouveau
+    handshake TCP + WebSocket par appel.
+
+    Chaque CALL reçoit un identifiant unique et une future en attente ; une
+    tâche de lecture unique route chaque CALLRESULT/CALLERROR vers son
+    appelant, ce qui permet plusieurs appels simultanés sur la même connexion.
+    """
+
+    # Une instance par point de charge : __slots__ garde l'empreinte mémoire
+    # faible pour en maintenir des milliers dans un même processus.
+    __slots__ = (
+        "url", "charge_point_id", "ping_interval", "reconnect_interval", "connect_count", "breaker", "scheduler", "last_used",
+        "_ws", "_loop", "_connect_lock", "_supervisor", "_reader", "_pending", "_inbound",
+    )
+
+    def __init__(self, url: str, charge_point_id: str = CHARGE_POINT_ID, ping_interval: float = PING_INTERVAL, reconnect_interval: float = RECONNECT_INTERVAL):
+        self.url = url
+        self.charge_point_id = charge_point_id
+        self.ping_interval = ping_interval
+        self.reconnect_interval = reconnect_interval
+        self.connect_count = 0
+        self.breaker = CircuitBreaker(charge_point_id or url)
+        self.scheduler = CallScheduler(charge_point_id or url)
+        self.last_used = time.monotonic()
+        self._ws = None
+        self._loop = None
+        self._connect_lock = None
+        self._supervisor = None
+        self._reader = None
+        self._pending = {}
+        self._inbound = set()
+
+    @property
+    def connected(self) -> bool:
+        return self._ws is not None and self._ws.state is State.OPEN
+
+    @property
+    def connect_failures(self) -> int:
+        """Échecs de connexion consécutifs : non nul tant que le serveur central est injoignable."""
+        return self.breaker.failures
+
+    @property
+    def pending_calls(self) -> int:
+        return len(self._pending)
+
+    def _bind_loop(self):
+        # Les primitives asyncio sont liées à une boucle : si l'application
+        # tourne sur une nouvelle boucle (tests, rechargement), on repart de zéro.
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._ws = None
+            self._connect_lock = asyncio.Lock()
+            self._supervisor = None
+            self._reader = None
+            self._pending = {}
+            self._inbound = set()
+
+    async def connect(self):
+        """Ouvre la connexion si elle n'est pas déjà ouverte et la retourne."""
+        self._bind_loop()
+        async with self._connect_lock:
+            if self.connected:
+                return self._ws
+            if not self.breaker.allow():
+                raise CircuitOpenError(self.url, self.breaker.retry_in())
+            try:
+                ws = await websockets.connect(
+                    self.url,
+                    subprotocols=[OCPP_SUBPROTOCOL],
+                    ping_interval=self.ping_interval,
+                    ping_timeout=self.ping_interval,
+                    # Les trames OCPP sont petites : la compression coûte bien plus
+                    # de mémoire par connexion qu'elle ne fait gagner de bande passante.
+                    compression=None,
+                )
+            except Exception as e:
+                self.breaker.record_failure(e)
+                raise
+            except BaseException:
+                # Annulation (délai du CALL, échéance HTTP, client déconnecté) : ni succès ni échec
+                self.breaker.abort_probe()
+                raise
+            self.breaker.record_success()
+            self._ws = ws
+            self._reader = asyncio.create_task(self._read(ws))
+            self.connect_count += 1
+            logging.info("Connexion WebSocket établie vers %s (connexion n°%s)", self.url, self.connect_count)
+            return ws
+
+    async def call(self, action: str, payload: dict, timeout: Optional[float] = None) -> Frame:
+        """
+        Envoie un CALL et attend la trame CALLRESULT ou CALLERROR correspondante.
+
+        Retourne la trame de réponse décodée (`frame.payload` pour un
+        CALLRESULT, `frame.error_code` et `frame.error_description` pour un
+        CALLERROR). Le CALL attend d'abord son tour dans l'ordonnanceur du
+        point de charge (limite de débit, priorité de l'action). Sans réponse
+        dans le délai de l'action (ou `timeout`), attente comprise et borné
+        par l'échéance de la requête HTTP, l'appel est abandonné, son entrée
+        en attente libérée, et CallTimeoutError levée.
+        """
+        self.last_used = time.monotonic()
+        budget = call_budget(action, timeout)
+        if budget <= 0:
+            raise CallTimeoutError(action, 0)
+        try:
+            return await asyncio.wait_for(self._call(action, payload), budget)
+        except asyncio.TimeoutError:
+            ocpp_call_timeouts.inc(action)
+            payload_log_policy.log_call(self.charge_point_id, action, payload, error=True)
+            raise CallTimeoutError(action, budget) from None
+
+    async def _call(self, action: str, payload: dict) -> Frame:
+        validate = schema_validation.should_validate(action)
+        if validate:
+            schema_validation.validate(action, "request", payload)
+        await schedule(self.scheduler, action)
+        started = time.perf_counter()
+        ws = await self.connect()
+        connected = time.perf_counter()
+        ocpp_call_duration.observe(connected - started, action, "connect")
+        unique_id = str(uuid.uuid4())
+        future = self._loop.create_future()
+        self._pending[unique_id] = future
+        try:
+            await send_frame(ws, Frame.call(unique_id, action, payload))
+            sent = time.perf_counter()
+            ocpp_call_duration.observe(sent - connected, action, "send")
+            response = await future
+            ocpp_call_duration.observe(time.perf_counter() - sent, action, "recv")
+        finally:
+            self._pending.pop(unique_id, None)
+        payload_log_policy.log_call(self.charge_point_id, action, payload, response, error=response.is_error)
+        if response.is_error:
+            ocpp_call_errors.inc(action, response.error_code)
+        elif response.message_type == CALLRESULT:
+            if validate:
+                schema_validation.validate(action, "response", response.payload)
+            for observer in call_observers.get(action, ()):
+                try:
+                    observer(self, payload, response.payload)
+                except Exception as e:
+                    logging.error("Erreur dans l'observateur de %s: %s", action, e)
+        return response
+
+    async def _read(self, ws):
+        try:
+            async for raw in ws:
+                try:
+                    frame = Frame.decode(raw)
+                except FrameError as e:
+                    logging.warning("Trame OCPP ignorée: %s", e)
+                    continue
+                if frame.message_type == CALL:
+                    task = asyncio.create_task(self._handle_call(ws, frame))
+                    self._inbound.add(task)
+                    task.add_done_callback(self._inbound.discard)
+                else:
+                    future = self._pending.get(frame.unique_id)
+                    if future is None or future.done():
+                        logging.warning("Réponse sans appel correspondant ignorée: %s", frame.unique_id)
+                    else:
+                        future.set_result(frame)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            if self._ws is ws:
+                self._ws = None
+            error = ConnectionError(f"Connexion WebSocket fermée vers {self.url}")
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(error)
+
+    async def _handle_call(self, ws, frame: Frame):
+        unique_id, action, payload = frame.unique_id, frame.action, frame.payload
+        for observer in inbound_call_observers:
+            try:
+                observer(self, action, payload)
+            except Exception as e:
+                logging.error("Erreur dans l'observateur des CALL entrants: %s", e)
+        handler = call_handlers.get(action)
+        try:
+            if schema_validation.should_validate(action):
+                schema_validation.validate(action, "request", payload)
+        except PayloadValidationError as e:
+            response = Frame.error(unique_id, "FormationViolation", str(e))
+        else:
+            if handler is None:
+                response = Frame.error(unique_id, "NotImplemented", f"Action {action} non supportée")
+            else:
+                try:
+                    response = Frame.result(unique_id, await handler(self, payload))
+                except Exception as e:
+                    logging.error("Erreur lors du traitement du CALL %s: %s", action, e)
+                    response = Frame.error(unique_id, "InternalError", str(e))
+        try:
+            await send_frame(ws, response)
+        except websockets.ConnectionClosed:
+            logging.warning("Impossible de répondre au CALL %s: connexion fermée", action)
+
+    async def start(self):
+        """Démarre la surveillance de la connexion (appelé au démarrage de l'application)."""
+        self._bind_loop()
+        if self._supervisor is None or self._supervisor.done():
+            self._supervisor = asyncio.create_task(self._supervise())
+
+    async def close(self):
+        """Arrête la surveillance et ferme la connexion (appelé à l'arrêt de l'application)."""
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+            try:
+                await self._supervisor
+            except asyncio.CancelledError:
+                pass
+            self._supervisor = None
+        if self._ws is not None:
+            await self._ws.close()
+            self._ws = None
+        if self._reader is not None:
+            await self._reader
+            self._reader = None
+
+    async def _supervise(self):
+        # Les pings WebSocket (ping_interval) détectent une connexion morte ;
+        # cette boucle se charge de la rétablir sans attendre la prochaine requête.
+        while True:
+            if not self.connected:
+                try:
+                    await self.connect()
+                except CircuitOpenError:
+                    pass
+                except (OSError, asyncio.TimeoutError, websockets.WebSocketException) as e:
+                    logging.warning("Reconnexion WebSocket impossible vers %s: %s", self.url, e)
+            if self.connected:
+                await asyncio.sleep(self.ping_interval)
+            elif self.breaker.state == OPEN:
+                # Reconnexion au terme du délai exponentiel avec gigue du disjoncteur
+                await asyncio.sleep(self.breaker.retry_in())
+            else:
+                await asyncio.sleep(self.reconnect_interval)
+
+
+connection_manager = ConnectionManager(WEBSOCKET_URL, CHARGE_POINT_ID)
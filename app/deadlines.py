@@ -0,0 +1,94 @@
+import asyncio
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi.responses import JSONResponse
+
+from app.env import load_dotenv
+
+load_dotenv()
+
+# Délai de réponse par défaut d'un CALL, en secondes
+CALL_TIMEOUT = float(os.getenv("CALL_TIMEOUT", "30"))
+
+# Délais propres à certaines actions ; CALL_TIMEOUTS les complète ou les
+# remplace, au format "Heartbeat=5,GetDiagnostics=120"
+DEFAULT_CALL_TIMEOUTS = {
+    "Heartbeat": 5,
+    "StatusNotification": 10,
+    "Authorize": 10,
+    "GetDiagnostics": 120,
+    "UpdateFirmware": 120,
+}
+
+DEADLINE_HEADER = "X-Deadline-Ms"
+
+
+def parse_call_timeouts(value: str) -> dict:
+    timeouts = dict(DEFAULT_CALL_TIMEOUTS)
+    for item in filter(None, value.split(",")):
+        action, _, seconds = item.partition("=")
+        timeouts[action.strip()] = float(seconds)
+    return timeouts
+
+
+CALL_TIMEOUTS = parse_call_timeouts(os.getenv("CALL_TIMEOUTS", ""))
+
+# Échéance (horloge time.monotonic) de la requête HTTP en cours, fixée par l'en-tête X-Deadline-Ms
+call_deadline: ContextVar[Optional[float]] = ContextVar("call_deadline", default=None)
+
+
+class CallTimeoutError(asyncio.TimeoutError):
+    """Le CALL n'a pas reçu de réponse dans son délai : il est abandonné."""
+
+    def __init__(self, action: str, timeout: float):
+        super().__init__(f"Pas de réponse à {action} dans le délai de {timeout:.3f} s")
+        self.action = action
+        self.timeout = timeout
+
+
+def call_budget(action: str, timeout: Optional[float] = None) -> float:
+    """
+    Délai accordé à un CALL : celui de l'action (ou `timeout`), réduit au
+    temps restant avant l'échéance de la requête HTTP s'il y en a une.
+    """
+    budget = timeout if timeout is not None else CALL_TIMEOUTS.get(action, CALL_TIMEOUT)
+    deadline = call_deadline.get()
+    if deadline is not None:
+        budget = min(budget, deadline - time.monotonic())
+    return budget
+
+
+class DeadlineMiddleware:
+    """
+    Middleware ASGI : l'en-tête `X-Deadline-Ms` fixe le temps (en
+    millisecondes) que le client accepte d'attendre. Les CALL OCPP de la
+    requête sont abandonnés à cette échéance.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        value = next((value for name, value in scope["headers"] if name == b"x-deadline-ms"), None)
+        if value is None:
+            await self.app(scope, receive, send)
+            return
+        try:
+            budget = float(value) / 1000
+            if not budget > 0:
+                raise ValueError
+        except ValueError:
+            response = JSONResponse(status_code=400, content={"error": f"En-tête {DEADLINE_HEADER} invalide: {value.decode(errors='replace')}"})
+            await response(scope, receive, send)
+            return
+        token = call_deadline.set(time.monotonic() + budget)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            call_deadline.reset(token)
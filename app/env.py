@@ -0,0 +1,13 @@
+from functools import lru_cache
+
+import dotenv
+
+
+@lru_cache(maxsize=None)
+def load_dotenv() -> bool:
+    """
+    Charge le fichier .env dans l'environnement, une seule fois par
+    processus : chaque module l'appelle avant de lire sa configuration, et
+    relire le fichier à chaque import ralentissait le démarrage.
+    """
+    return dotenv.load_dotenv()
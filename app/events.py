@@ -0,0 +1,231 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional, Set
+
+from fastapi import APIRouter, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+
+from app.cluster import forwarder, is_forwarded, other_workers
+from app.connection import observe, observe_inbound
+from app.env import load_dotenv
+from app.journal import transaction_journal
+
+load_dotenv()
+
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "100"))
+SSE_KEEPALIVE_INTERVAL = float(os.getenv("SSE_KEEPALIVE_INTERVAL", "15"))
+
+# Types d'événements dont seule la dernière valeur compte : un abonné en
+# retard reçoit l'état le plus récent plutôt que toutes les étapes.
+COALESCED_TYPES = {"status", "meter"}
+
+router = APIRouter()
+
+
+class Subscription:
+    """
+    File bornée d'un abonné au bus d'événements.
+
+    Un événement `status` ou `meter` remplace celui du même connecteur encore
+    en attente ; quand la file est pleine, l'événement le plus ancien est
+    abandonné et compté dans `dropped`. L'éditeur n'attend jamais l'abonné.
+    """
+
+    __slots__ = ("charge_point_id", "connector_id", "types", "maxsize", "dropped", "_pending", "_ready", "_sequence")
+
+    def __init__(self, charge_point_id: Optional[str] = None, connector_id: Optional[int] = None, types: Optional[Set[str]] = None, maxsize: int = EVENT_QUEUE_SIZE):
+        self.charge_point_id = charge_point_id
+        self.connector_id = connector_id
+        self.types = types
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._pending = OrderedDict()
+        self._ready = asyncio.Event()
+        self._sequence = itertools.count()
+
+    def matches(self, event: dict) -> bool:
+        return (
+            (self.charge_point_id is None or event["chargePointId"] == self.charge_point_id)
+            and (self.connector_id is None or event.get("connectorId") == self.connector_id)
+            and (self.types is None or event["type"] in self.types)
+        )
+
+    def push(self, event: dict):
+        if event["type"] in COALESCED_TYPES:
+            key = (event["type"], event["chargePointId"], event.get("connectorId"))
+            if key in self._pending:
+                self._pending[key] = event
+                return
+        else:
+            key = next(self._sequence)
+        if len(self._pending) >= self.maxsize:
+            self._pending.popitem(last=False)
+            self.dropped += 1
+        self._pending[key] = event
+        self._ready.set()
+
+    async def get(self) -> dict:
+        while not self._pending:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._pending.popitem(last=False)[1]
+
+
+class EventBus:
+    """Bus publication/abonnement des événements de statut, de transaction et de compteur."""
+
+    def __init__(self):
+        self._subscriptions = set()
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    def publish(self, event_type: str, charge_point_id: str, connector_id: Optional[int] = None, **data):
+        if not self._subscriptions:
+            return
+        event = {
+            "type": event_type,
+            "chargePointId": charge_point_id,
+            "connectorId": connector_id,
+            "time": datetime.now(timezone.utc).isoformat(),
+            **data,
+        }
+        for subscription in self._subscriptions:
+            if subscription.matches(event):
+                subscription.push(event)
+
+    @contextmanager
+    def subscribe(self, charge_point_id: Optional[str] = None, connector_id: Optional[int] = None, types: Optional[Set[str]] = None):
+        subscription = Subscription(charge_point_id, connector_id, types)
+        self._subscriptions.add(subscription)
+        try:
+            yield subscription
+        finally:
+            self._subscriptions.discard(subscription)
+            if subscription.dropped:
+                logging.warning("Abonné aux événements lent : %s événement(s) abandonné(s)", subscription.dropped)
+
+
+event_bus = EventBus()
+
+
+@observe("StatusNotification")
+def publish_status(session, payload: dict, result: dict):
+    event_bus.publish("status", session.charge_point_id, payload.get("connectorId"), status=payload.get("status"), errorCode=payload.get("errorCode"), timestamp=payload.get("timestamp"))
+
+
+@observe("StartTransaction")
+def publish_transaction_started(session, payload: dict, result: dict):
+    transaction_id = result.get("transactionId")
+    event_bus.publish("transaction.started", session.charge_point_id, payload.get("connectorId"), transactionId=transaction_id, idTag=payload.get("idTag"), meterStart=payload.get("meterStart"), timestamp=payload.get("timestamp"))
+
+
+@observe("StopTransaction")
+def publish_transaction_stopped(session, payload: dict, result: dict):
+    transaction_id = payload.get("transactionId")
+    connector_id = transaction_journal.connector_of(session.charge_point_id, transaction_id)
+    event_bus.publish("transaction.stopped", session.charge_point_id, connector_id, transactionId=transaction_id, meterStop=payload.get("meterStop"), reason=payload.get("reason"), timestamp=payload.get("timestamp"))
+
+
+@observe("MeterValues")
+def publish_meter_values(session, payload: dict, result: dict):
+    event_bus.publish("meter", session.charge_point_id, payload.get("connectorId"), transactionId=payload.get("transactionId"), meterValue=payload.get("meterValue"))
+
+
+@observe_inbound
+def publish_inbound_call(session, action: str, payload: dict):
+    event_bus.publish("call", session.charge_point_id, payload.get("connectorId"), action=action, payload=payload)
+
+
+def parse_types(types: Optional[str]) -> Optional[Set[str]]:
+    return set(types.split(",")) if types else None
+
+
+async def relay_worker_events(worker: int, subscription: Subscription, params: dict):
+    """Relaie dans `subscription` les événements d'un autre worker, lus sur son flux `/events`."""
+    try:
+        async with forwarder.stream(worker, "GET", "/events", params=params) as response:
+            data = None
+            async for line in response.aiter_lines():
+                if line.startswith("data: "):
+                    data = line[len("data: "):]
+                elif not line and data is not None:
+                    subscription.push(json.loads(data))
+                    data = None
+    except Exception as e:
+        logging.warning("Flux d'événements du worker %s interrompu: %s", worker, e)
+
+
+@contextmanager
+def subscribe_fleet(cp_id: Optional[str], connector_id: Optional[int], types: Optional[str], forwarded: bool = False):
+    """
+    Abonnement aux événements de toute la flotte. En mode cluster, les
+    événements des autres workers sont relayés dans la même file (sauf pour
+    un flux demandé par un autre worker, qui ne décrit que le worker local).
+    """
+    with event_bus.subscribe(cp_id, connector_id, parse_types(types)) as subscription:
+        params = {name: value for name, value in (("cp_id", cp_id), ("connector_id", connector_id), ("types", types)) if value is not None}
+        relays = [] if forwarded else [asyncio.create_task(relay_worker_events(worker, subscription, params)) for worker in other_workers(cp_id)]
+        try:
+            yield subscription
+        finally:
+            for relay in relays:
+                relay.cancel()
+
+
+@router.get("/events", summary="Suivre les événements en temps réel (SSE)", description="Ce endpoint ouvre un flux Server-Sent Events qui diffuse les changements de statut des connecteurs (`status`), les débuts et fins de transaction (`transaction.started`, `transaction.stopped`), les valeurs de compteur (`meter`) et les commandes reçues du serveur central (`call`), au lieu d'interroger `/status` en boucle. Les événements peuvent être filtrés par point de charge, connecteur et type. Un abonné trop lent reçoit le dernier état de chaque connecteur plutôt que toutes les étapes intermédiaires.")
+async def stream_events(
+    request: Request,
+    cp_id: Optional[str] = Query(None, description="Filtrer sur un point de charge"),
+    connector_id: Optional[int] = Query(None, description="Filtrer sur un connecteur"),
+    types: Optional[str] = Query(None, description="Types d'événements séparés par des virgules (status, transaction.started, transaction.stopped, meter, call)")
+):
+    """
+    Diffuse les événements au format Server-Sent Events.
+
+    - **cp_id**: (Optionnel) Identifiant du point de charge
+    - **connector_id**: (Optionnel) Identifiant du connecteur
+    - **types**: (Optionnel) Types d'événements à recevoir
+    """
+    async def lines():
+        with subscribe_fleet(cp_id, connector_id, types, is_forwarded(request.headers)) as subscription:
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), SSE_KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(lines(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+async def events_websocket(websocket: WebSocket):
+    """Diffuse les événements sur une WebSocket, avec les mêmes filtres que `/events`."""
+    params = websocket.query_params
+    await websocket.accept()
+    try:
+        connector_id = int(params["connector_id"]) if params.get("connector_id") else None
+    except ValueError:
+        await websocket.close(code=1008, reason=f"connector_id invalide: {params['connector_id']}")
+        return
+    with subscribe_fleet(params.get("cp_id"), connector_id, params.get("types")) as subscription:
+        async def forward():
+            while True:
+                await websocket.send_json(await subscription.get())
+
+        sender = asyncio.create_task(forward())
+        try:
+            # La lecture ne sert qu'à détecter la déconnexion du client
+            while (await websocket.receive())["type"] != "websocket.disconnect":
+                pass
+        except WebSocketDisconnect:
+            pass
+        finally:
+            sender.cancel()
@@ -0,0 +1,328 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, Optional
+
+from fastapi import APIRouter, Query
+
+from app.connection import observe
+from app.env import load_dotenv
+
+load_dotenv()
+
+TRANSACTION_DB_PATH = os.getenv("TRANSACTION_DB_PATH", "transactions.db")
+# Fenêtre de regroupement des écritures : un seul COMMIT (et fsync) par lot
+JOURNAL_FLUSH_INTERVAL = float(os.getenv("JOURNAL_FLUSH_INTERVAL", "0.05"))
+# Nombre de transactions terminées gardées en mémoire pour dédoublonner les StopTransaction
+JOURNAL_DEDUP_SIZE = int(os.getenv("JOURNAL_DEDUP_SIZE", "10000"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    charge_point_id TEXT NOT NULL,
+    transaction_id INTEGER NOT NULL,
+    connector_id INTEGER,
+    id_tag TEXT,
+    id_tag_status TEXT,
+    meter_start INTEGER,
+    start_timestamp TEXT,
+    meter_stop INTEGER,
+    stop_timestamp TEXT,
+    stop_reason TEXT,
+    PRIMARY KEY (charge_point_id, transaction_id)
+);
+CREATE INDEX IF NOT EXISTS transactions_transaction_id ON transactions (transaction_id);
+CREATE INDEX IF NOT EXISTS transactions_id_tag ON transactions (id_tag);
+CREATE INDEX IF NOT EXISTS transactions_connector ON transactions (charge_point_id, connector_id);
+CREATE TABLE IF NOT EXISTS meter_checkpoints (
+    charge_point_id TEXT NOT NULL,
+    transaction_id INTEGER,
+    connector_id INTEGER NOT NULL,
+    timestamp TEXT,
+    meter_value TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS meter_checkpoints_transaction ON meter_checkpoints (charge_point_id, transaction_id);
+"""
+
+INSERT_START = """
+INSERT OR IGNORE INTO transactions (charge_point_id, transaction_id, connector_id, id_tag, id_tag_status, meter_start, start_timestamp)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+UPSERT_STOP = """
+INSERT INTO transactions (charge_point_id, transaction_id, id_tag, meter_stop, stop_timestamp, stop_reason)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (charge_point_id, transaction_id) DO UPDATE SET
+    meter_stop = excluded.meter_stop, stop_timestamp = excluded.stop_timestamp, stop_reason = excluded.stop_reason
+WHERE stop_timestamp IS NULL
+"""
+
+INSERT_METER = """
+INSERT INTO meter_checkpoints (charge_point_id, transaction_id, connector_id, timestamp, meter_value)
+VALUES (?, ?, ?, ?, ?)
+"""
+
+COLUMNS = {
+    "charge_point_id": "chargePointId",
+    "transaction_id": "transactionId",
+    "connector_id": "connectorId",
+    "id_tag": "idTag",
+    "id_tag_status": "idTagStatus",
+    "meter_start": "meterStart",
+    "start_timestamp": "startTimestamp",
+    "meter_stop": "meterStop",
+    "stop_timestamp": "stopTimestamp",
+    "stop_reason": "stopReason",
+}
+
+router = APIRouter()
+
+
+class TransactionJournal:
+    """
+    Journal local des transactions : débuts, fins et relevés de compteur.
+
+    Les écritures sont mises en file et validées par lots (un COMMIT par
+    fenêtre de `flush_interval` secondes) dans une base SQLite en mode WAL,
+    pour que le fsync ne limite pas le débit des requêtes. Les transactions
+    ouvertes sont gardées en mémoire, et rechargées depuis la base au
+    démarrage, pour dédoublonner les StartTransaction soumis plusieurs fois
+    sans relire la base. Les transactions terminées récemment le sont aussi ;
+    les autres sont cherchées dans la base, pour qu'un StopTransaction
+    retenté après un redémarrage ne soit pas renvoyé.
+    """
+
+    def __init__(self, path: str = TRANSACTION_DB_PATH, flush_interval: float = JOURNAL_FLUSH_INTERVAL, dedup_size: int = JOURNAL_DEDUP_SIZE):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.dedup_size = dedup_size
+        self.batches = 0
+        self.writes = 0
+        self._db = None
+        self._lock = threading.Lock()
+        self._queue = []
+        self._flusher = None
+        # (point de charge, connecteur, idTag, horodatage) -> transactionId des transactions ouvertes
+        self._open = {}
+        self._open_keys = {}
+        # (point de charge, transactionId) -> (payload de réponse, connecteur) des transactions terminées récemment
+        self._stopped = OrderedDict()
+        self._inflight = {}
+
+    def _connect(self):
+        if self._db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            # En WAL, NORMAL ne synchronise qu'aux checkpoints : un lot perdu au
+            # plus en cas de coupure, jamais une base corrompue.
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(SCHEMA)
+            rows = db.execute(
+                "SELECT charge_point_id, connector_id, id_tag, start_timestamp, transaction_id FROM transactions WHERE stop_timestamp IS NULL"
+            ).fetchall()
+            self._open = {row[:4]: row[4] for row in rows}
+            self._open_keys = {(row[0], row[4]): row[:4] for row in rows}
+            self._db = db
+            logging.info("Journal des transactions ouvert (%s, %s transaction(s) en cours)", self.path, len(self._open))
+        return self._db
+
+    def _flushing(self) -> bool:
+        # Une tâche d'écriture d'une autre boucle (tests, rechargement) ne compte pas
+        return self._flusher is not None and self._flusher.get_loop() is asyncio.get_running_loop()
+
+    def _enqueue(self, statement: str, params: tuple):
+        self._connect()
+        self._queue.append((statement, params))
+        if not self._flushing():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        try:
+            while self._queue:
+                await asyncio.sleep(self.flush_interval)
+                batch, self._queue = self._queue, []
+                await asyncio.to_thread(self._write, batch)
+        finally:
+            if self._flusher is asyncio.current_task():
+                self._flusher = None
+            if self._queue:
+                # Tâche annulée (arrêt de la boucle) : le reste est écrit avant de rendre la main
+                batch, self._queue = self._queue, []
+                self._write(batch)
+
+    def _write(self, batch: List[tuple]):
+        with self._lock:
+            try:
+                with self._db:
+                    for statement, params in batch:
+                        self._db.execute(statement, params)
+            except sqlite3.Error as e:
+                logging.error("Écriture de %s entrée(s) dans le journal des transactions impossible: %s", len(batch), e)
+                return
+        self.batches += 1
+        self.writes += len(batch)
+
+    async def flush(self):
+        """Attend que toutes les écritures en file soient validées."""
+        while self._flushing():
+            await asyncio.shield(self._flusher)
+
+    async def close(self):
+        await self.flush()
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+            self._db = None
+
+    def find_start(self, charge_point_id: str, connector_id: int, id_tag: str, timestamp: str) -> Optional[int]:
+        """transactionId d'une transaction déjà ouverte avec ces paramètres, s'il y en a une."""
+        self._connect()
+        return self._open.get((charge_point_id, connector_id, id_tag, timestamp))
+
+    async def find_stop(self, charge_point_id: str, transaction_id: int) -> Optional[dict]:
+        """
+        Réponse du StopTransaction déjà enregistré pour cette transaction, s'il
+        y en a un (vide s'il n'est connu que par la base).
+        """
+        stopped = self._stopped.get((charge_point_id, transaction_id))
+        if stopped is not None:
+            return stopped[0]
+        self._connect()
+        if (charge_point_id, transaction_id) in self._open_keys:
+            return None
+        # Les arrêts encore en file sont déjà dans `_stopped` : la base est lue
+        # sans attendre l'écriture du lot en cours
+
+        def read():
+            with self._lock:
+                return self._connect().execute(
+                    "SELECT 1 FROM transactions WHERE charge_point_id = ? AND transaction_id = ? AND stop_timestamp IS NOT NULL",
+                    (charge_point_id, transaction_id),
+                ).fetchone()
+
+        return {} if await asyncio.to_thread(read) else None
+
+    def connector_of(self, charge_point_id: str, transaction_id: int) -> Optional[int]:
+        """
+        Connecteur d'une transaction en cours ou terminée récemment (StopTransaction
+        ne le précisant pas), d'après l'index des transactions ouvertes.
+        """
+        self._connect()
+        key = self._open_keys.get((charge_point_id, transaction_id))
+        if key is not None:
+            return key[1]
+        stopped = self._stopped.get((charge_point_id, transaction_id))
+        return stopped[1] if stopped is not None else None
+
+    async def once(self, key: tuple, send: Callable[[], Awaitable]):
+        """
+        Exécute `send` une seule fois pour des soumissions simultanées de la
+        même clé : les doublons attendent le résultat du premier envoi.
+        """
+        task = self._inflight.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(send())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    def record_start(self, charge_point_id: str, payload: dict, result: dict):
+        if result.get("idTagInfo", {}).get("status") != "Accepted":
+            # Transaction refusée par le serveur central : rien à dédoublonner ni à arrêter
+            return
+        transaction_id = result["transactionId"]
+        key = (charge_point_id, payload["connectorId"], payload["idTag"], payload["timestamp"])
+        self._open[key] = transaction_id
+        self._open_keys[(charge_point_id, transaction_id)] = key
+        self._enqueue(INSERT_START, (
+            charge_point_id, transaction_id, payload["connectorId"], payload["idTag"],
+            result.get("idTagInfo", {}).get("status"), payload["meterStart"], payload["timestamp"],
+        ))
+
+    def record_stop(self, charge_point_id: str, payload: dict, result: dict):
+        transaction_id = payload["transactionId"]
+        key = self._open_keys.pop((charge_point_id, transaction_id), None)
+        if key is not None:
+            del self._open[key]
+        self._stopped[(charge_point_id, transaction_id)] = (result, key[1] if key is not None else None)
+        while len(self._stopped) > self.dedup_size:
+            self._stopped.popitem(last=False)
+        self._enqueue(UPSERT_STOP, (
+            charge_point_id, transaction_id, payload.get("idTag"), payload["meterStop"], payload["timestamp"], payload.get("reason"),
+        ))
+
+    def record_meter_values(self, charge_point_id: str, payload: dict):
+        for meter_value in payload.get("meterValue", []):
+            self._enqueue(INSERT_METER, (
+                charge_point_id, payload.get("transactionId"), payload["connectorId"], meter_value.get("timestamp"), json.dumps(meter_value),
+            ))
+
+    async def query(self, charge_point_id: Optional[str] = None, transaction_id: Optional[int] = None, id_tag: Optional[str] = None,
+                    connector_id: Optional[int] = None, open_only: bool = False, limit: int = 100) -> List[dict]:
+        """Recherche des transactions, par les index du journal."""
+        await self.flush()
+        conditions, params = [], []
+        for column, value in (("charge_point_id", charge_point_id), ("transaction_id", transaction_id), ("id_tag", id_tag), ("connector_id", connector_id)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if open_only:
+            conditions.append("stop_timestamp IS NULL")
+        sql = f"SELECT {', '.join(COLUMNS)} FROM transactions"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY start_timestamp DESC LIMIT ?"
+        params.append(limit)
+
+        def read():
+            with self._lock:
+                return self._connect().execute(sql, params).fetchall()
+
+        return [dict(zip(COLUMNS.values(), row)) for row in await asyncio.to_thread(read)]
+
+
+transaction_journal = TransactionJournal()
+
+
+@observe("StartTransaction")
+def journal_start_transaction(session, payload: dict, result: dict):
+    transaction_journal.record_start(session.charge_point_id, payload, result)
+
+
+@observe("StopTransaction")
+def journal_stop_transaction(session, payload: dict, result: dict):
+    transaction_journal.record_stop(session.charge_point_id, payload, result)
+
+
+@observe("MeterValues")
+def journal_meter_values(session, payload: dict, result: dict):
+    transaction_journal.record_meter_values(session.charge_point_id, payload)
+
+
+@router.get("/transactions", summary="Rechercher dans le journal des transactions", description="Ce endpoint recherche les transactions enregistrées dans le journal local (SQLite en mode WAL) : début, fin, index de compteur et motif d'arrêt. Les recherches par identifiant de transaction, par carte RFID (`idTag`) et par connecteur utilisent les index du journal ; `open=true` ne renvoie que les transactions en cours, y compris celles ouvertes avant un redémarrage de l'application.")
+async def list_transactions(
+    cp_id: Optional[str] = Query(None, description="Filtrer sur un point de charge"),
+    transaction_id: Optional[int] = Query(None, description="Filtrer sur un identifiant de transaction"),
+    id_tag: Optional[str] = Query(None, description="Filtrer sur une carte RFID"),
+    connector_id: Optional[int] = Query(None, description="Filtrer sur un connecteur"),
+    open: bool = Query(False, description="Ne renvoyer que les transactions en cours"),
+    limit: int = Query(100, ge=1, le=1000, description="Nombre maximal de transactions renvoyées")
+):
+    """
+    Recherche des transactions dans le journal local.
+
+    - **cp_id**: (Optionnel) Identifiant du point de charge
+    - **transaction_id**: (Optionnel) Identifiant de la transaction
+    - **id_tag**: (Optionnel) Identifiant de la carte RFID
+    - **connector_id**: (Optionnel) Identifiant du connecteur
+    - **open**: Transactions en cours uniquement
+    - **limit**: Nombre maximal de résultats
+    """
+    try:
+        return await transaction_journal.query(cp_id, transaction_id, id_tag, connector_id, open, limit)
+    except Exception as e:
+        logging.error("Erreur lors de la lecture du journal des transactions: %s", e)
+        return {"error": str(e)}
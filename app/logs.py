@@ -0,0 +1,209 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+from datetime import datetime, timezone
+from typing import Optional
+
+from fastapi import APIRouter, Path, Query, Request
+
+from app.cluster import forwarder, is_forwarded, other_workers
+from app.env import load_dotenv
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# json : une ligne JSON par message ; text : format lisible pour le développement
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# Fraction des CALL dont la requête et la réponse sont journalisées (toujours en cas d'erreur)
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0"))
+# Points de charge dont tous les payloads sont journalisés, séparés par des virgules
+LOG_DEBUG_CHARGE_POINTS = os.getenv("LOG_DEBUG_CHARGE_POINTS", "")
+# Niveau du logger de la librairie ocpp, qui journalise chaque message envoyé et reçu en INFO
+LOG_OCPP_LEVEL = os.getenv("LOG_OCPP_LEVEL", "WARNING").upper()
+
+router = APIRouter()
+
+# Attributs standard d'un LogRecord, et champs passés dans `extra` repris dans le JSON.
+# Les autres attributs ajoutés par une librairie (le `websocket` de websockets, ...) sont ignorés.
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+LOG_FIELDS = ("charge_point_id", "action", "request", "response")
+
+
+def serialize_fields(record: logging.LogRecord) -> Optional[str]:
+    """Champs de LOG_FIELDS présents sur l'enregistrement, en objet JSON (None s'il n'y en a pas)."""
+    fields = {key: record.__dict__[key] for key in LOG_FIELDS if key in record.__dict__}
+    return json.dumps(fields, ensure_ascii=False, default=str) if fields else None
+
+
+class JsonFormatter(logging.Formatter):
+    """Une ligne JSON par message, avec les champs de LOG_FIELDS passés dans `extra`."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+        # Champs déjà sérialisés par DeferredQueueHandler.prepare, insérés tels quels
+        fields = record.log_fields if "log_fields" in vars(record) else serialize_fields(record)
+        return line if fields is None else f"{line[:-1]}, {fields[1:]}"
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler qui ne met pas le message en forme : le texte n'est produit
+    que dans le thread du QueueListener, jamais sur la boucle asyncio.
+
+    Les champs `extra` sont en revanche figés ici, dans le thread appelant :
+    ceux de LOG_FIELDS sont sérialisés en JSON (un payload peut être modifié
+    après l'appel), les autres retirés de l'enregistrement (un
+    `weakref.proxy` peut ne plus être valide quand le listener le lirait).
+    La trace d'une exception est mise en forme ici pour la même raison.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        extras = [key for key in vars(record) if key not in RECORD_ATTRIBUTES]
+        if not extras and not record.exc_info:
+            return record
+        # Copie : les autres handlers du logger reçoivent l'enregistrement d'origine
+        record = copy.copy(record)
+        record.log_fields = serialize_fields(record)
+        for key in extras:
+            del record.__dict__[key]
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging(level: str = LOG_LEVEL, format: str = LOG_FORMAT) -> logging.handlers.QueueListener:
+    """
+    Configure le logger racine : les messages passent par une file et sont
+    mis en forme et écrits sur la sortie d'erreur par un thread dédié.
+    Sans effet si la journalisation est déjà configurée par cette fonction.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+    stream = logging.StreamHandler()
+    stream.setFormatter(JsonFormatter() if format == "json" else logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(level)
+    logging.getLogger("ocpp").setLevel(LOG_OCPP_LEVEL)
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
+
+
+class PayloadLogPolicy:
+    """
+    Décide quels payloads OCPP sont journalisés : ceux d'un CALL en erreur,
+    une fraction `sample_rate` des autres, et tous ceux des points de charge
+    passés en mode debug (modifiable à chaud via `/logging`).
+    """
+
+    def __init__(self, sample_rate: float = LOG_PAYLOAD_SAMPLE_RATE, debug_charge_points: str = LOG_DEBUG_CHARGE_POINTS):
+        self.sample_rate = sample_rate
+        self.debug_charge_points = {charge_point_id.strip() for charge_point_id in debug_charge_points.split(",") if charge_point_id.strip()}
+
+    def should_log(self, charge_point_id: Optional[str], error: bool = False) -> bool:
+        if error or charge_point_id in self.debug_charge_points:
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def log_call(self, charge_point_id: Optional[str], action: str, payload: dict, response=None, error: bool = False):
+        """
+        Journalise la requête et la trame de réponse d'un CALL (None s'il n'y
+        en a pas eu) si la politique le prévoit.
+        """
+        if not self.should_log(charge_point_id, error):
+            return
+        if response is not None:
+            response = response.to_list()
+        logging.log(
+            logging.WARNING if error else logging.INFO,
+            "CALL %s vers %s",
+            action,
+            charge_point_id,
+            extra={"charge_point_id": charge_point_id, "action": action, "request": payload, "response": response},
+        )
+
+    def as_dict(self) -> dict:
+        return {"payload_sample_rate": self.sample_rate, "debug_charge_points": sorted(self.debug_charge_points)}
+
+
+payload_log_policy = PayloadLogPolicy()
+
+
+async def broadcast(request: Request):
+    """
+    Rejoue la modification de la politique sur les autres workers (mode
+    cluster) : chaque worker journalise les CALL de ses propres points de
+    charge et applique sa propre copie de la politique.
+    """
+    if not is_forwarded(request.headers):
+        await forwarder.gather(other_workers(), request.method, request.url.path, params=dict(request.query_params))
+
+
+@router.get("/logging", summary="Politique de journalisation des payloads", description="Ce endpoint renvoie la politique de journalisation des payloads OCPP : fraction des CALL dont la requête et la réponse sont journalisées (`LOG_PAYLOAD_SAMPLE_RATE`, les CALL en erreur l'étant toujours) et points de charge en mode debug, dont tous les payloads sont journalisés.")
+async def get_logging_policy():
+    """
+    Renvoie la politique de journalisation des payloads.
+    """
+    return payload_log_policy.as_dict()
+
+
+@router.put("/logging/sample-rate", summary="Modifier l'échantillonnage des payloads journalisés", description="Ce endpoint modifie à chaud la fraction des CALL OCPP dont la requête et la réponse sont journalisées, entre 0 (uniquement les erreurs) et 1 (tous les CALL).")
+async def set_payload_sample_rate(
+    request: Request,
+    rate: float = Query(..., ge=0, le=1, description="Fraction des CALL journalisés, entre 0 et 1")
+):
+    """
+    Modifie le taux d'échantillonnage des payloads journalisés.
+
+    - **rate**: Fraction des CALL journalisés
+    """
+    payload_log_policy.sample_rate = rate
+    await broadcast(request)
+    return payload_log_policy.as_dict()
+
+
+@router.put("/logging/debug/{charge_point_id}", summary="Activer le mode debug d'un point de charge", description="Ce endpoint active à chaud la journalisation de tous les payloads OCPP (requêtes et réponses) échangés pour un point de charge, quel que soit le taux d'échantillonnage, pour diagnostiquer une borne sans journaliser toute la flotte.")
+async def enable_debug(request: Request, charge_point_id: str = Path(..., description="Identifiant du point de charge")):
+    """
+    Active la journalisation de tous les payloads d'un point de charge.
+
+    - **charge_point_id**: Identifiant du point de charge
+    """
+    payload_log_policy.debug_charge_points.add(charge_point_id)
+    await broadcast(request)
+    return payload_log_policy.as_dict()
+
+
+@router.delete("/logging/debug/{charge_point_id}", summary="Désactiver le mode debug d'un point de charge", description="Ce endpoint désactive le mode debug d'un point de charge : ses payloads ne sont plus journalisés qu'en cas d'erreur ou selon le taux d'échantillonnage.")
+async def disable_debug(request: Request, charge_point_id: str = Path(..., description="Identifiant du point de charge")):
+    """
+    Désactive la journalisation de tous les payloads d'un point de charge.
+
+    - **charge_point_id**: Identifiant du point de charge
+    """
+    payload_log_policy.debug_charge_points.discard(charge_point_id)
+    await broadcast(request)
+    return payload_log_policy.as_dict()
@@ -1,10 +1,97 @@
-from fastapi import FastAPI, WebSocket
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, WebSocket, Depends, Request
+from fastapi.responses import JSONResponse
+from app.circuit_breaker import CircuitOpenError
+from app.deadlines import CallTimeoutError, DeadlineMiddleware
+from app.scheduler import QueueFullError
+from app.metrics import MetricsMiddleware, loop_lag_monitor, router as metrics_router
+from app.logs import setup_logging, router as logging_router
+from app.cluster import CLUSTER_WORKERS, ClusterMiddleware, forwarder
 from app.api import router as api_router
-from app.websocket import websocket_endpoint
+from app.batch import router as batch_router
+from app.auth_cache import router as auth_cache_router
+from app.validation import PayloadValidationError, router as validation_router
+from app.journal import router as journal_router, transaction_journal
+from app.meter_store import router as meter_store_router, meter_store
+from app.offline_queue import router as offline_queue_router, offline_queue
+from app.status_store import router as status_router
+from app.sites import router as sites_router, site_registry
+from app.rollout import router as rollout_router, rollouts
+from app.events import router as events_router, events_websocket
+from app.registry import registry, charge_point_path, router as registry_router
+from app.connection import CHARGE_POINT_ID
 
-app = FastAPI()
+setup_logging()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Connexions OCPP partagées par toutes les routes pendant la vie de l'application
+    await registry.start()
+    await offline_queue.start()
+    await loop_lag_monitor.start()
+    await site_registry.start()
+    yield
+    # Arrêt (SIGTERM) : les CALL en cours reçoivent leur réponse avant la fermeture des connexions
+    await registry.drain()
+    await site_registry.close()
+    await rollouts.close()
+    await loop_lag_monitor.close()
+    await offline_queue.close()
+    await registry.close()
+    await transaction_journal.close()
+    await meter_store.close()
+    await forwarder.close()
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.exception_handler(CircuitOpenError)
+async def circuit_open_handler(request: Request, exc: CircuitOpenError):
+    # Échec immédiat tant que le serveur central est injoignable, sans tentative de connexion
+    return JSONResponse(status_code=503, content={"error": str(exc)}, headers={"Retry-After": str(max(int(exc.retry_after), 1))})
+
+
+@app.exception_handler(CallTimeoutError)
+async def call_timeout_handler(request: Request, exc: CallTimeoutError):
+    # Délai de l'action ou échéance X-Deadline-Ms dépassé : l'appel OCPP a été abandonné
+    return JSONResponse(status_code=504, content={"error": str(exc)})
+
+
+@app.exception_handler(QueueFullError)
+async def queue_full_handler(request: Request, exc: QueueFullError):
+    # File de la classe de priorité pleine pour ce point de charge : le CALL n'a pas été envoyé
+    return JSONResponse(status_code=429, content={"error": str(exc)}, headers={"Retry-After": str(max(int(exc.retry_after), 1))})
+
+
+@app.exception_handler(PayloadValidationError)
+async def payload_validation_handler(request: Request, exc: PayloadValidationError):
+    # Payload non conforme au schéma OCPP : rien n'a été envoyé ni mis en file
+    return JSONResponse(status_code=422, content={"error": str(exc)})
+
+
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(MetricsMiddleware)
+if CLUSTER_WORKERS > 1:
+    # Chaque point de charge appartient à un seul worker : les requêtes reçues ailleurs lui sont transmises
+    app.add_middleware(ClusterMiddleware, default_charge_point=CHARGE_POINT_ID, default_paths={route.path for route in api_router.routes})
 
 app.include_router(api_router)
+# Mêmes routes pour chaque point de charge de la flotte, chacun avec sa propre connexion
+app.include_router(api_router, prefix="/charge-points/{cp_id}", dependencies=[Depends(charge_point_path)], tags=["charge-points"])
+app.include_router(batch_router)
+app.include_router(auth_cache_router)
+app.include_router(status_router)
+app.include_router(events_router)
+app.include_router(validation_router)
+app.include_router(journal_router)
+app.include_router(meter_store_router)
+app.include_router(offline_queue_router)
+app.include_router(registry_router)
+app.include_router(metrics_router)
+app.include_router(logging_router)
+app.include_router(sites_router)
+app.include_router(rollout_router)
 
 @app.get("/")
 async def read_root():
@@ -12,8 +99,17 @@ async def read_root():
 
 @app.websocket("/ws")
 async def websocket_route(websocket: WebSocket):
+    # Import différé : le bridge charge la librairie ocpp et jsonschema, inutiles
+    # tant qu'aucun client ne s'y connecte. `websockets`, lui, reste importé au
+    # démarrage (app.connection, et uvicorn pour les routes WebSocket).
+    from app.websocket import websocket_endpoint
+
     await websocket_endpoint(websocket)
 
+@app.websocket("/ws/events")
+async def events_websocket_route(websocket: WebSocket):
+    await events_websocket(websocket)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
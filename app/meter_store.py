@@ -0,0 +1,320 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+import zlib
+from array import array
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter
+
+from app.connection import observe
+from app.env import load_dotenv
+from app.journal import transaction_journal
+
+load_dotenv()
+
+METER_STORE_PATH = os.getenv("METER_STORE_PATH", "meter_data")
+# Échantillons mis en mémoire avant l'écriture d'un segment, et délai maximal avant écriture
+METER_FLUSH_ROWS = int(os.getenv("METER_FLUSH_ROWS", "65536"))
+METER_FLUSH_INTERVAL = float(os.getenv("METER_FLUSH_INTERVAL", "5"))
+
+# Mesure par défaut d'un sampledValue sans `measurand` (OCPP 1.6)
+DEFAULT_MEASURAND = "Energy.Active.Import.Register"
+
+SEGMENT_MAGIC = b"OCMV1\n"
+SEGMENT_SUFFIX = ".mv"
+
+# Colonnes d'un segment et leur type `array` : horodatage (secondes epoch),
+# codes de dictionnaire (point de charge, mesure, phase, unité), connecteur,
+# transaction (-1 : aucune) et valeur
+COLUMNS = (
+    ("timestamp", "d"),
+    ("charge_point", "I"),
+    ("connector", "I"),
+    ("transaction", "q"),
+    ("measurand", "H"),
+    ("phase", "H"),
+    ("unit", "H"),
+    ("value", "d"),
+)
+DICTIONARIES = ("charge_point", "measurand", "phase", "unit")
+# Nombre de codes d'un dictionnaire : ce que la colonne peut contenir
+DICTIONARY_LIMITS = {name: 2 ** (8 * array(typecode).itemsize) for name, typecode in COLUMNS if name in DICTIONARIES}
+
+router = APIRouter()
+
+
+class Dictionary:
+    """Encodage des chaînes répétées (identifiants, mesures, phases, unités) en petits entiers."""
+
+    __slots__ = ("codes", "values", "limit")
+
+    def __init__(self, values: List[str] = (), limit: Optional[int] = None):
+        self.values = list(values)
+        self.codes = {value: code for code, value in enumerate(self.values)}
+        self.limit = limit
+
+    def encode(self, value: str) -> int:
+        """Code de la chaîne ; TypeError si ce n'en est pas une, OverflowError si le dictionnaire est plein."""
+        code = self.codes.get(value)
+        if code is None:
+            if not isinstance(value, str):
+                raise TypeError(f"Chaîne attendue: {value!r}")
+            if self.limit is not None and len(self.values) >= self.limit:
+                raise OverflowError(f"Dictionnaire plein ({self.limit} valeurs)")
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class MeterColumns:
+    """Tampons colonnes des échantillons reçus, une `array.array` typée par colonne."""
+
+    __slots__ = tuple(name for name, _ in COLUMNS)
+
+    def __init__(self):
+        for name, typecode in COLUMNS:
+            setattr(self, name, array(typecode))
+
+    def __len__(self):
+        return len(self.value)
+
+
+def parse_timestamp(timestamp: str) -> float:
+    # fromisoformat n'accepte le suffixe "Z" qu'à partir de Python 3.11
+    if timestamp.endswith("Z"):
+        timestamp = timestamp[:-1] + "+00:00"
+    return datetime.fromisoformat(timestamp).timestamp()
+
+
+class MeterStore:
+    """
+    Stockage colonne des valeurs de compteur (MeterValues et `transactionData`
+    des StopTransaction).
+
+    Chaque sampledValue devient une ligne des tampons colonnes, sans objet
+    Python par échantillon : les chaînes répétées sont encodées par des
+    dictionnaires, les nombres stockés dans des `array.array`. Les tampons
+    sont écrits par lots dans des segments compressés (une colonne zlib par
+    bloc, en-tête JSON avec les dictionnaires), dès `flush_rows` échantillons
+    ou au plus tard `flush_interval` secondes après le premier.
+    """
+
+    def __init__(self, path: str = METER_STORE_PATH, flush_rows: int = METER_FLUSH_ROWS, flush_interval: float = METER_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.dictionaries = {name: Dictionary([""], DICTIONARY_LIMITS[name]) for name in DICTIONARIES}
+        self.ingested = 0
+        self.rejected = 0
+        self.segments = 0
+        self.bytes_written = 0
+        self._columns = MeterColumns()
+        self._sequence = 0
+        self._flusher = None
+        self._full = None
+        self._closing = False
+
+    @property
+    def buffered(self) -> int:
+        return len(self._columns)
+
+    def ingest(self, charge_point_id: str, connector_id: int, transaction_id: Optional[int], meter_values: list) -> int:
+        """Ajoute les échantillons d'une liste `meterValue` aux tampons et retourne leur nombre."""
+        connector = connector_id or 0
+        transaction = -1 if transaction_id is None else transaction_id
+        if (not isinstance(meter_values, (list, tuple)) or not isinstance(connector, int) or not 0 <= connector < 2 ** 32
+                or not isinstance(transaction, int) or not -2 ** 63 <= transaction < 2 ** 63):
+            self.rejected += 1
+            return 0
+        columns = self._columns
+        before = len(columns)
+        charge_point = self.dictionaries["charge_point"].encode(charge_point_id)
+        measurands, phases, units = self.dictionaries["measurand"], self.dictionaries["phase"], self.dictionaries["unit"]
+        measurand_codes, phase_codes, unit_codes = measurands.codes, phases.codes, units.codes
+        append_timestamp, append_value = columns.timestamp.append, columns.value.append
+        append_measurand, append_phase, append_unit = columns.measurand.append, columns.phase.append, columns.unit.append
+        for meter_value in meter_values:
+            sampled_values = meter_value.get("sampledValue") if isinstance(meter_value, dict) else None
+            if not isinstance(sampled_values, list):
+                # meterValue mal formé : aucun échantillon exploitable
+                self.rejected += 1
+                continue
+            try:
+                timestamp = parse_timestamp(meter_value["timestamp"])
+            except (KeyError, TypeError, ValueError):
+                self.rejected += len(sampled_values)
+                continue
+            for sampled_value in sampled_values:
+                # Tous les champs sont encodés avant d'ajouter quoi que ce soit : un
+                # échantillon refusé en cours de route ne désaligne pas les colonnes
+                try:
+                    value = float(sampled_value["value"])
+                    measurand = sampled_value.get("measurand", DEFAULT_MEASURAND)
+                    measurand_code = measurand_codes.get(measurand)
+                    if measurand_code is None:
+                        measurand_code = measurands.encode(measurand)
+                    phase = sampled_value.get("phase", "")
+                    phase_code = phase_codes.get(phase)
+                    if phase_code is None:
+                        phase_code = phases.encode(phase)
+                    unit = sampled_value.get("unit", "")
+                    unit_code = unit_codes.get(unit)
+                    if unit_code is None:
+                        unit_code = units.encode(unit)
+                except (KeyError, TypeError, ValueError, OverflowError):
+                    # Valeur signée (format SignedData) ou non numérique, champ invalide, dictionnaire plein
+                    self.rejected += 1
+                    continue
+                append_measurand(measurand_code)
+                append_phase(phase_code)
+                append_unit(unit_code)
+                append_timestamp(timestamp)
+                append_value(value)
+        added = len(columns) - before
+        if added:
+            columns.charge_point.extend(array("I", [charge_point]) * added)
+            columns.connector.extend(array("I", [connector]) * added)
+            columns.transaction.extend(array("q", [transaction]) * added)
+            self.ingested += added
+            self._schedule_flush()
+        return added
+
+    def _schedule_flush(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Hors boucle asyncio (benchmark, script) : écriture synchrone par lots pleins
+            if len(self._columns) >= self.flush_rows:
+                self.write_segment(*self._swap())
+            return
+        if self._flusher is None or self._flusher.get_loop() is not loop:
+            self._full = asyncio.Event()
+            self._flusher = asyncio.create_task(self._flush_loop())
+        elif len(self._columns) >= self.flush_rows:
+            self._full.set()
+
+    async def _flush_loop(self):
+        try:
+            while len(self._columns):
+                if len(self._columns) < self.flush_rows and not self._closing:
+                    try:
+                        await asyncio.wait_for(self._full.wait(), self.flush_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                self._full.clear()
+                await asyncio.to_thread(self.write_segment, *self._swap())
+        finally:
+            if self._flusher is asyncio.current_task():
+                self._flusher = None
+
+    def _swap(self):
+        columns, self._columns = self._columns, MeterColumns()
+        # Copie des dictionnaires : le segment est lisible seul
+        return columns, {name: list(dictionary.values) for name, dictionary in self.dictionaries.items()}
+
+    def write_segment(self, columns: MeterColumns, dictionaries: Dict[str, List[str]]) -> Optional[str]:
+        """Écrit un segment : en-tête JSON puis chaque colonne compressée."""
+        if not len(columns):
+            return None
+        blocks = [zlib.compress(getattr(columns, name).tobytes(), 1) for name, _ in COLUMNS]
+        header = {
+            "rows": len(columns),
+            "byteorder": sys.byteorder,
+            "columns": [[name, typecode, len(block)] for (name, typecode), block in zip(COLUMNS, blocks)],
+            "dictionaries": dictionaries,
+            "first_timestamp": min(columns.timestamp),
+            "last_timestamp": max(columns.timestamp),
+        }
+        self._sequence += 1
+        os.makedirs(self.path, exist_ok=True)
+        path = os.path.join(self.path, f"{int(time.time() * 1000)}-{os.getpid()}-{self._sequence:06d}{SEGMENT_SUFFIX}")
+        try:
+            with open(path + ".tmp", "wb") as f:
+                f.write(SEGMENT_MAGIC)
+                f.write(json.dumps(header).encode() + b"\n")
+                for block in blocks:
+                    f.write(block)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            logging.error("Écriture d'un segment de %s valeur(s) de compteur impossible: %s", len(columns), e)
+            return None
+        self.segments += 1
+        self.bytes_written += os.path.getsize(path)
+        return path
+
+    async def flush(self):
+        """Écrit immédiatement les échantillons en mémoire."""
+        if len(self._columns):
+            await asyncio.to_thread(self.write_segment, *self._swap())
+
+    async def close(self):
+        """Termine l'écriture en cours, puis écrit les échantillons restants sans attendre `flush_interval`."""
+        flusher = self._flusher
+        if flusher is not None and flusher.get_loop() is asyncio.get_running_loop():
+            # Annuler la tâche n'arrêterait pas le thread d'écriture : elle est réveillée et attendue
+            self._closing = True
+            self._full.set()
+            await asyncio.gather(flusher, return_exceptions=True)
+            self._closing = False
+        await self.flush()
+
+    def segment_paths(self) -> List[str]:
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(os.path.join(self.path, name) for name in os.listdir(self.path) if name.endswith(SEGMENT_SUFFIX))
+
+    def stats(self) -> dict:
+        return {
+            "ingested": self.ingested,
+            "rejected": self.rejected,
+            "buffered": self.buffered,
+            "segments": self.segments,
+            "bytes_written": self.bytes_written,
+            "bytes_per_sample": round(self.bytes_written / (self.ingested - self.buffered), 2) if self.ingested > self.buffered else None,
+            "measurands": self.dictionaries["measurand"].values[1:],
+        }
+
+
+def read_segment(path: str) -> dict:
+    """Relit un segment : `rows`, `dictionaries` et les colonnes (`array.array`)."""
+    with open(path, "rb") as f:
+        if f.read(len(SEGMENT_MAGIC)) != SEGMENT_MAGIC:
+            raise ValueError(f"{path} n'est pas un segment de valeurs de compteur")
+        header = json.loads(f.readline())
+        columns = {}
+        for name, typecode, size in header["columns"]:
+            column = array(typecode, zlib.decompress(f.read(size)))
+            if header["byteorder"] != sys.byteorder:
+                column.byteswap()
+            columns[name] = column
+    return {"rows": header["rows"], "dictionaries": header["dictionaries"], "columns": columns}
+
+
+meter_store = MeterStore()
+
+
+@observe("MeterValues")
+def store_meter_values(session, payload: dict, result: dict):
+    meter_store.ingest(session.charge_point_id, payload.get("connectorId"), payload.get("transactionId"), payload.get("meterValue") or ())
+
+
+@observe("StopTransaction")
+def store_transaction_data(session, payload: dict, result: dict):
+    if payload.get("transactionData"):
+        # StopTransaction ne précise pas le connecteur : il vient du journal des transactions
+        transaction_id = payload.get("transactionId")
+        connector_id = transaction_journal.connector_of(session.charge_point_id, transaction_id)
+        meter_store.ingest(session.charge_point_id, 0 if connector_id is None else connector_id, transaction_id, payload["transactionData"])
+
+
+@router.get("/meter-store", summary="État du stockage des valeurs de compteur", description="Ce endpoint renvoie l'état du stockage colonne des valeurs de compteur (MeterValues et `transactionData` des StopTransaction) : échantillons reçus, rejetés (valeur non numérique ou horodatage invalide) et encore en mémoire, segments écrits sur disque, octets écrits et taille moyenne d'un échantillon sur disque, et mesures rencontrées.")
+async def meter_store_stats():
+    """
+    Renvoie l'état du stockage des valeurs de compteur.
+    """
+    return meter_store.stats()
@@ -0,0 +1,265 @@
+import asyncio
+import logging
+import os
+import time
+from bisect import bisect_left
+from typing import Callable, Optional, Tuple
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.env import load_dotenv
+
+load_dotenv()
+
+# Intervalle de mesure du retard de la boucle asyncio, en secondes
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+
+# Bornes des histogrammes de latence, en secondes
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+router = APIRouter()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    """Métrique au format texte Prometheus, avec une série par combinaison d'étiquettes."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._series = {}
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+    def clear(self):
+        self._series.clear()
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        self._series[labels] = self._series.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._series.get(labels, 0)
+
+    def render(self) -> list:
+        return self.header() + [f"{self.name}{_labels(self.labels, key)} {_number(value)}" for key, value in self._series.items()]
+
+
+class Gauge(Metric):
+    """
+    Jauge fixée par `set`, ou lue au moment de l'export si `function` est
+    fourni (aucun coût tant que /metrics n'est pas interrogé).
+    """
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), function: Optional[Callable[[], float]] = None):
+        super().__init__(name, help, labels)
+        self.function = function
+
+    def set(self, value: float, *labels):
+        self._series[labels] = value
+
+    def value(self, *labels) -> float:
+        if self.function is not None:
+            return self.function()
+        return self._series.get(labels, 0)
+
+    def render(self) -> list:
+        series = {(): self.function()} if self.function is not None else self._series
+        return self.header() + [f"{self.name}{_labels(self.labels, key)} {_number(value)}" for key, value in series.items()]
+
+
+class Histogram(Metric):
+    """
+    Histogramme à bornes fixes. `observe` ne fait qu'une recherche
+    dichotomique et deux additions : les cumuls attendus par Prometheus sont
+    calculés à l'export.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.bounds = tuple('le="%s"' % _number(bound) for bound in self.buckets) + ('le="+Inf"',)
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            # Comptes par intervalle (le dernier pour +Inf) et somme des valeurs
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def count(self, *labels) -> int:
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def render(self) -> list:
+        lines = self.header()
+        for key, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.bounds, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, bound)} {cumulative}")
+            labels = _labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_number(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Tuple[str, ...] = (), function: Optional[Callable[[], float]] = None) -> Gauge:
+        return self.register(Gauge(name, help, labels, function))
+
+    def histogram(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+http_request_duration = metrics.histogram(
+    "http_request_duration_seconds", "Durée de traitement des requêtes HTTP, par route", ("method", "route", "status")
+)
+ocpp_call_duration = metrics.histogram(
+    "ocpp_call_duration_seconds", "Durée des CALL OCPP vers le serveur central, par action et par phase (connect, send, recv)", ("action", "phase")
+)
+ocpp_call_errors = metrics.counter(
+    "ocpp_call_errors_total", "CALLERROR reçus du serveur central, par action et code d'erreur", ("action", "error_code")
+)
+ocpp_call_timeouts = metrics.counter(
+    "ocpp_call_timeouts_total", "CALL OCPP abandonnés faute de réponse dans leur délai", ("action",)
+)
+loop_lag = metrics.gauge(
+    "event_loop_lag_seconds", "Retard du dernier réveil de la boucle asyncio par rapport à l'heure prévue"
+)
+
+
+class LoopLagMonitor:
+    """Mesure périodiquement le retard avec lequel la boucle asyncio réveille une tâche."""
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self._task = None
+
+    async def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(time.monotonic() - expected, 0.0)
+            loop_lag.set(lag)
+            if lag > 1:
+                logging.warning("Boucle asyncio en retard de %.3f s", lag)
+
+
+loop_lag_monitor = LoopLagMonitor()
+
+
+def route_template(scope) -> str:
+    """
+    Gabarit de la route qui a traité la requête. Les routes incluses avec un
+    préfixe (`/charge-points/{cp_id}`) ne portent que leur propre chemin : le
+    préfixe est reconstruit à partir du chemin et des paramètres de la requête.
+    """
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    if path is None:
+        return "unmatched"
+    segments = scope["path"].split("/")
+    suffix = path.count("/")
+    if len(segments) - 1 <= suffix:
+        return path
+    names = {str(value): "{" + name + "}" for name, value in scope.get("path_params", {}).items()}
+    prefix = [names.get(segment, segment) for segment in segments[:-suffix]]
+    return "/".join(prefix) + path
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI : mesure la durée de chaque requête HTTP. L'étiquette
+    `route` est le gabarit de la route (`/charge-points/{cp_id}/authorize`)
+    et non le chemin, pour garder un nombre de séries borné.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_request_duration.observe(time.perf_counter() - started, scope["method"], route_template(scope), status)
+
+
+@router.get("/metrics", response_class=PlainTextResponse, summary="Métriques au format Prometheus", description="Ce endpoint expose les métriques de l'application au format texte Prometheus : histogrammes de latence par route HTTP et par action OCPP (phases connexion, envoi et attente de la réponse), compteurs de CALLERROR par code d'erreur et de CALL abandonnés, et jauges des connexions ouvertes vers le serveur central, des appels en attente de réponse et du retard de la boucle asyncio.")
+async def metrics_endpoint():
+    """
+    Renvoie les métriques au format texte Prometheus.
+    """
+    return PlainTextResponse(metrics.render(), media_type=CONTENT_TYPE)
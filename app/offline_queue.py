@@ -0,0 +1,284 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+import websockets
+from fastapi import APIRouter
+
+from app.cluster import owns
+from app.codec import Frame
+from app.connection import ConnectionManager
+from app.deadlines import CallTimeoutError
+from app.env import load_dotenv
+from app.registry import registry
+from app.scheduler import QueueFullError
+from app.validation import schema_validation
+
+load_dotenv()
+
+OFFLINE_QUEUE_PATH = os.getenv("OFFLINE_QUEUE_PATH", "offline_queue.db")
+# Débit de rejeu vers le serveur central après reconnexion, en messages par seconde
+OFFLINE_REPLAY_RATE = float(os.getenv("OFFLINE_REPLAY_RATE", "10"))
+# Intervalle entre deux tentatives de rejeu tant que le serveur central est injoignable
+OFFLINE_RETRY_INTERVAL = float(os.getenv("OFFLINE_RETRY_INTERVAL", "5"))
+
+# Messages de transaction conservés pendant une coupure, comme le ferait une borne OCPP 1.6
+QUEUED_ACTIONS = {"StartTransaction", "StopTransaction", "MeterValues"}
+
+# Erreurs indiquant que le serveur central est injoignable, et non que le message est refusé
+UPSTREAM_ERRORS = (OSError, ConnectionError, asyncio.TimeoutError, websockets.WebSocketException)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS offline_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    charge_point_id TEXT NOT NULL,
+    action TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    queued_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS offline_queue_charge_point ON offline_queue (charge_point_id, id);
+"""
+
+router = APIRouter()
+
+
+class OfflineQueue:
+    """
+    File FIFO sur disque des messages de transaction (StartTransaction,
+    StopTransaction, MeterValues) d'un point de charge dont le serveur
+    central est injoignable.
+
+    Tant qu'un point de charge a des messages en attente, ses nouveaux
+    messages de transaction sont mis en file derrière eux pour garder
+    l'ordre. Les payloads sont conservés tels quels (meterStop, horodatages)
+    et rejoués dans l'ordre, au plus `replay_rate` messages par seconde,
+    dès que la connexion est rétablie. Les accès à SQLite se font dans un
+    thread : les messages mis en file en même temps sont écrits par lots,
+    un COMMIT par lot, sans bloquer la boucle asyncio.
+    """
+
+    def __init__(self, path: str = OFFLINE_QUEUE_PATH, replay_rate: float = OFFLINE_REPLAY_RATE, retry_interval: float = OFFLINE_RETRY_INTERVAL):
+        self.path = path
+        self.replay_rate = replay_rate
+        self.retry_interval = retry_interval
+        self.enqueued = 0
+        self.replayed = 0
+        self.rejected = 0
+        self.drain_rate = 0.0
+        self._db = None
+        self._lock = threading.Lock()
+        # Messages en attente d'écriture, avec le futur résolu une fois le lot validé
+        self._pending = []
+        self._writer = None
+        self._depth = {}
+        self._draining = {}
+        self._replayer = None
+
+    def _connect(self):
+        if self._db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(SCHEMA)
+            self._depth = dict(db.execute("SELECT charge_point_id, COUNT(*) FROM offline_queue GROUP BY charge_point_id").fetchall())
+            self._db = db
+            if self._depth:
+                logging.info("File hors ligne ouverte (%s) : %s message(s) à rejouer", self.path, sum(self._depth.values()))
+        return self._db
+
+    def depth(self, charge_point_id: Optional[str] = None) -> int:
+        self._connect()
+        if charge_point_id is None:
+            return sum(self._depth.values())
+        return self._depth.get(charge_point_id, 0)
+
+    async def enqueue(self, charge_point_id: str, action: str, payload: dict) -> int:
+        """Met un message en file et retourne la profondeur de la file du point de charge, une fois le message écrit."""
+        self._connect()
+        written = asyncio.get_running_loop().create_future()
+        self._pending.append(((charge_point_id, action, json.dumps(payload), time.time()), written))
+        # Compté aussitôt : les messages suivants du point de charge passent derrière celui-ci
+        depth = self._depth[charge_point_id] = self._depth.get(charge_point_id, 0) + 1
+        self.enqueued += 1
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_loop())
+        await asyncio.shield(written)
+        return depth
+
+    async def _write_loop(self):
+        while self._pending:
+            batch, self._pending = self._pending, []
+            try:
+                await asyncio.to_thread(self._insert, [row for row, _ in batch])
+            except sqlite3.Error as e:
+                logging.error("Écriture de %s message(s) dans la file hors ligne impossible: %s", len(batch), e)
+                for (charge_point_id, *_), written in batch:
+                    self._discount(charge_point_id)
+                    written.set_exception(e)
+                continue
+            for _, written in batch:
+                written.set_result(None)
+
+    def _insert(self, rows: list):
+        with self._lock, self._db:
+            self._db.executemany("INSERT INTO offline_queue (charge_point_id, action, payload, queued_at) VALUES (?, ?, ?, ?)", rows)
+
+    def _peek(self, charge_point_id: str):
+        with self._lock:
+            return self._db.execute(
+                "SELECT id, action, payload FROM offline_queue WHERE charge_point_id = ? ORDER BY id LIMIT 1", (charge_point_id,)
+            ).fetchone()
+
+    def _delete(self, message_id: int):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM offline_queue WHERE id = ?", (message_id,))
+
+    def _discount(self, charge_point_id: str):
+        self._depth[charge_point_id] -= 1
+        if not self._depth[charge_point_id]:
+            del self._depth[charge_point_id]
+
+    async def send_or_enqueue(self, session: ConnectionManager, action: str, payload: dict) -> Optional[Frame]:
+        """
+        Envoie un message de transaction, ou le met en file si le serveur
+        central est injoignable. Retourne la réponse, ou None si le message a
+        été mis en file. Un CALL sans réponse dans son délai n'est pas mis en
+        file : CallTimeoutError est levée.
+
+        Un point de charge dont la dernière connexion a échoué ne retente pas
+        la connexion à chaque requête : le message est mis en file aussitôt.
+        Un message mis en file est toujours validé contre le schéma OCPP
+        (PayloadValidationError s'il n'est pas conforme), quelle que soit la
+        politique de validation.
+        """
+        if action in QUEUED_ACTIONS:
+            if self.depth(session.charge_point_id) or (session.connect_failures and not session.connected):
+                schema_validation.validate(action, "request", payload)
+                await self.enqueue(session.charge_point_id, action, payload)
+                return None
+        try:
+            return await session.call(action, payload)
+        except CallTimeoutError:
+            # Délai dépassé sur une connexion ouverte : le CALL a pu être reçu,
+            # le rejouer risquerait un doublon (504 pour l'appelant)
+            raise
+        except UPSTREAM_ERRORS as e:
+            if action not in QUEUED_ACTIONS:
+                raise
+            # Un message non conforme est refusé maintenant plutôt qu'au rejeu, où il bloquerait la file
+            schema_validation.validate(action, "request", payload)
+            logging.warning("Serveur central injoignable pour %s, %s mis en file: %s", session.charge_point_id, action, e)
+            await self.enqueue(session.charge_point_id, action, payload)
+            return None
+
+    async def drain(self, charge_point_id: str) -> int:
+        """
+        Rejoue dans l'ordre les messages en file d'un point de charge, au plus
+        `replay_rate` par seconde. S'arrête au premier échec de connexion ou
+        si la file de l'ordonnanceur est pleine ; la boucle de rejeu reprend
+        au prochain intervalle. Retourne le nombre de messages rejoués.
+        """
+        self._connect()
+        session = registry.get(charge_point_id)
+        interval = 1 / self.replay_rate if self.replay_rate > 0 else 0
+        replayed = 0
+        started = time.monotonic()
+        while True:
+            row = await asyncio.to_thread(self._peek, charge_point_id)
+            if row is None:
+                break
+            message_id, action, payload = row
+            if replayed:
+                await asyncio.sleep(interval)
+            try:
+                response = await session.call(action, json.loads(payload))
+            except UPSTREAM_ERRORS as e:
+                logging.warning("Rejeu interrompu pour %s, serveur central injoignable: %s", charge_point_id, e)
+                break
+            except QueueFullError as e:
+                logging.warning("Rejeu interrompu pour %s: %s", charge_point_id, e)
+                break
+            except Exception as e:
+                # Refus local (payload non conforme, ...) : le rejouer échouerait de même et bloquerait la file
+                logging.error("%s rejoué pour %s refusé (%s): %s", action, charge_point_id, e, payload)
+                self.rejected += 1
+            else:
+                if response.is_error:
+                    # Refus du serveur central : le rejouer ne donnerait pas d'autre résultat
+                    logging.error("%s rejoué pour %s refusé (%s): %s", action, charge_point_id, response.error_code, payload)
+                    self.rejected += 1
+            await asyncio.to_thread(self._delete, message_id)
+            self._discount(charge_point_id)
+            self.replayed += 1
+            replayed += 1
+        if replayed:
+            elapsed = time.monotonic() - started
+            self.drain_rate = round(replayed / elapsed, 1) if elapsed else float(replayed)
+            logging.info("%s message(s) rejoué(s) pour %s, %s restant(s)", replayed, charge_point_id, self.depth(charge_point_id))
+        return replayed
+
+    async def replay_pending(self):
+        """
+        Lance le rejeu de chaque point de charge ayant des messages en file.
+        En mode cluster, la file est partagée : chaque worker ne rejoue que
+        ses points de charge.
+        """
+        for charge_point_id in list(self._depth):
+            if not owns(charge_point_id):
+                continue
+            task = self._draining.get(charge_point_id)
+            if task is None or task.done():
+                self._draining[charge_point_id] = asyncio.create_task(self.drain(charge_point_id))
+
+    async def start(self):
+        self._connect()
+        if self._replayer is None or self._replayer.done():
+            self._replayer = asyncio.create_task(self._replay_loop())
+
+    async def close(self):
+        tasks = [task for task in (self._replayer, *self._draining.values()) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._replayer = None
+        self._draining.clear()
+        if self._writer is not None:
+            # Les messages acceptés sont écrits avant la fermeture
+            await asyncio.gather(self._writer, return_exceptions=True)
+            self._writer = None
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+            self._db = None
+
+    async def _replay_loop(self):
+        while True:
+            await self.replay_pending()
+            await asyncio.sleep(self.retry_interval)
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth(),
+            "by_charge_point": dict(self._depth),
+            "enqueued": self.enqueued,
+            "replayed": self.replayed,
+            "rejected": self.rejected,
+            "drain_rate_per_s": self.drain_rate,
+            "replay_rate_per_s": self.replay_rate,
+        }
+
+
+offline_queue = OfflineQueue()
+
+
+@router.get("/offline-queue", summary="État de la file hors ligne", description="Ce endpoint renvoie l'état de la file hors ligne des messages de transaction (StartTransaction, StopTransaction, MeterValues) conservés pendant une coupure du serveur central : profondeur totale et par point de charge, messages mis en file, rejoués et refusés au rejeu, débit du dernier rejeu et débit de rejeu configuré.")
+async def offline_queue_stats():
+    """
+    Renvoie la profondeur et le débit de rejeu de la file hors ligne.
+    """
+    return offline_queue.stats()
@@ -0,0 +1,247 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+from urllib.parse import quote
+
+from fastapi import APIRouter, Body, Path, Query, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
+
+from app.circuit_breaker import CircuitOpenError
+from app.cluster import forwarder, is_forwarded, owns, ring
+from app.codec import Frame
+from app.connection import ConnectionManager, connection_manager, WEBSOCKET_URL, CHARGE_POINT_ID
+from app.deadlines import CallTimeoutError, call_budget, call_deadline
+from app.env import load_dotenv
+from app.metrics import metrics
+from app.scheduler import CALL_PRIORITIES, CALL_QUEUE_SIZE, CALL_RATE_BURST, CALL_RATE_LIMIT, CENTRAL_RATE_LIMIT, NORMAL, QueueFullError, central_scheduler, wait_stats
+
+load_dotenv()
+
+# URL du serveur central sans l'identifiant du point de charge, déduite de
+# WEBSOCKET_URL_LOCALHOST (format SteVe : .../CentralSystemService/<id>)
+WEBSOCKET_BASE_URL = os.getenv("WEBSOCKET_BASE_URL") or (WEBSOCKET_URL.rsplit("/", 1)[0] if WEBSOCKET_URL else "")
+SESSION_IDLE_TIMEOUT = float(os.getenv("SESSION_IDLE_TIMEOUT", "300"))
+# Délai accordé aux CALL en cours pour recevoir leur réponse à l'arrêt de l'application
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "10"))
+
+router = APIRouter()
+
+
+class SessionRegistry:
+    """
+    Registre des sessions OCPP, une par point de charge.
+
+    Les sessions sont créées à la première requête qui cible un point de
+    charge, puis fermées et retirées du registre après `idle_timeout`
+    secondes sans appel. Les sessions épinglées (le point de charge par
+    défaut) ne sont jamais évincées.
+    """
+
+    def __init__(self, base_url: str = WEBSOCKET_BASE_URL, idle_timeout: float = SESSION_IDLE_TIMEOUT, drain_timeout: float = SHUTDOWN_DRAIN_TIMEOUT):
+        self.base_url = base_url
+        self.idle_timeout = idle_timeout
+        self.drain_timeout = drain_timeout
+        self._sessions = {}
+        self._pinned = set()
+        self._evictor = None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, charge_point_id: str):
+        return charge_point_id in self._sessions
+
+    def sessions(self):
+        return list(self._sessions.values())
+
+    def pin(self, session: ConnectionManager):
+        """Ajoute une session qui ne sera jamais évincée."""
+        self._sessions[session.charge_point_id] = session
+        self._pinned.add(session.charge_point_id)
+
+    def get(self, charge_point_id: str) -> ConnectionManager:
+        """Retourne la session du point de charge, en la créant au besoin."""
+        session = self._sessions.get(charge_point_id)
+        if session is None:
+            session = ConnectionManager(f"{self.base_url}/{quote(charge_point_id, safe='')}", charge_point_id)
+            self._sessions[charge_point_id] = session
+        return session
+
+    async def call(self, charge_point_id: str, action: str, payload: dict) -> Frame:
+        """
+        Envoie un CALL à un point de charge quel que soit le worker qui le
+        gère : sur place s'il appartient au worker courant, sinon par le
+        worker propriétaire, sans ouvrir ici une seconde connexion.
+        """
+        if owns(charge_point_id):
+            return await self.get(charge_point_id).call(action, payload)
+        worker = ring.owner(charge_point_id)
+        headers = {}
+        deadline = call_deadline.get()
+        if deadline is not None:
+            # L'échéance de la requête HTTP suit le CALL jusqu'au worker propriétaire
+            headers["X-Deadline-Ms"] = str(max((deadline - time.monotonic()) * 1000, 1))
+        response = await forwarder.request(worker, "POST", "/cluster/call", json={"cp_id": charge_point_id, "action": action, "payload": payload}, headers=headers)
+        content = response.json()
+        if response.status_code == 200:
+            return Frame.from_list(content["frame"])
+        # Mêmes erreurs que pour un CALL local, pour que l'appelant les traite de la même façon
+        retry_after = float(response.headers.get("Retry-After", "1"))
+        if response.status_code == 503:
+            raise CircuitOpenError(f"{self.base_url}/{quote(charge_point_id, safe='')}", retry_after)
+        if response.status_code == 504:
+            raise CallTimeoutError(action, call_budget(action))
+        if response.status_code == 429:
+            raise QueueFullError(charge_point_id, CALL_PRIORITIES.get(action, NORMAL), retry_after)
+        raise ConnectionError(f"Worker {worker}: {content.get('error', response.status_code)}")
+
+    async def evict_idle(self):
+        """Ferme les sessions inactives depuis plus de `idle_timeout` secondes."""
+        deadline = time.monotonic() - self.idle_timeout
+        idle = [
+            session for charge_point_id, session in self._sessions.items()
+            if charge_point_id not in self._pinned and session.last_used < deadline and session.pending_calls == 0
+        ]
+        for session in idle:
+            del self._sessions[session.charge_point_id]
+            await session.close()
+        if idle:
+            logging.info("%s session(s) inactive(s) fermée(s), %s restante(s)", len(idle), len(self._sessions))
+
+    async def start(self):
+        for charge_point_id in self._pinned:
+            # En mode cluster, seul le worker propriétaire garde la connexion ouverte
+            if owns(charge_point_id):
+                await self._sessions[charge_point_id].start()
+        if self._evictor is None or self._evictor.done():
+            self._evictor = asyncio.create_task(self._evict_loop())
+
+    def pending_calls(self) -> int:
+        return sum(session.pending_calls for session in self._sessions.values())
+
+    async def drain(self, timeout: Optional[float] = None) -> int:
+        """
+        Attend que les CALL en cours aient reçu leur réponse, au plus
+        `timeout` secondes (`drain_timeout` par défaut). Retourne le nombre
+        de CALL encore en attente à l'échéance.
+        """
+        deadline = time.monotonic() + (self.drain_timeout if timeout is None else timeout)
+        pending = self.pending_calls()
+        if pending:
+            logging.info("Arrêt : attente de %s CALL en cours", pending)
+        while pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            pending = self.pending_calls()
+        if pending:
+            logging.warning("Arrêt : %s CALL sans réponse abandonné(s)", pending)
+        return pending
+
+    async def close(self):
+        if self._evictor is not None:
+            self._evictor.cancel()
+            try:
+                await self._evictor
+            except asyncio.CancelledError:
+                pass
+            self._evictor = None
+        await asyncio.gather(*(session.close() for session in self._sessions.values()))
+
+    async def _evict_loop(self):
+        while True:
+            await asyncio.sleep(max(self.idle_timeout / 2, 1))
+            await self.evict_idle()
+
+
+registry = SessionRegistry()
+registry.pin(connection_manager)
+
+metrics.gauge(
+    "ocpp_sessions", "Sessions OCPP du registre, une par point de charge", function=lambda: len(registry)
+)
+metrics.gauge(
+    "ocpp_upstream_connections", "Connexions WebSocket ouvertes vers le serveur central",
+    function=lambda: sum(session.connected for session in registry.sessions()),
+)
+metrics.gauge(
+    "ocpp_pending_calls", "CALL OCPP envoyés en attente de réponse",
+    function=registry.pending_calls,
+)
+
+
+class ClusterCall(BaseModel):
+    cp_id: str = Field(..., description="Identifiant du point de charge")
+    action: str = Field(..., description="Action OCPP")
+    payload: dict = Field(default_factory=dict, description="Payload du CALL")
+
+
+@router.post("/cluster/call", include_in_schema=False)
+async def cluster_call(request: Request, call: ClusterCall = Body(...)):
+    """
+    Route interne du mode cluster : CALL transmis par `SessionRegistry.call`
+    d'un autre worker, envoyé par la session locale du point de charge.
+    """
+    if not is_forwarded(request.headers):
+        return JSONResponse(status_code=403, content={"error": "Route réservée aux workers du cluster"})
+    try:
+        frame = await registry.get(call.cp_id).call(call.action, call.payload)
+    except (CircuitOpenError, CallTimeoutError, QueueFullError):
+        # Converties en 503/504/429 par les gestionnaires de l'application
+        raise
+    except Exception as e:
+        return JSONResponse(status_code=502, content={"error": str(e)})
+    return {"frame": frame.to_list()}
+
+
+def charge_point_path(cp_id: str = Path(..., description="Identifiant du point de charge")):
+    """Documente le paramètre `cp_id` des routes `/charge-points/{cp_id}/...`."""
+    return cp_id
+
+
+def get_session(request: Request) -> ConnectionManager:
+    """
+    Dépendance FastAPI : session du point de charge ciblé par la requête.
+
+    Les routes préfixées par `/charge-points/{cp_id}` utilisent la session de
+    ce point de charge ; les routes historiques celle de `CHARGE_POINT_ID`.
+    """
+    return registry.get(request.path_params.get("cp_id", CHARGE_POINT_ID))
+
+
+@router.get("/circuit-breakers", summary="État des disjoncteurs vers le serveur central", description="Ce endpoint renvoie, pour chaque session OCPP ouverte, l'état du disjoncteur de sa liaison avec le serveur central : `closed` (connexions normales), `open` (appels refusés aussitôt avec un statut 503 jusqu'à la prochaine tentative de reconnexion) ou `half_open` (une tentative en cours), ainsi que le nombre d'échecs consécutifs, le délai avant la prochaine tentative et les dernières transitions.")
+async def circuit_breakers(
+    state: Optional[str] = Query(None, description="Filtrer sur un état (closed, open, half_open)")
+):
+    """
+    Renvoie l'état du disjoncteur de chaque session OCPP.
+
+    - **state**: (Optionnel) État recherché
+    """
+    return [
+        {"chargePointId": session.charge_point_id, "connected": session.connected, **session.breaker.as_dict()}
+        for session in registry.sessions()
+        if state is None or session.breaker.state == state
+    ]
+
+
+@router.get("/scheduler", summary="Files d'attente des CALL OCPP", description="Ce endpoint renvoie la configuration de l'ordonnanceur des CALL sortants (débit maximal et rafale par point de charge, débit maximal vers le serveur central, taille des files) et, pour chaque classe de priorité (`critical` : arrêt de charge et déverrouillage, `transaction` : démarrage et autorisation, `normal`, `bulk` : configuration et diagnostics), le nombre de CALL, ceux qui ont attendu leur tour, ceux refusés avec un statut 429, le temps d'attente moyen et maximal et le nombre de CALL actuellement en file.")
+async def scheduler_stats():
+    """
+    Renvoie la configuration de l'ordonnanceur et l'attente par classe de priorité.
+    """
+    sessions = registry.sessions()
+    return {
+        "rate_limit": CALL_RATE_LIMIT,
+        "burst": CALL_RATE_BURST,
+        "central_rate_limit": CENTRAL_RATE_LIMIT,
+        "queue_size": CALL_QUEUE_SIZE,
+        "priorities": {
+            priority: {
+                **stats.as_dict(),
+                "waiting": sum(session.scheduler.depth(priority) for session in sessions) + central_scheduler.depth(priority),
+            }
+            for priority, stats in wait_stats.items()
+        },
+    }
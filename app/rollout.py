@@ -0,0 +1,348 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, Body, Path, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+
+from app.batch import BATCH_MAX_CONCURRENCY, fan_out
+from app.cluster import forwarder, other_workers
+from app.config_cache import configuration_cache
+from app.env import load_dotenv
+from app.offline_queue import UPSTREAM_ERRORS
+from app.registry import registry
+from app.scheduler import QueueFullError
+
+load_dotenv()
+
+# Points de charge traités simultanément par un déploiement de configuration
+ROLLOUT_CONCURRENCY = int(os.getenv("ROLLOUT_CONCURRENCY", "20"))
+# Tentatives par CALL en cas d'erreur de transport (délai dépassé, connexion, 429/503), et délai initial entre deux tentatives
+ROLLOUT_MAX_ATTEMPTS = int(os.getenv("ROLLOUT_MAX_ATTEMPTS", "3"))
+ROLLOUT_RETRY_DELAY = float(os.getenv("ROLLOUT_RETRY_DELAY", "1"))
+# Déploiements terminés conservés pour consultation
+ROLLOUT_HISTORY = int(os.getenv("ROLLOUT_HISTORY", "50"))
+
+# Réponses ChangeConfiguration définitives : elles ne sont pas retentées
+APPLIED_STATUSES = {"Accepted", "RebootRequired"}
+
+# Erreurs de transport retentées (serveur central injoignable, délai dépassé, file de l'ordonnanceur pleine) ;
+# un CALLERROR du point de charge ou toute autre erreur fait échouer le point de charge aussitôt
+RETRIED_ERRORS = UPSTREAM_ERRORS + (QueueFullError,)
+
+router = APIRouter()
+
+
+class RolloutTargets(BaseModel):
+    cp_ids: List[str] = Field(default_factory=list, description="Points de charge ciblés")
+    prefix: Optional[str] = Field(None, description="Cibler aussi les points de charge connus dont l'identifiant commence par ce préfixe")
+
+class RolloutRequest(BaseModel):
+    configuration: Dict[str, str] = Field(..., description="Clés de configuration et valeurs souhaitées", example={"HeartbeatInterval": "600"})
+    targets: RolloutTargets = Field(..., description="Sélection des points de charge")
+    concurrency: Optional[int] = Field(None, ge=1, description="Nombre maximal de points de charge traités simultanément")
+    refresh: bool = Field(False, description="Relire la configuration auprès de chaque point de charge, même si elle est en cache")
+
+
+class RolloutError(Exception):
+    """Échec d'un CALL après toutes ses tentatives."""
+
+
+def known_charge_points() -> List[str]:
+    """Points de charge connus du worker : sessions ouvertes et configurations en cache."""
+    return sorted({session.charge_point_id for session in registry.sessions()} | set(configuration_cache.charge_point_ids()))
+
+
+async def select_targets(targets: RolloutTargets) -> List[str]:
+    selected = dict.fromkeys(targets.cp_ids)
+    if targets.prefix is not None:
+        known = set(known_charge_points())
+        # En mode cluster, chaque worker ne connaît que ses propres points de charge
+        for charge_point_ids in await forwarder.gather(other_workers(), "GET", "/cluster/charge-points"):
+            known.update(charge_point_ids)
+        selected.update(dict.fromkeys(cp_id for cp_id in sorted(known) if cp_id.startswith(targets.prefix)))
+    return list(selected)
+
+
+class RolloutJob:
+    """
+    Déploiement d'un ensemble de clés de configuration sur une sélection de
+    points de charge.
+
+    Pour chaque point de charge, la configuration actuelle est lue (depuis le
+    cache de configuration si elle y est complète et à jour, sinon par un
+    GetConfiguration limité aux clés visées), puis un ChangeConfiguration
+    n'est envoyé que pour les clés dont la valeur diffère. Les erreurs de
+    transport sont retentées avec un délai exponentiel ; un refus du point de
+    charge (`Rejected`, `NotSupported`) est définitif.
+    """
+
+    def __init__(self, configuration: Dict[str, str], targets: List[str], concurrency: int, refresh: bool = False,
+                 max_attempts: int = ROLLOUT_MAX_ATTEMPTS, retry_delay: float = ROLLOUT_RETRY_DELAY):
+        self.id = uuid.uuid4().hex[:12]
+        self.configuration = configuration
+        self.targets = targets
+        self.concurrency = concurrency
+        self.refresh = refresh
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.state = "pending"
+        self.created_at = time.time()
+        self.finished_at = None
+        self.retries = 0
+        # Résultats par point de charge, dans l'ordre d'achèvement
+        self.results = []
+        self._counts = {}
+        self._task = None
+        self._updated = None
+
+    @property
+    def done(self) -> bool:
+        return self.state in ("completed", "cancelled")
+
+    def start(self):
+        self._updated = asyncio.Event()
+        self.state = "running"
+        self._task = asyncio.create_task(self._run())
+
+    async def cancel(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if not self.done:
+            # Annulé avant d'avoir démarré
+            self.state = "cancelled"
+            self.finished_at = time.time()
+            self._notify()
+
+    async def _run(self):
+        try:
+            async for result in fan_out(self.targets, self._apply, self.concurrency):
+                self.results.append(result)
+                self._counts[result["status"]] = self._counts.get(result["status"], 0) + 1
+                self._notify()
+            self.state = "completed"
+        except asyncio.CancelledError:
+            self.state = "cancelled"
+        finally:
+            self.finished_at = time.time()
+            self._notify()
+            logging.info("Déploiement de configuration %s %s : %s", self.id, self.state, self._counts)
+
+    def _notify(self):
+        # Réveille les flux en cours ; chaque attente repart d'un nouvel événement
+        updated, self._updated = self._updated, asyncio.Event()
+        updated.set()
+
+    async def wait(self, seen: int):
+        """Attend un résultat au-delà des `seen` premiers, ou la fin du déploiement."""
+        while len(self.results) == seen and not self.done:
+            await self._updated.wait()
+
+    async def _call(self, charge_point_id: str, action: str, payload: dict):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                # Envoyé par le worker propriétaire du point de charge en mode cluster
+                response = await registry.call(charge_point_id, action, payload)
+            except RETRIED_ERRORS as e:
+                error = str(e) or type(e).__name__
+            except Exception as e:
+                raise RolloutError(f"{action} : {str(e) or type(e).__name__}") from e
+            else:
+                if response.is_error:
+                    raise RolloutError(f"{action} : {response.error_code}: {response.error_description}")
+                return response.payload
+            if attempt < self.max_attempts:
+                self.retries += 1
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+        raise RolloutError(f"{action} : {error}")
+
+    async def _current(self, charge_point_id: str) -> Dict[str, dict]:
+        keys = list(self.configuration)
+        cached = None if self.refresh else configuration_cache.lookup(charge_point_id, keys)
+        if cached is not None:
+            configuration_keys = cached[0]
+        else:
+            # La réponse alimente aussi le cache de configuration (observateur GetConfiguration)
+            configuration_keys = (await self._call(charge_point_id, "GetConfiguration", {"key": keys})).get("configurationKey") or []
+        return {configuration_key["key"]: configuration_key for configuration_key in configuration_keys}
+
+    async def _apply(self, charge_point_id: str) -> dict:
+        started = time.perf_counter()
+        result = {"cp_id": charge_point_id, "changed": {}, "unchanged": [], "skipped": {}}
+        try:
+            current = await self._current(charge_point_id)
+            for key, value in self.configuration.items():
+                known = current.get(key)
+                if known is None:
+                    result["skipped"][key] = "UnknownKey"
+                elif known.get("value") == value:
+                    result["unchanged"].append(key)
+                elif known.get("readonly"):
+                    result["skipped"][key] = "ReadOnly"
+                else:
+                    response = await self._call(charge_point_id, "ChangeConfiguration", {"key": key, "value": value})
+                    result["changed"][key] = response.get("status")
+            refused = result["skipped"] or any(status not in APPLIED_STATUSES for status in result["changed"].values())
+            result["status"] = "failed" if refused else "changed" if result["changed"] else "unchanged"
+        except Exception as e:
+            logging.warning("Déploiement de configuration %s : échec pour %s: %s", self.id, charge_point_id, e)
+            result["status"] = "failed"
+            result["error"] = str(e)
+        result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        return result
+
+    def as_dict(self, results: bool = False) -> dict:
+        summary = {
+            "id": self.id,
+            "state": self.state,
+            "configuration": self.configuration,
+            "targets": len(self.targets),
+            "completed": len(self.results),
+            "changed": self._counts.get("changed", 0),
+            "unchanged": self._counts.get("unchanged", 0),
+            "failed": self._counts.get("failed", 0),
+            "retries": self.retries,
+            "concurrency": self.concurrency,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+        if results:
+            summary["results"] = self.results
+        return summary
+
+
+class RolloutRegistry:
+    """Déploiements en cours et derniers déploiements terminés."""
+
+    def __init__(self, history: int = ROLLOUT_HISTORY):
+        self.history = history
+        self._jobs = OrderedDict()
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def start(self, job: RolloutJob) -> RolloutJob:
+        self._jobs[job.id] = job
+        finished = [job_id for job_id, other in self._jobs.items() if other.done]
+        for job_id in finished[:max(len(finished) - self.history, 0)]:
+            del self._jobs[job_id]
+        job.start()
+        return job
+
+    def get(self, job_id: str) -> RolloutJob:
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise LookupError(f"Déploiement {job_id} inconnu")
+        return job
+
+    def jobs(self) -> List[RolloutJob]:
+        return list(self._jobs.values())
+
+    async def close(self):
+        await asyncio.gather(*(job.cancel() for job in self._jobs.values()))
+
+
+rollouts = RolloutRegistry()
+
+
+@router.get("/cluster/charge-points", include_in_schema=False)
+async def cluster_charge_points():
+    """Route interne du mode cluster : points de charge connus de ce worker."""
+    return known_charge_points()
+
+
+@router.post("/rollouts", summary="Déployer une configuration sur plusieurs points de charge", description="Ce endpoint lance un déploiement de configuration : les clés et valeurs souhaitées sont appliquées aux points de charge sélectionnés (liste explicite et/ou préfixe d'identifiant parmi les points de charge connus). La configuration actuelle de chaque point de charge est lue depuis le cache de configuration ou par `GetConfiguration`, et `ChangeConfiguration` n'est envoyé que pour les clés dont la valeur diffère. Au plus `concurrency` points de charge sont traités simultanément, et les CALL de configuration passent après les autres dans les files de l'ordonnanceur (classe `bulk`). Les erreurs de transport sont retentées. Le déploiement se poursuit en arrière-plan ; son avancement se consulte avec `GET /rollouts/{rollout_id}` ou se suit avec `GET /rollouts/{rollout_id}/stream`.")
+async def create_rollout(
+    request: RolloutRequest = Body(..., description="Configuration souhaitée et points de charge ciblés")
+):
+    """
+    Lance un déploiement de configuration et renvoie son état initial.
+
+    - **configuration**: Clés de configuration et valeurs souhaitées
+    - **targets**: Points de charge ciblés (`cp_ids`) et/ou préfixe d'identifiant (`prefix`)
+    - **concurrency**: (Optionnel) Nombre maximal de points de charge traités simultanément
+    - **refresh**: Ignorer la configuration en cache
+    """
+    try:
+        targets = await select_targets(request.targets)
+        if not targets:
+            return {"error": "Aucun point de charge ne correspond à la sélection"}
+        concurrency = min(request.concurrency or ROLLOUT_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+        return rollouts.start(RolloutJob(request.configuration, targets, concurrency, request.refresh)).as_dict()
+    except Exception as e:
+        logging.error("Erreur lors du lancement du déploiement de configuration: %s", e)
+        return {"error": str(e)}
+
+
+@router.get("/rollouts", summary="Lister les déploiements de configuration", description="Ce endpoint renvoie l'état des déploiements de configuration en cours et des derniers déploiements terminés : nombre de points de charge ciblés, traités, modifiés, déjà conformes et en échec, et nombre de nouvelles tentatives.")
+async def list_rollouts():
+    """
+    Renvoie l'état des déploiements de configuration.
+    """
+    return [job.as_dict() for job in rollouts.jobs()]
+
+
+@router.get("/rollouts/{rollout_id}", summary="Avancement d'un déploiement de configuration", description="Ce endpoint renvoie l'état d'un déploiement de configuration et le résultat de chaque point de charge déjà traité : clés modifiées et statut de la réponse `ChangeConfiguration`, clés déjà conformes, clés ignorées (inconnues ou en lecture seule) et erreur éventuelle.")
+async def get_rollout(
+    rollout_id: str = Path(..., description="Identifiant du déploiement"),
+    results: bool = Query(True, description="Inclure le résultat de chaque point de charge")
+):
+    """
+    Renvoie l'avancement d'un déploiement.
+
+    - **rollout_id**: Identifiant du déploiement
+    - **results**: Inclure le résultat de chaque point de charge
+    """
+    try:
+        return rollouts.get(rollout_id).as_dict(results)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@router.get("/rollouts/{rollout_id}/stream", summary="Suivre un déploiement de configuration", description="Ce endpoint diffuse au format NDJSON le résultat de chaque point de charge au fil du déploiement (y compris ceux déjà traités), puis une dernière ligne avec l'état final du déploiement.")
+async def stream_rollout(rollout_id: str = Path(..., description="Identifiant du déploiement")):
+    """
+    Diffuse les résultats d'un déploiement au format NDJSON.
+
+    - **rollout_id**: Identifiant du déploiement
+    """
+    try:
+        job = rollouts.get(rollout_id)
+    except Exception as e:
+        return {"error": str(e)}
+
+    async def lines():
+        sent = 0
+        while True:
+            results = job.results[sent:]
+            sent += len(results)
+            for result in results:
+                yield json.dumps(result) + "\n"
+            if job.done and sent == len(job.results):
+                break
+            await job.wait(sent)
+        yield json.dumps(job.as_dict()) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.delete("/rollouts/{rollout_id}", summary="Annuler un déploiement de configuration", description="Ce endpoint interrompt un déploiement de configuration en cours. Les points de charge déjà traités gardent leur nouvelle configuration ; les autres ne sont pas modifiés.")
+async def cancel_rollout(rollout_id: str = Path(..., description="Identifiant du déploiement")):
+    """
+    Annule un déploiement en cours.
+
+    - **rollout_id**: Identifiant du déploiement
+    """
+    try:
+        job = rollouts.get(rollout_id)
+        await job.cancel()
+        return job.as_dict()
+    except Exception as e:
+        return {"error": str(e)}
@@ -0,0 +1,233 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Optional
+
+from app.env import load_dotenv
+from app.metrics import LATENCY_BUCKETS, metrics
+
+load_dotenv()
+
+# Débit maximal de CALL vers un même point de charge (CALL par seconde, 0 : illimité) et rafale tolérée
+CALL_RATE_LIMIT = float(os.getenv("CALL_RATE_LIMIT", "10"))
+CALL_RATE_BURST = float(os.getenv("CALL_RATE_BURST", "20"))
+# Débit maximal de CALL vers le serveur central, tous points de charge confondus (0 : illimité)
+CENTRAL_RATE_LIMIT = float(os.getenv("CENTRAL_RATE_LIMIT", "0"))
+CENTRAL_RATE_BURST = float(os.getenv("CENTRAL_RATE_BURST", "100"))
+# CALL en attente par point de charge et par classe de priorité au-delà desquels la requête est refusée (429)
+CALL_QUEUE_SIZE = int(os.getenv("CALL_QUEUE_SIZE", "50"))
+
+# Classes de priorité, de la plus urgente à la moins urgente
+CRITICAL = "critical"
+TRANSACTION = "transaction"
+NORMAL = "normal"
+BULK = "bulk"
+PRIORITY_CLASSES = (CRITICAL, TRANSACTION, NORMAL, BULK)
+
+# Classe de chaque action ; CALL_PRIORITIES les complète ou les remplace,
+# au format "DataTransfer=bulk,Reset=critical". Les autres actions sont en "normal".
+DEFAULT_CALL_PRIORITIES = {
+    # Sécurité : libérer un câble ou couper une charge ne doit jamais attendre
+    "RemoteStopTransaction": CRITICAL,
+    "UnlockConnector": CRITICAL,
+    "StopTransaction": CRITICAL,
+    "RemoteStartTransaction": TRANSACTION,
+    "StartTransaction": TRANSACTION,
+    "Authorize": TRANSACTION,
+    "GetConfiguration": BULK,
+    "ChangeConfiguration": BULK,
+    "GetDiagnostics": BULK,
+    "UpdateFirmware": BULK,
+    "GetLocalListVersion": BULK,
+    "SendLocalList": BULK,
+}
+
+
+def parse_call_priorities(value: str) -> dict:
+    priorities = dict(DEFAULT_CALL_PRIORITIES)
+    for item in filter(None, value.split(",")):
+        action, _, priority = item.partition("=")
+        if priority.strip() not in PRIORITY_CLASSES:
+            raise ValueError(f"Classe de priorité inconnue pour {action.strip()}: {priority.strip()}")
+        priorities[action.strip()] = priority.strip()
+    return priorities
+
+
+CALL_PRIORITIES = parse_call_priorities(os.getenv("CALL_PRIORITIES", ""))
+
+queue_wait = metrics.histogram(
+    "ocpp_call_queue_wait_seconds", "Attente des CALL OCPP avant envoi (limite de débit), par classe de priorité", ("priority",), buckets=(0,) + LATENCY_BUCKETS
+)
+queue_rejected = metrics.counter(
+    "ocpp_call_queue_rejected_total", "CALL OCPP refusés (429) car la file de leur classe de priorité était pleine", ("priority",)
+)
+
+
+class QueueFullError(Exception):
+    """La file de la classe de priorité est pleine : le CALL est refusé sans être envoyé."""
+
+    def __init__(self, name: str, priority: str, retry_after: float):
+        super().__init__(f"Trop de CALL {priority} en attente pour {name}, nouvelle tentative dans {retry_after:.1f} s")
+        self.priority = priority
+        self.retry_after = retry_after
+
+
+class WaitStats:
+    """Attente cumulée des CALL d'une classe de priorité, tous points de charge confondus."""
+
+    __slots__ = ("calls", "queued", "rejected", "total_wait", "max_wait")
+
+    def __init__(self):
+        self.calls = 0
+        self.queued = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, priority: str, wait: float):
+        self.calls += 1
+        if wait > 0:
+            self.queued += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+        queue_wait.observe(wait, priority)
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "average_wait_ms": round(self.total_wait / self.calls * 1000, 3) if self.calls else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 3),
+        }
+
+
+wait_stats = {priority: WaitStats() for priority in PRIORITY_CLASSES}
+
+
+class CallScheduler:
+    """
+    Limiteur de débit à seau de jetons, avec files par classe de priorité.
+
+    Chaque CALL consomme un jeton ; le seau se remplit de `rate` jetons par
+    seconde jusqu'à `burst`. Sans jeton disponible, le CALL attend dans la
+    file de sa classe, et les files sont servies de la plus urgente à la
+    moins urgente : un `RemoteStopTransaction` passe devant tous les
+    `GetConfiguration` en attente. Une file pleine refuse le CALL
+    (QueueFullError, 429).
+    """
+
+    __slots__ = ("name", "rate", "burst", "max_queue", "tokens", "updated", "_loop", "_queues", "_waker")
+
+    def __init__(self, name: str, rate: float = CALL_RATE_LIMIT, burst: float = CALL_RATE_BURST, max_queue: int = CALL_QUEUE_SIZE):
+        self.name = name
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_queue = max_queue
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._loop = None
+        self._queues = None
+        self._waker = None
+
+    def depth(self, priority: Optional[str] = None) -> int:
+        if not self._queues:
+            return 0
+        if priority is not None:
+            return len(self._queues.get(priority, ()))
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.tokens + (now - self.updated) * self.rate, self.burst)
+        self.updated = now
+
+    def _ahead(self, priority: str) -> bool:
+        """Indique si des CALL de même priorité ou plus urgents attendent déjà."""
+        if not self._queues:
+            return False
+        for other in PRIORITY_CLASSES:
+            if self._queues.get(other):
+                return True
+            if other == priority:
+                return False
+        return False
+
+    async def acquire(self, priority: str) -> float:
+        """Attend un jeton dans la file de `priority` et retourne le temps d'attente."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        if self.tokens >= 1 and not self._ahead(priority):
+            self.tokens -= 1
+            return 0.0
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Les files et le réveil sont liés à la boucle asyncio qui les a créés
+            self._loop = loop
+            self._queues = None
+            self._waker = None
+        if self._queues is None:
+            self._queues = {}
+        queue = self._queues.setdefault(priority, deque())
+        if len(queue) >= self.max_queue:
+            wait_stats[priority].rejected += 1
+            queue_rejected.inc(priority)
+            raise QueueFullError(self.name, priority, math.ceil(self.depth() / self.rate) or 1)
+        future = loop.create_future()
+        queue.append(future)
+        started = time.monotonic()
+        self._schedule()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if not future.done() or future.cancelled():
+                # Abandonné dans la file (délai dépassé) : sa place est libérée
+                if future in queue:
+                    queue.remove(future)
+            else:
+                # Jeton accordé mais jamais utilisé : il est rendu
+                self.tokens = min(self.tokens + 1, self.burst)
+                self._dispatch()
+            raise
+        return time.monotonic() - started
+
+    def _schedule(self):
+        if self._waker is None and self.depth():
+            delay = max((1 - self.tokens) / self.rate, 0)
+            self._waker = self._loop.call_later(delay, self._dispatch)
+
+    def _dispatch(self):
+        if self._waker is not None:
+            self._waker.cancel()
+            self._waker = None
+        self._refill()
+        for priority in PRIORITY_CLASSES:
+            queue = self._queues.get(priority) if self._queues else None
+            while queue and self.tokens >= 1:
+                future = queue.popleft()
+                if future.done():
+                    continue
+                self.tokens -= 1
+                future.set_result(None)
+            if queue:
+                # Les classes moins urgentes attendent derrière celle-ci
+                break
+        self._schedule()
+
+
+central_scheduler = CallScheduler("le serveur central", CENTRAL_RATE_LIMIT, CENTRAL_RATE_BURST, CALL_QUEUE_SIZE * len(PRIORITY_CLASSES))
+
+
+async def schedule(scheduler: CallScheduler, action: str):
+    """
+    Attend que `action` puisse être envoyée : limite du point de charge
+    (`scheduler`) puis limite globale vers le serveur central.
+    """
+    priority = CALL_PRIORITIES.get(action, NORMAL)
+    wait = await scheduler.acquire(priority)
+    if central_scheduler.rate > 0:
+        wait += await central_scheduler.acquire(priority)
+    wait_stats[priority].record(priority, wait)
@@ -0,0 +1,49 @@
+"""
+Lancement de l'API en production.
+
+    python -m app.serve --host 0.0.0.0 --port 8001
+
+Utilise uvloop et httptools s'ils sont installés. À la réception de SIGTERM
+(arrêt du conteneur, déploiement progressif), uvicorn cesse d'accepter de
+nouvelles connexions, laisse les requêtes en cours se terminer, puis
+l'application attend la réponse des CALL OCPP encore en attente : chacune
+de ces deux étapes dure au plus `SHUTDOWN_DRAIN_TIMEOUT` secondes.
+"""
+import argparse
+import importlib.util
+import os
+
+
+def available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lance l'API OCPP en production")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8001")))
+    parser.add_argument("--log-level", default=os.getenv("UVICORN_LOG_LEVEL", "warning"), help="Niveau de log d'uvicorn")
+    parser.add_argument("--drain-timeout", type=float, default=float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "10")),
+                        help="Délai accordé aux requêtes et CALL en cours à l'arrêt, en secondes")
+    args = parser.parse_args()
+    # Lu par app.registry à l'import de l'application
+    os.environ["SHUTDOWN_DRAIN_TIMEOUT"] = str(args.drain_timeout)
+
+    import uvicorn
+
+    uvicorn.run(
+        "app.main:app",
+        host=args.host,
+        port=args.port,
+        loop="uvloop" if available("uvloop") else "asyncio",
+        http="httptools" if available("httptools") else "h11",
+        log_level=args.log_level,
+        # Le journal d'accès par requête coûte plus cher qu'il ne renseigne : /metrics le remplace
+        access_log=False,
+        timeout_graceful_shutdown=args.drain_timeout,
+        proxy_headers=True,
+    )
+
+
+if __name__ == "__main__":
+    main()
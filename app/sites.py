@@ -0,0 +1,392 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from typing import List, Optional
+
+from fastapi import APIRouter, Body, Path
+from pydantic import BaseModel, Field
+
+from app.batch import BATCH_CONCURRENCY, fan_out
+from app.cluster import owns, ring
+from app.connection import observe
+from app.env import load_dotenv
+from app.metrics import metrics
+from app.registry import registry
+
+load_dotenv()
+
+# Intervalle du recalcul périodique de chaque site, qui suit les variations de consommation (MeterValues)
+SITE_REBALANCE_INTERVAL = float(os.getenv("SITE_REBALANCE_INTERVAL", "30"))
+# Écart minimal, en watts, entre la nouvelle limite et celle en vigueur pour envoyer un SetChargingProfile
+SITE_LIMIT_THRESHOLD_W = float(os.getenv("SITE_LIMIT_THRESHOLD_W", "100"))
+# Puissance minimale par défaut d'une charge (6 A en monophasé) : en dessous, la charge est mise en pause
+SITE_MIN_POWER_W = float(os.getenv("SITE_MIN_POWER_W", "1380"))
+# Identifiant du profil de charge posé par l'équilibrage, remplacé à chaque nouvelle limite
+SITE_CHARGING_PROFILE_ID = int(os.getenv("SITE_CHARGING_PROFILE_ID", "100"))
+SITE_PUSH_CONCURRENCY = int(os.getenv("SITE_PUSH_CONCURRENCY", str(BATCH_CONCURRENCY)))
+
+router = APIRouter()
+
+rebalance_duration = metrics.histogram(
+    "site_rebalance_duration_seconds", "Durée du calcul de la répartition de puissance d'un site", buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+)
+profiles_pushed = metrics.counter(
+    "site_charging_profiles_total", "SetChargingProfile envoyés par l'équilibrage de charge, par résultat", ("result",)
+)
+
+
+class SiteConnector(BaseModel):
+    cp_id: str = Field(..., description="Identifiant du point de charge")
+    connector_id: int = Field(1, ge=1, description="Identifiant du connecteur")
+    max_power_w: float = Field(..., gt=0, description="Puissance maximale du connecteur (W)")
+    min_power_w: Optional[float] = Field(None, ge=0, description="Puissance minimale d'une charge (W), SITE_MIN_POWER_W par défaut")
+    priority: float = Field(1, gt=0, description="Poids de la session dans le partage de la puissance disponible")
+
+class SiteRequest(BaseModel):
+    grid_limit_w: float = Field(..., ge=0, description="Puissance disponible pour le site (W)")
+    connectors: List[SiteConnector] = Field(..., description="Connecteurs du site")
+
+class ConnectorUpdate(BaseModel):
+    priority: Optional[float] = Field(None, gt=0, description="Poids de la session")
+    ev_max_power_w: Optional[float] = Field(None, gt=0, description="Puissance maximale acceptée par le véhicule (W)")
+
+
+class SiteRegistry:
+    """
+    Équilibrage de charge des sites : chaque site partage sa puissance
+    disponible entre ses connecteurs en charge.
+
+    L'état des connecteurs est tenu en colonnes NumPy (`app.allocation`) ;
+    un début ou une fin de transaction demande un recalcul, regroupé avec
+    les autres demandes du même site, et une tâche de fond recalcule chaque
+    site toutes les `interval` secondes. Seules les limites qui changent d'au
+    moins `threshold` watts sont envoyées (SetChargingProfile).
+    """
+
+    def __init__(self, interval: float = SITE_REBALANCE_INTERVAL, threshold: float = SITE_LIMIT_THRESHOLD_W, concurrency: int = SITE_PUSH_CONCURRENCY):
+        self.interval = interval
+        self.threshold = threshold
+        self.concurrency = concurrency
+        self._sites = {}
+        # (point de charge, connecteur) et (point de charge, transaction) -> (site, indice)
+        self._connectors = {}
+        self._transactions = {}
+        self._stats = {}
+        self._dirty = set()
+        self._wakeup = None
+        self._worker = None
+
+    def __len__(self):
+        return len(self._sites)
+
+    def configure(self, site_id: str, grid_limit_w: float, connectors: List[SiteConnector]):
+        """Crée ou remplace un site ; les sessions en cours sur ses connecteurs sont conservées."""
+        # Import différé : NumPy n'est chargé que si l'équilibrage est utilisé
+        from app.allocation import SiteState
+
+        keys = [(connector.cp_id, connector.connector_id) for connector in connectors]
+        positions = {key: index for index, key in enumerate(keys)}
+        if len(positions) != len(keys):
+            raise ValueError("Connecteur présent plusieurs fois dans le site")
+        for connector in connectors:
+            # Les transactions et valeurs de compteur d'un point de charge ne sont observées que par son worker
+            if not owns(connector.cp_id):
+                raise ValueError(f"{connector.cp_id} est géré par le worker {ring.owner(connector.cp_id)} : un site ne regroupe que des points de charge du worker qui le reçoit")
+        for key in keys:
+            owner = self._connectors.get(key)
+            if owner is not None and owner[0] != site_id:
+                raise ValueError(f"Le connecteur {key[1]} de {key[0]} appartient déjà au site {owner[0]}")
+        state = SiteState(
+            grid_limit_w,
+            [connector.cp_id for connector in connectors],
+            [connector.connector_id for connector in connectors],
+            [connector.max_power_w for connector in connectors],
+            [SITE_MIN_POWER_W if connector.min_power_w is None else connector.min_power_w for connector in connectors],
+            [connector.priority for connector in connectors],
+        )
+        previous = self._sites.get(site_id)
+        if previous is not None:
+            for index, key in enumerate(zip(previous.charge_point_ids, previous.connector_ids.tolist())):
+                del self._connectors[key]
+                new_index = positions.get(key)
+                if new_index is not None and previous.active[index]:
+                    # Session en cours : reprise dans le nouvel état
+                    for column in ("active", "transaction_ids", "power", "ev_limit", "limit"):
+                        getattr(state, column)[new_index] = getattr(previous, column)[index]
+            self._transactions = {key: owner for key, owner in self._transactions.items() if owner[0] != site_id}
+        self._sites[site_id] = state
+        for index, key in enumerate(keys):
+            self._connectors[key] = (site_id, index)
+            if state.active[index]:
+                self._transactions[(key[0], int(state.transaction_ids[index]))] = (site_id, index)
+        self._stats.setdefault(site_id, {"rebalances": 0, "last_rebalance_ms": None, "pushed": 0, "rejected": 0})
+        self.request_rebalance(site_id)
+
+    def site(self, site_id: str):
+        state = self._sites.get(site_id)
+        if state is None:
+            raise LookupError(f"Site {site_id} inconnu")
+        return state
+
+    def locate(self, charge_point_id: str, connector_id: int):
+        """Retourne l'état du site et l'indice du connecteur, ou (None, None) s'il n'appartient à aucun site."""
+        owner = self._connectors.get((charge_point_id, connector_id))
+        if owner is None:
+            return None, None
+        return self._sites[owner[0]], owner[1]
+
+    def update_connector(self, site_id: str, charge_point_id: str, connector_id: int, priority: Optional[float] = None, ev_max_power_w: Optional[float] = None):
+        """Modifie la priorité ou la limite du véhicule d'un connecteur et demande un recalcul du site."""
+        state, index = self.locate(charge_point_id, connector_id)
+        if state is None or state is not self._sites.get(site_id):
+            raise LookupError(f"Connecteur {connector_id} de {charge_point_id} absent du site {site_id}")
+        if priority is not None:
+            state.priority[index] = priority
+        if ev_max_power_w is not None:
+            state.ev_limit[index] = ev_max_power_w
+        self.request_rebalance(site_id)
+
+    def transaction_started(self, charge_point_id: str, connector_id: int, transaction_id: int):
+        owner = self._connectors.get((charge_point_id, connector_id))
+        if owner is None:
+            return
+        state = self._sites[owner[0]]
+        index = owner[1]
+        state.active[index] = True
+        state.transaction_ids[index] = transaction_id if transaction_id is not None else -1
+        state.power[index] = float("nan")
+        state.ev_limit[index] = float("inf")
+        state.limit[index] = float("nan")
+        self._transactions[(charge_point_id, transaction_id)] = owner
+        self.request_rebalance(owner[0])
+
+    def transaction_stopped(self, charge_point_id: str, transaction_id: int):
+        owner = self._transactions.pop((charge_point_id, transaction_id), None)
+        if owner is None or owner[0] not in self._sites:
+            return
+        state = self._sites[owner[0]]
+        state.active[owner[1]] = False
+        state.power[owner[1]] = float("nan")
+        self.request_rebalance(owner[0])
+
+    def meter_values(self, charge_point_id: str, connector_id: int, meter_value: list):
+        state, index = self.locate(charge_point_id, connector_id)
+        if state is None or not meter_value:
+            return
+        power = active_power(meter_value[-1].get("sampledValue") or ())
+        if power is not None:
+            state.power[index] = power
+
+    def request_rebalance(self, site_id: str):
+        """Demande un recalcul du site, effectué par la tâche de fond avec les autres demandes en attente."""
+        self._dirty.add(site_id)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def rebalance(self, site_id: str) -> dict:
+        """Recalcule la répartition du site et envoie les limites qui ont changé."""
+        state = self.site(site_id)
+        self._dirty.discard(site_id)
+        started = time.perf_counter()
+        changed, limits = state.rebalance(self.threshold)
+        elapsed = time.perf_counter() - started
+        rebalance_duration.observe(elapsed)
+        stats = self._stats[site_id]
+        stats["rebalances"] += 1
+        stats["last_rebalance_ms"] = round(elapsed * 1000, 3)
+        pushes = [(int(index), int(limit)) for index, limit in zip(changed.tolist(), limits.tolist())]
+        results = {"accepted": 0, "rejected": 0}
+        async for accepted in fan_out(pushes, lambda push: self._push(state, *push), self.concurrency):
+            results["accepted" if accepted else "rejected"] += 1
+        stats["pushed"] += results["accepted"]
+        stats["rejected"] += results["rejected"]
+        return {"site_id": site_id, "elapsed_ms": stats["last_rebalance_ms"], "changed": len(pushes), **results}
+
+    async def _push(self, state, index: int, limit: int) -> bool:
+        charge_point_id = state.charge_point_ids[index]
+        profile = {
+            "chargingProfileId": SITE_CHARGING_PROFILE_ID,
+            "stackLevel": 0,
+            "chargingProfilePurpose": "TxProfile",
+            "chargingProfileKind": "Relative",
+            "chargingSchedule": {"chargingRateUnit": "W", "chargingSchedulePeriod": [{"startPeriod": 0, "limit": limit}]},
+        }
+        transaction_id = int(state.transaction_ids[index])
+        if transaction_id >= 0:
+            profile["transactionId"] = transaction_id
+        try:
+            response = await registry.get(charge_point_id).call("SetChargingProfile", {"connectorId": int(state.connector_ids[index]), "csChargingProfiles": profile})
+        except Exception as e:
+            logging.warning("SetChargingProfile non envoyé à %s: %s", charge_point_id, e)
+            profiles_pushed.inc("error")
+            return False
+        if response.is_error or response.payload.get("status") != "Accepted":
+            logging.warning("SetChargingProfile refusé par %s: %s", charge_point_id, response.error_code if response.is_error else response.payload.get("status"))
+            profiles_pushed.inc("rejected")
+            return False
+        # Limite en vigueur : elle ne sera renvoyée que si la répartition s'en écarte
+        state.limit[index] = limit
+        profiles_pushed.inc("accepted")
+        return True
+
+    def describe(self, site_id: str) -> dict:
+        state = self.site(site_id)
+        connectors = []
+        for index, charge_point_id in enumerate(state.charge_point_ids):
+            connectors.append({
+                "cp_id": charge_point_id,
+                "connector_id": int(state.connector_ids[index]),
+                "active": bool(state.active[index]),
+                "transaction_id": int(state.transaction_ids[index]) if state.active[index] else None,
+                "priority": float(state.priority[index]),
+                "max_power_w": float(state.rating[index]),
+                "ev_max_power_w": float(state.ev_limit[index]) if math.isfinite(state.ev_limit[index]) else None,
+                "power_w": None if math.isnan(state.power[index]) else float(state.power[index]),
+                "allocated_w": round(float(state.allocation[index]), 1),
+                "limit_w": None if math.isnan(state.limit[index]) else float(state.limit[index]),
+            })
+        return {
+            "site_id": site_id,
+            "grid_limit_w": state.capacity,
+            "allocated_w": round(float(state.allocation.sum()), 1),
+            "active_sessions": int(state.active.sum()),
+            **self._stats[site_id],
+            "connectors": connectors,
+        }
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        if self._dirty:
+            self._wakeup.set()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+            self._worker = None
+        self._wakeup = None
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                # Recalcul périodique : suit les variations de consommation mesurées
+                self._dirty.update(self._sites)
+            self._wakeup.clear()
+            for site_id in list(self._dirty):
+                if site_id not in self._sites:
+                    self._dirty.discard(site_id)
+                    continue
+                try:
+                    await self.rebalance(site_id)
+                except Exception as e:
+                    logging.error("Erreur lors de l'équilibrage du site %s: %s", site_id, e)
+
+
+def active_power(sampled_values) -> Optional[float]:
+    """Puissance active importée (W) d'un relevé MeterValues : la valeur totale, ou la somme des phases."""
+    total, phases = None, 0.0
+    for sampled_value in sampled_values:
+        if sampled_value.get("measurand") != "Power.Active.Import":
+            continue
+        value = float(sampled_value["value"]) * (1000 if sampled_value.get("unit") == "kW" else 1)
+        if sampled_value.get("phase") in (None, "N"):
+            total = value
+        else:
+            phases += value
+    return total if total is not None else (phases or None)
+
+
+site_registry = SiteRegistry()
+
+
+@observe("StartTransaction")
+def site_start_transaction(session, payload: dict, result: dict):
+    site_registry.transaction_started(session.charge_point_id, payload.get("connectorId"), result.get("transactionId"))
+
+
+@observe("StopTransaction")
+def site_stop_transaction(session, payload: dict, result: dict):
+    site_registry.transaction_stopped(session.charge_point_id, payload.get("transactionId"))
+
+
+@observe("MeterValues")
+def site_meter_values(session, payload: dict, result: dict):
+    site_registry.meter_values(session.charge_point_id, payload.get("connectorId"), payload.get("meterValue"))
+
+
+@router.put("/sites/{site_id}", summary="Configurer l'équilibrage de charge d'un site", description="Ce endpoint crée ou remplace un site : la puissance disponible (`grid_limit_w`) et ses connecteurs, avec leur puissance maximale, leur puissance minimale de charge et leur priorité. La puissance est partagée entre les connecteurs en charge au prorata de leur priorité, sans dépasser la puissance maximale du connecteur et du véhicule ni la consommation mesurée (MeterValues) d'un véhicule qui se limite lui-même. Si la puissance disponible ne couvre pas le minimum de chaque session, les sessions de plus faible priorité sont mises en pause (limite à 0 W). Les limites sont envoyées aux points de charge par `SetChargingProfile` à chaque début ou fin de transaction et toutes les `SITE_REBALANCE_INTERVAL` secondes, uniquement lorsqu'elles changent.")
+async def configure_site(
+    site_id: str = Path(..., description="Identifiant du site"),
+    request: SiteRequest = Body(..., description="Puissance disponible et connecteurs du site")
+):
+    """
+    Crée ou remplace la configuration d'un site.
+
+    - **site_id**: Identifiant du site
+    - **grid_limit_w**: Puissance disponible pour le site (W)
+    - **connectors**: Connecteurs du site (point de charge, connecteur, puissances, priorité)
+    """
+    try:
+        site_registry.configure(site_id, request.grid_limit_w, request.connectors)
+        return site_registry.describe(site_id)
+    except Exception as e:
+        logging.error("Erreur lors de la configuration du site %s: %s", site_id, e)
+        return {"error": str(e)}
+
+
+@router.get("/sites/{site_id}", summary="État de l'équilibrage de charge d'un site", description="Ce endpoint renvoie l'état d'un site : puissance disponible et allouée, sessions en cours, durée du dernier recalcul, et pour chaque connecteur sa priorité, la puissance mesurée, la puissance allouée et la dernière limite acceptée par le point de charge.")
+async def get_site(site_id: str = Path(..., description="Identifiant du site")):
+    """
+    Renvoie l'état d'un site.
+
+    - **site_id**: Identifiant du site
+    """
+    try:
+        return site_registry.describe(site_id)
+    except Exception as e:
+        logging.error("Erreur lors de la lecture du site %s: %s", site_id, e)
+        return {"error": str(e)}
+
+
+@router.patch("/sites/{site_id}/connectors/{charge_point_id}/{connector_id}", summary="Modifier la priorité ou la limite véhicule d'un connecteur", description="Ce endpoint modifie la priorité de la session en cours sur un connecteur, ou la puissance maximale acceptée par le véhicule, puis demande un recalcul de la répartition du site.")
+async def update_site_connector(
+    site_id: str = Path(..., description="Identifiant du site"),
+    charge_point_id: str = Path(..., description="Identifiant du point de charge"),
+    connector_id: int = Path(..., description="Identifiant du connecteur"),
+    request: ConnectorUpdate = Body(..., description="Priorité et/ou puissance maximale du véhicule")
+):
+    """
+    Modifie un connecteur du site et demande un recalcul.
+
+    - **site_id**: Identifiant du site
+    - **charge_point_id**: Identifiant du point de charge
+    - **connector_id**: Identifiant du connecteur
+    - **priority**: (Optionnel) Poids de la session
+    - **ev_max_power_w**: (Optionnel) Puissance maximale acceptée par le véhicule (W)
+    """
+    try:
+        site_registry.update_connector(site_id, charge_point_id, connector_id, request.priority, request.ev_max_power_w)
+        return site_registry.describe(site_id)
+    except Exception as e:
+        logging.error("Erreur lors de la modification du connecteur %s de %s: %s", connector_id, charge_point_id, e)
+        return {"error": str(e)}
+
+
+@router.post("/sites/{site_id}/rebalance", summary="Recalculer immédiatement la répartition d'un site", description="Ce endpoint recalcule la répartition de puissance du site sans attendre le prochain recalcul périodique, envoie les limites qui ont changé et renvoie le nombre de profils envoyés, acceptés et refusés ainsi que la durée du calcul.")
+async def rebalance_site(site_id: str = Path(..., description="Identifiant du site")):
+    """
+    Recalcule la répartition d'un site et envoie les limites modifiées.
+
+    - **site_id**: Identifiant du site
+    """
+    try:
+        return await site_registry.rebalance(site_id)
+    except Exception as e:
+        logging.error("Erreur lors de l'équilibrage du site %s: %s", site_id, e)
+        return {"error": str(e)}
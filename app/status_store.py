@@ -0,0 +1,129 @@
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from fastapi import APIRouter, Query, Request
+from pydantic import BaseModel, Field
+
+from app.cluster import forwarder, is_forwarded, other_workers
+from app.connection import observe
+
+router = APIRouter()
+
+
+class ConnectorStatus:
+    """Dernier statut connu d'un connecteur, tel que reçu dans un StatusNotification."""
+
+    __slots__ = (
+        "charge_point_id", "connector_id", "status", "error_code", "timestamp",
+        "info", "vendor_id", "vendor_error_code", "updated_at",
+    )
+
+    def __init__(self, charge_point_id: str, connector_id: int, payload: dict):
+        self.charge_point_id = charge_point_id
+        self.connector_id = connector_id
+        self.update(payload)
+
+    def update(self, payload: dict):
+        self.status = payload.get("status")
+        self.error_code = payload.get("errorCode")
+        self.timestamp = payload.get("timestamp")
+        self.info = payload.get("info")
+        self.vendor_id = payload.get("vendorId")
+        self.vendor_error_code = payload.get("vendorErrorCode")
+        self.updated_at = time.time()
+
+    def as_dict(self) -> dict:
+        return {
+            "chargePointId": self.charge_point_id,
+            "connectorId": self.connector_id,
+            "errorCode": self.error_code,
+            "status": self.status,
+            "timestamp": self.timestamp,
+            "info": self.info,
+            "vendorId": self.vendor_id,
+            "vendorErrorCode": self.vendor_error_code,
+            "updatedAt": datetime.fromtimestamp(self.updated_at, timezone.utc).isoformat(),
+            "age": round(time.time() - self.updated_at, 3),
+        }
+
+
+class StatusStore:
+    """
+    Statuts des connecteurs en mémoire, indexés par (point de charge, connecteur)
+    et par point de charge, alimentés par les StatusNotification qui passent
+    par la couche de connexion.
+    """
+
+    def __init__(self):
+        self._by_charge_point = {}
+
+    def __len__(self):
+        return sum(len(connectors) for connectors in self._by_charge_point.values())
+
+    def update(self, charge_point_id: str, payload: dict) -> ConnectorStatus:
+        connectors = self._by_charge_point.setdefault(charge_point_id, {})
+        connector_id = payload["connectorId"]
+        entry = connectors.get(connector_id)
+        if entry is None:
+            entry = connectors[connector_id] = ConnectorStatus(charge_point_id, connector_id, payload)
+        else:
+            entry.update(payload)
+        return entry
+
+    def get(self, charge_point_id: str, connector_id: int) -> Optional[ConnectorStatus]:
+        return self._by_charge_point.get(charge_point_id, {}).get(connector_id)
+
+    def list(self, charge_point_id: Optional[str] = None, status: Optional[str] = None) -> List[ConnectorStatus]:
+        if charge_point_id is not None:
+            entries = list(self._by_charge_point.get(charge_point_id, {}).values())
+        else:
+            entries = [entry for connectors in self._by_charge_point.values() for entry in connectors.values()]
+        if status is not None:
+            entries = [entry for entry in entries if entry.status == status]
+        return entries
+
+    def clear(self):
+        self._by_charge_point.clear()
+
+
+status_store = StatusStore()
+
+
+@observe("StatusNotification")
+def record_status_notification(session, payload: dict, result: dict):
+    status_store.update(session.charge_point_id, payload)
+
+
+class ConnectorStatusResponse(BaseModel):
+    chargePointId: Optional[str] = Field(None, description="Identifiant du point de charge")
+    connectorId: int = Field(..., description="ID du connecteur")
+    errorCode: Optional[str] = Field(None, description="Code d'erreur")
+    status: Optional[str] = Field(None, description="Statut du connecteur")
+    timestamp: Optional[str] = Field(None, description="Horodatage du StatusNotification")
+    info: Optional[str] = Field(None, description="Informations supplémentaires")
+    vendorId: Optional[str] = Field(None, description="ID du fournisseur")
+    vendorErrorCode: Optional[str] = Field(None, description="Code d'erreur fournisseur")
+    updatedAt: str = Field(..., description="Date de la dernière mise à jour en mémoire")
+    age: float = Field(..., description="Ancienneté du statut en secondes")
+
+
+@router.get("/statuses", response_model=List[ConnectorStatusResponse], summary="Lister les statuts connus des connecteurs", description="Ce endpoint renvoie le dernier statut connu de chaque connecteur, depuis la mémoire de l'application et sans aller-retour OCPP. Les statuts sont mis à jour à chaque `StatusNotification` qui passe par la connexion au serveur central. Chaque entrée indique sa date de mise à jour et son ancienneté en secondes.")
+async def list_statuses(
+    request: Request,
+    cp_id: Optional[str] = Query(None, description="Filtrer sur un point de charge"),
+    status: Optional[str] = Query(None, description="Filtrer sur un statut (Available, Charging, etc.)")
+):
+    """
+    Liste les derniers statuts connus des connecteurs.
+
+    - **cp_id**: (Optionnel) Identifiant du point de charge
+    - **status**: (Optionnel) Statut recherché
+    """
+    statuses = [entry.as_dict() for entry in status_store.list(cp_id, status)]
+    if not is_forwarded(request.headers):
+        # En mode cluster, chaque worker ne connaît que les statuts de ses points de charge
+        params = {name: value for name, value in (("cp_id", cp_id), ("status", status)) if value is not None}
+        for remote in await forwarder.gather(other_workers(cp_id), "GET", "/statuses", params=params):
+            statuses.extend(remote)
+    return statuses
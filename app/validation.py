@@ -0,0 +1,147 @@
+import decimal
+import json
+import logging
+import os
+import random
+import time
+from functools import lru_cache
+
+from fastapi import APIRouter
+
+from app.env import load_dotenv
+
+load_dotenv()
+
+# full : chaque payload est validé ; sample : une fraction OCPP_VALIDATION_SAMPLE_RATE ; off : aucun
+OCPP_VALIDATION = os.getenv("OCPP_VALIDATION", "full")
+OCPP_VALIDATION_SAMPLE_RATE = float(os.getenv("OCPP_VALIDATION_SAMPLE_RATE", "0.1"))
+# Actions de confiance jamais validées, séparées par des virgules (ex. Heartbeat,MeterValues)
+OCPP_VALIDATION_SKIP_ACTIONS = os.getenv("OCPP_VALIDATION_SKIP_ACTIONS", "")
+OCPP_VERSION = "1.6"
+
+# Schémas OCPP 1.6 dont les nombres à une décimale (multipleOf 0.1) doivent
+# être comparés en Decimal, comme le fait la librairie ocpp
+DECIMAL_SCHEMAS = {
+    ("1.6", "SetChargingProfile", "request"),
+    ("1.6", "RemoteStartTransaction", "request"),
+    ("1.6", "GetCompositeSchedule", "response"),
+}
+
+router = APIRouter()
+
+
+class PayloadValidationError(ValueError):
+    """Payload OCPP non conforme à son schéma JSON."""
+
+
+@lru_cache(maxsize=None)
+def get_validator(version: str, action: str, direction: str):
+    """
+    Validateur JSON Schema d'une action, construit une seule fois par
+    (version, action, sens) à partir des schémas livrés avec la librairie ocpp.
+
+    Retourne None si la librairie ne fournit pas de schéma pour l'action.
+    """
+    import ocpp
+    from jsonschema import Draft4Validator
+
+    schema_name = action + ("Response" if direction == "response" else "")
+    path = os.path.join(os.path.dirname(ocpp.__file__), "v" + version.replace(".", ""), "schemas", f"{schema_name}.json")
+    parse_float = decimal.Decimal if (version, action, direction) in DECIMAL_SCHEMAS else float
+    try:
+        with open(path, encoding="utf-8-sig") as f:
+            schema = json.load(f, parse_float=parse_float)
+    except FileNotFoundError:
+        logging.warning("Pas de schéma OCPP %s pour %s : payload non validé", version, schema_name)
+        return None
+    return Draft4Validator(schema)
+
+
+class ActionTimings:
+    """Compteurs de validation d'une action."""
+
+    __slots__ = ("validated", "skipped", "seconds")
+
+    def __init__(self):
+        self.validated = 0
+        self.skipped = 0
+        self.seconds = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "validated": self.validated,
+            "skipped": self.skipped,
+            "total_ms": round(self.seconds * 1000, 3),
+            "average_us": round(self.seconds / self.validated * 1e6, 3) if self.validated else 0.0,
+        }
+
+
+class SchemaValidation:
+    """
+    Politique de validation des payloads OCPP et mesure de son coût par action.
+
+    `mode` vaut `full`, `sample` (une fraction `sample_rate` des appels) ou
+    `off` ; les actions de `skip_actions` ne sont jamais validées. La décision
+    est prise une fois par appel avec `should_validate`, puis s'applique à la
+    requête et à sa réponse.
+    """
+
+    def __init__(self, mode: str = OCPP_VALIDATION, sample_rate: float = OCPP_VALIDATION_SAMPLE_RATE, skip_actions=None, version: str = OCPP_VERSION):
+        if mode not in ("full", "sample", "off"):
+            raise ValueError(f"Mode de validation inconnu: {mode}")
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.skip_actions = set(skip_actions if skip_actions is not None else filter(None, OCPP_VALIDATION_SKIP_ACTIONS.split(",")))
+        self.version = version
+        self._timings = {}
+
+    def _action_timings(self, action: str) -> ActionTimings:
+        timings = self._timings.get(action)
+        if timings is None:
+            timings = self._timings[action] = ActionTimings()
+        return timings
+
+    def should_validate(self, action: str) -> bool:
+        validate = (
+            self.mode == "full" or (self.mode == "sample" and random.random() < self.sample_rate)
+        ) and action not in self.skip_actions
+        if not validate:
+            self._action_timings(action).skipped += 1
+        return validate
+
+    def validate(self, action: str, direction: str, payload: dict):
+        """Valide un payload ; lève PayloadValidationError s'il n'est pas conforme."""
+        started = time.perf_counter()
+        validator = get_validator(self.version, action, direction)
+        if validator is None:
+            return
+        if (self.version, action, direction) in DECIMAL_SCHEMAS:
+            payload = json.loads(json.dumps(payload), parse_float=decimal.Decimal)
+        error = next(validator.iter_errors(payload), None)
+        timings = self._action_timings(action)
+        timings.validated += 1
+        timings.seconds += time.perf_counter() - started
+        if error is not None:
+            raise PayloadValidationError(f"{action} ({direction}) non conforme au schéma OCPP {self.version}: {error.message}")
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "sample_rate": self.sample_rate,
+            "skip_actions": sorted(self.skip_actions),
+            "actions": {action: timings.as_dict() for action, timings in sorted(self._timings.items())},
+        }
+
+    def reset(self):
+        self._timings.clear()
+
+
+schema_validation = SchemaValidation()
+
+
+@router.get("/validation-stats", summary="Coût de la validation des payloads OCPP", description="Ce endpoint renvoie la politique de validation des payloads OCPP (`OCPP_VALIDATION` : full, sample ou off, taux d'échantillonnage et actions de confiance non validées) et, pour chaque action, le nombre de payloads validés et ignorés, le temps total et le temps moyen de validation.")
+async def validation_stats():
+    """
+    Renvoie la politique de validation et les temps de validation par action.
+    """
+    return schema_validation.stats()
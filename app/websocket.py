@@ -1,25 +1,69 @@
 import asyncio
-import websockets
-from fastapi import WebSocket
+import json
+from fastapi import WebSocket, WebSocketDisconnect
 from ocpp.v16 import ChargePoint as cp
 from ocpp.v16 import call
-from dotenv import load_dotenv
+from ocpp.charge_point import remove_nones, serialize_as_dict, snake_to_camel_case
+from ocpp.messages import MessageType
 import os
 import logging
+from app.cluster import owns, ring
+from app.env import load_dotenv
+from app.events import event_bus
+from app.registry import registry
+from app.validation import schema_validation
 
 load_dotenv()
 
-WEBSOCKET_URL = os.getenv("WEBSOCKET_URL_LOCALHOST")
 CHARGE_POINT_ID = os.getenv("CHARGE_POINT_ID")
 CHARGE_POINT_MODEL = os.getenv("CHARGE_POINT_MODEL")
 CHARGE_POINT_VENDOR = os.getenv("CHARGE_POINT_VENDOR")
+WS_BRIDGE_QUEUE_SIZE = int(os.getenv("WS_BRIDGE_QUEUE_SIZE", "100"))
+WS_BRIDGE_MAX_IN_FLIGHT = int(os.getenv("WS_BRIDGE_MAX_IN_FLIGHT", "10"))
+
+
+def payload_class(action: str):
+    """Classe de payload `call` d'une action, quel que soit la version de la librairie ocpp."""
+    # ocpp >= 1.0 a renommé les classes `XxxPayload` en `Xxx`
+    return getattr(call, action, None) or getattr(call, f"{action}Payload")
 
-logging.basicConfig(level=logging.INFO)
 
 class ChargePoint(cp):
+    """
+    Point de charge OCPP 1.6 dont la validation des payloads suit la politique
+    de `app.validation` (validateurs mis en cache, échantillonnage, actions de
+    confiance) au lieu de la validation systématique de la librairie ocpp.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Action des appels dont la réponse doit être validée, par identifiant
+        self._validated_calls = {}
+
+    async def call(self, payload, suppress=True, unique_id=None, skip_schema_validation=False):
+        action = type(payload).__name__
+        if action.endswith("Payload"):
+            action = action[:-len("Payload")]
+        if skip_schema_validation or not schema_validation.should_validate(action):
+            return await super().call(payload, suppress, unique_id, skip_schema_validation=True)
+        schema_validation.validate(action, "request", remove_nones(snake_to_camel_case(serialize_as_dict(payload))))
+        unique_id = unique_id if unique_id is not None else str(self._unique_id_generator())
+        self._validated_calls[unique_id] = action
+        try:
+            return await super().call(payload, suppress, unique_id, skip_schema_validation=True)
+        finally:
+            self._validated_calls.pop(unique_id, None)
+
+    async def _get_specific_response(self, unique_id, timeout):
+        response = await super()._get_specific_response(unique_id, timeout)
+        action = self._validated_calls.pop(unique_id, None)
+        if action is not None and response.message_type_id == MessageType.CallResult:
+            schema_validation.validate(action, "response", response.payload)
+        return response
+
     async def send_boot_notification(self):
         try:
-            request = call.BootNotificationPayload(
+            request = payload_class("BootNotification")(
                 charge_point_model=CHARGE_POINT_MODEL,
                 charge_point_vendor=CHARGE_POINT_VENDOR
             )
@@ -27,53 +71,86 @@ class ChargePoint(cp):
             if response.status == "Accepted":
                 logging.info("Boot notification accepted")
             else:
-                logging.error(f"Boot notification failed with status: {response.status}")
+                logging.error("Boot notification failed with status: %s", response.status)
+            return response
         except Exception as e:
-            logging.error(f"Exception during boot notification: {e}")
+            logging.error("Exception during boot notification: %s", e)
 
-    async def start_transaction(self):
+    async def authorize(self, id_tag: str = "ABC123"):
         try:
-            request = call.StartTransactionPayload(
-                connector_id=1,
-                id_tag="ABC123",
-                meter_start=0,
-                timestamp="2023-05-21T15:00:00Z"
+            request = payload_class("Authorize")(id_tag=id_tag)
+            response = await self.call(request)
+            if response.id_tag_info["status"] != "Accepted":
+                logging.error("Authorize failed with status: %s", response.id_tag_info['status'])
+            return response
+        except Exception as e:
+            logging.error("Exception during authorize: %s", e)
+
+    async def start_transaction(self, connector_id: int = 1, id_tag: str = "ABC123", meter_start: int = 0, timestamp: str = "2023-05-21T15:00:00Z"):
+        try:
+            request = payload_class("StartTransaction")(
+                connector_id=connector_id,
+                id_tag=id_tag,
+                meter_start=meter_start,
+                timestamp=timestamp
             )
             response = await self.call(request)
             if response.id_tag_info["status"] == "Accepted":
                 logging.info("Transaction started")
             else:
-                logging.error(f"Start transaction failed with status: {response.id_tag_info['status']}")
+                logging.error("Start transaction failed with status: %s", response.id_tag_info['status'])
+            return response
         except Exception as e:
-            logging.error(f"Exception during start transaction: {e}")
+            logging.error("Exception during start transaction: %s", e)
 
-    async def stop_transaction(self):
+    async def stop_transaction(self, transaction_id: int = 1, meter_stop: int = 10, timestamp: str = "2023-05-21T16:00:00Z"):
         try:
-            request = call.StopTransactionPayload(
-                transaction_id=1,
-                meter_stop=10,
-                timestamp="2023-05-21T16:00:00Z"
+            request = payload_class("StopTransaction")(
+                transaction_id=transaction_id,
+                meter_stop=meter_stop,
+                timestamp=timestamp
             )
             response = await self.call(request)
             if response.id_tag_info["status"] == "Accepted":
                 logging.info("Transaction stopped")
             else:
-                logging.error(f"Stop transaction failed with status: {response.id_tag_info['status']}")
+                logging.error("Stop transaction failed with status: %s", response.id_tag_info['status'])
+            return response
+        except Exception as e:
+            logging.error("Exception during stop transaction: %s", e)
+
+    async def send_meter_values(self, connector_id: int = 1, transaction_id: int = None, energy_wh: int = 0, timestamp: str = "2023-01-01T00:00:00Z"):
+        try:
+            request = payload_class("MeterValues")(
+                connector_id=connector_id,
+                transaction_id=transaction_id,
+                meter_value=[{
+                    "timestamp": timestamp,
+                    "sampledValue": [{
+                        "value": str(energy_wh),
+                        "context": "Sample.Periodic",
+                        "format": "Raw",
+                        "measurand": "Energy.Active.Import.Register",
+                        "unit": "Wh"
+                    }]
+                }]
+            )
+            return await self.call(request)
         except Exception as e:
-            logging.error(f"Exception during stop transaction: {e}")
+            logging.error("Exception during meter values: %s", e)
 
-    async def status_notification(self):
+    async def status_notification(self, connector_id: int = 1, status: str = "Available", timestamp: str = "2023-05-21T15:00:00Z"):
         try:
-            request = call.StatusNotificationPayload(
-                connector_id=1,
+            request = payload_class("StatusNotification")(
+                connector_id=connector_id,
                 error_code="NoError",
-                status="Available",
-                timestamp="2023-05-21T15:00:00Z"
+                status=status,
+                timestamp=timestamp
             )
             response = await self.call(request)
             return response
         except Exception as e:
-            logging.error(f"Exception during status notification: {e}")
+            logging.error("Exception during status notification: %s", e)
     
     async def send_command(self, command):
         if command == "start_charging":
@@ -85,11 +162,11 @@ class ChargePoint(cp):
         
     async def send_heartbeat(self):
         try:
-            request = call.HeartbeatPayload()
+            request = payload_class("Heartbeat")()
             response = await self.call(request)
             return response
         except Exception as e:
-            logging.error(f"Exception during heartbeat: {e}")
+            logging.error("Exception during heartbeat: %s", e)
 
     async def change_configuration(self, key: str, value: str):
         message = {
@@ -104,20 +181,123 @@ class ChargePoint(cp):
         return await self.send_command(json.dumps(message))
     
 
-async def websocket_endpoint(websocket: WebSocket):
+# Commandes historiques du bridge /ws, traduites en actions OCPP avec un payload par défaut
+BRIDGE_COMMANDS = {
+    "start_charging": ("StartTransaction", {"connectorId": 1, "idTag": "ABC123", "meterStart": 0, "timestamp": "2023-05-21T15:00:00Z"}),
+    "stop_charging": ("StopTransaction", {"transactionId": 1, "meterStop": 10, "timestamp": "2023-05-21T16:00:00Z"}),
+    "status_notification": ("StatusNotification", {"connectorId": 1, "errorCode": "NoError", "status": "Available", "timestamp": "2023-05-21T15:00:00Z"}),
+    "heartbeat": ("Heartbeat", {}),
+}
+
+
+class SlowClientError(Exception):
+    """Le client du bridge ne lit pas assez vite ses réponses."""
+
+
+def parse_bridge_request(data: str):
+    """
+    Décode une requête du client : `{"id", "command" | "action", "payload"}`
+    en JSON, ou un nom de commande en texte brut. Retourne (id, action, payload).
+    """
     try:
-        async with websockets.connect(WEBSOCKET_URL, subprotocols=["ocpp1.6"]) as ws:
-            charge_point = ChargePoint(CHARGE_POINT_ID, ws)
-            await charge_point.start()
-
-            while True:
-                data = await websocket.receive_text()
-                logging.info(f"Message reçu: {data}")
-
-                response = await charge_point.send_command(data)
-                logging.info(f"Réponse envoyée: {response}")
-                await websocket.send_text(f"Message reçu : {data}, Réponse : {response}")
-    except websockets.ConnectionClosedOK:
-        logging.info("Connection closed normally")
-    except Exception as e:
-        logging.error(f"Erreur lors de la connexion WebSocket: {e}")
\ No newline at end of file
+        request = json.loads(data)
+    except ValueError:
+        request = {"command": data.strip()}
+    if not isinstance(request, dict):
+        raise ValueError("La requête doit être un objet JSON")
+    payload = request.get("payload") or {}
+    if "action" in request:
+        return request.get("id"), request["action"], payload
+    command = BRIDGE_COMMANDS.get(request.get("command"))
+    if command is None:
+        raise ValueError(f"Commande inconnue: {request.get('command')}")
+    action, default_payload = command
+    return request.get("id"), action, {**default_payload, **payload}
+
+
+async def websocket_endpoint(websocket: WebSocket):
+    """
+    Bridge WebSocket entre un client et la connexion OCPP d'un point de charge.
+
+    Une tâche lit les requêtes du client et lance chaque commande sans
+    attendre les précédentes (au plus WS_BRIDGE_MAX_IN_FLIGHT à la fois,
+    au-delà la lecture est suspendue) ; une autre écrit les réponses JSON,
+    associées à l'`id` de la requête, depuis une file bornée. Les événements
+    du point de charge (statuts, transactions, CALL du serveur central) sont
+    aussi relayés. Un client qui ne lit pas ses réponses assez vite pour
+    vider la file est déconnecté (code 1013).
+
+    En mode cluster, une WebSocket ne peut pas être transmise à un autre
+    worker : si le point de charge n'appartient pas au worker qui la reçoit,
+    elle est fermée avec le code 1013 pour que le client se reconnecte.
+    """
+    charge_point_id = websocket.query_params.get("cp_id", CHARGE_POINT_ID)
+    await websocket.accept()
+    if not owns(charge_point_id):
+        await websocket.close(code=1013, reason=f"{charge_point_id} est géré par le worker {ring.owner(charge_point_id)}")
+        return
+    session = registry.get(charge_point_id)
+    outbound = asyncio.Queue(maxsize=WS_BRIDGE_QUEUE_SIZE)
+    in_flight = asyncio.Semaphore(WS_BRIDGE_MAX_IN_FLIGHT)
+    commands = set()
+    overflow = asyncio.get_running_loop().create_future()
+
+    def reply(frame: dict):
+        try:
+            outbound.put_nowait(frame)
+        except asyncio.QueueFull:
+            if not overflow.done():
+                overflow.set_exception(SlowClientError(f"{outbound.qsize()} réponses en attente"))
+
+    async def run_command(request_id, action: str, payload: dict):
+        try:
+            response = await session.call(action, payload)
+            if response.is_error:
+                frame = {"id": request_id, "type": "error", "action": action, "error": response.error_code, "description": response.error_description}
+            else:
+                frame = {"id": request_id, "type": "result", "action": action, "payload": response.payload}
+        except Exception as e:
+            logging.error("Erreur lors de l'envoi de %s depuis le bridge WebSocket: %s", action, e)
+            frame = {"id": request_id, "type": "error", "action": action, "error": str(e)}
+        finally:
+            in_flight.release()
+        reply(frame)
+
+    async def read():
+        while True:
+            data = await websocket.receive_text()
+            try:
+                request_id, action, payload = parse_bridge_request(data)
+            except ValueError as e:
+                reply({"id": None, "type": "error", "error": str(e)})
+                continue
+            await in_flight.acquire()
+            task = asyncio.create_task(run_command(request_id, action, payload))
+            commands.add(task)
+            task.add_done_callback(commands.discard)
+
+    async def write():
+        while True:
+            await websocket.send_text(json.dumps(await outbound.get()))
+
+    async def forward_events(subscription):
+        while True:
+            await outbound.put({"type": "event", "event": await subscription.get()})
+
+    with event_bus.subscribe(session.charge_point_id) as subscription:
+        tasks = [asyncio.create_task(read()), asyncio.create_task(write()), asyncio.create_task(forward_events(subscription))]
+        try:
+            done, _ = await asyncio.wait(tasks + [overflow], return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.cancelled() and task.exception() is not None:
+                    raise task.exception()
+        except WebSocketDisconnect:
+            logging.info("Client du bridge WebSocket déconnecté")
+        except SlowClientError as e:
+            logging.warning("Client du bridge WebSocket trop lent, déconnexion: %s", e)
+            await websocket.close(code=1013, reason="Client trop lent")
+        except Exception as e:
+            logging.error("Erreur dans le bridge WebSocket: %s", e)
+        finally:
+            for task in tasks + list(commands) + [overflow]:
+                task.cancel()
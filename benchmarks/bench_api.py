@@ -0,0 +1,216 @@
+"""
+Benchmark de latence des routes de `app/api.py`.
+
+Lance un serveur central OCPP local (`benchmarks.central_system`), fait
+pointer l'application dessus, puis appelle chaque route à plusieurs niveaux
+de concurrence. Les percentiles p50/p95/p99 et le débit sont affichés et
+écrits dans un fichier JSON pour comparer les résultats entre commits :
+
+    python -m benchmarks.bench_api --concurrency 1 10 50 --requests 500 --output bench_results.json
+
+Avec `--url`, les requêtes visent un serveur HTTP déjà lancé au lieu de
+l'application en mémoire (le serveur central local n'est alors pas démarré).
+
+Avec `--workers N`, l'application est lancée en mode cluster (`app.cluster`)
+sur N processus ; `--charge-points K` répartit les requêtes sur K points de
+charge (`/charge-points/bench-<n>/...`) pour occuper tous les workers :
+
+    python -m benchmarks.bench_api --workers 4 --charge-points 64 --routes /heartbeat --concurrency 64
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Tuple
+
+import httpx
+
+from benchmarks.central_system import CentralSystem
+from benchmarks.stats import summarize, git_revision
+
+# Le benchmark mesure le débit de l'API : la limite de débit par point de
+# charge (app.scheduler) le plafonnerait à quelques requêtes par seconde
+os.environ.setdefault("CALL_RATE_LIMIT", "0")
+
+# Journal des transactions, file hors ligne et valeurs de compteur propres au
+# benchmark : un journal existant dédoublonnerait les /start et /stop mesurés
+_data_dir = tempfile.mkdtemp()
+os.environ.setdefault("TRANSACTION_DB_PATH", os.path.join(_data_dir, "transactions.db"))
+os.environ.setdefault("OFFLINE_QUEUE_PATH", os.path.join(_data_dir, "offline_queue.db"))
+os.environ.setdefault("METER_STORE_PATH", os.path.join(_data_dir, "meter_data"))
+
+# Numéro de chaque requête, unique sur tout le benchmark
+_sequence = itertools.count(1)
+
+
+def connector(n: int) -> int:
+    # Le serveur central local déclare deux connecteurs
+    return n % 2 + 1
+
+
+# (méthode, chemin, arguments httpx de la n-ième requête) pour chaque route de
+# app/api.py. idTag, transaction et connecteur changent à chaque requête, et
+# `refresh` est passé aux routes servies sinon depuis un cache, pour que
+# chaque requête mesurée fasse l'aller-retour OCPP.
+ROUTES = [
+    ("GET", "/test-websocket", lambda n: {}),
+    ("GET", "/status", lambda n: {"params": {"connector_id": connector(n), "refresh": "true"}}),
+    ("POST", "/start", lambda n: {"params": {"connector_id": connector(n), "id_tag": f"BENCH-{n}"}}),
+    ("POST", "/stop", lambda n: {"params": {"transaction_id": n}}),
+    ("GET", "/heartbeat", lambda n: {}),
+    ("POST", "/meter-values", lambda n: {"json": {"connector_id": connector(n), "meter_value": [{"timestamp": "2023-05-21T15:00:00Z", "sampledValue": [{"value": str(n)}]}]}}),
+    ("POST", "/authorize", lambda n: {"json": {"id_tag": f"BENCH-{n}"}}),
+    ("POST", "/unlock-connector", lambda n: {"json": {"connector_id": connector(n)}}),
+    ("POST", "/remote-start-transaction", lambda n: {"json": {"id_tag": f"BENCH-{n}", "connector_id": connector(n)}}),
+    ("POST", "/remote-stop-transaction", lambda n: {"json": {"transaction_id": n}}),
+    ("POST", "/get-configuration", lambda n: {"params": {"refresh": "true"}, "json": {"key": ["HeartbeatInterval"]}}),
+    ("POST", "/change-configuration", lambda n: {"json": {"key": "HeartbeatInterval", "value": "300"}}),
+]
+
+
+def has_error(response: httpx.Response) -> bool:
+    # Les routes signalent les erreurs OCPP par un champ "error" non vide
+    try:
+        body = response.json()
+    except ValueError:
+        return False
+    return isinstance(body, dict) and bool(body.get("error"))
+
+
+async def run_route(client: httpx.AsyncClient, method: str, path: str, arguments, concurrency: int, requests: int, charge_points: int = 0) -> dict:
+    latencies = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for n in remaining:
+            target = f"/charge-points/bench-{n % charge_points}{path}" if charge_points else path
+            kwargs = arguments(next(_sequence))
+            started = time.perf_counter()
+            response = await client.request(method, target, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400 or has_error(response):
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def start_cluster(central_system: CentralSystem, workers: int) -> Tuple[subprocess.Popen, str]:
+    """Lance `app.cluster` sur un port libre, avec des points de charge qui visent `central_system`."""
+    port = free_port()
+    env = dict(
+        os.environ,
+        WEBSOCKET_BASE_URL=central_system.base_url,
+        WEBSOCKET_URL_LOCALHOST=central_system.url_for(os.getenv("CHARGE_POINT_ID", "charger-01")),
+        LOG_LEVEL="WARNING",
+    )
+    process = subprocess.Popen([sys.executable, "-m", "app.cluster", "--workers", str(workers), "--host", "127.0.0.1", "--port", str(port)], env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        for _ in range(300):
+            try:
+                await client.get("/")
+                return process, base_url
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Le cluster n'a pas démarré")
+
+
+async def run(args) -> dict:
+    central_system = None
+    cluster = None
+    if args.workers:
+        central_system = await CentralSystem(delay=args.delay, jitter=args.jitter).start()
+        cluster, base_url = await start_cluster(central_system, args.workers)
+        transport = httpx.AsyncHTTPTransport(limits=httpx.Limits(max_connections=max(args.concurrency)))
+    elif args.url:
+        transport = httpx.AsyncHTTPTransport(limits=httpx.Limits(max_connections=max(args.concurrency)))
+        base_url = args.url
+    else:
+        central_system = await CentralSystem(delay=args.delay, jitter=args.jitter).start()
+        os.environ["WEBSOCKET_URL_LOCALHOST"] = central_system.url_for(os.getenv("CHARGE_POINT_ID", "charger-01"))
+        from app.main import app
+        # Les logs INFO de l'application fausseraient les mesures
+        logging.getLogger().setLevel(args.log_level)
+        transport = httpx.ASGITransport(app=app)
+        base_url = "http://bench"
+
+    results = []
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=60) as client:
+            for method, path, arguments in ROUTES:
+                if args.routes and path not in args.routes:
+                    continue
+                # Échauffement : ouvre la connexion amont avant de mesurer
+                for n in range(max(args.charge_points, 1)):
+                    await client.request(method, f"/charge-points/bench-{n}{path}" if args.charge_points else path, **arguments(next(_sequence)))
+                for concurrency in args.concurrency:
+                    summary = await run_route(client, method, path, arguments, concurrency, args.requests, args.charge_points)
+                    results.append({"route": f"{method} {path}", "concurrency": concurrency, **summary})
+                    print(f"{method:4} {path:28} c={concurrency:<4} {summary['throughput_rps']:>9} req/s  "
+                          f"p50={summary['p50_ms']:>8} ms  p95={summary['p95_ms']:>8} ms  p99={summary['p99_ms']:>8} ms  "
+                          f"erreurs={summary['errors']}")
+    finally:
+        if cluster is not None:
+            cluster.terminate()
+            cluster.wait()
+        if central_system is not None:
+            await central_system.stop()
+
+    return {
+        "benchmark": "api",
+        "revision": git_revision(),
+        "date": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "delay": args.delay,
+            "jitter": args.jitter,
+            "url": args.url,
+            "workers": args.workers,
+            "charge_points": args.charge_points,
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de latence des routes de l'API OCPP")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50], help="Niveaux de concurrence à mesurer")
+    parser.add_argument("--requests", type=int, default=500, help="Nombre de requêtes par route et par niveau")
+    parser.add_argument("--delay", type=float, default=0.0, help="Délai de réponse du serveur central local (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Variation du délai du serveur central local (s)")
+    parser.add_argument("--routes", nargs="*", help="Limiter le benchmark à ces chemins")
+    parser.add_argument("--url", help="URL d'un serveur HTTP déjà lancé, au lieu de l'application en mémoire")
+    parser.add_argument("--workers", type=int, default=0, help="Lancer l'application en mode cluster sur ce nombre de workers")
+    parser.add_argument("--charge-points", type=int, default=0, help="Répartir les requêtes sur ce nombre de points de charge")
+    parser.add_argument("--log-level", default="WARNING", help="Niveau de log de l'application pendant la mesure")
+    parser.add_argument("--output", default="bench_results.json", help="Fichier JSON de résultats")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Résultats écrits dans {args.output}")
+
+
+if __name__ == "__main__":
+    main()
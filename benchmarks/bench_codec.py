@@ -0,0 +1,101 @@
+"""
+Micro-benchmark des backends JSON du codec OCPP-J (`app.codec`).
+
+Encode et décode des trames réalistes (MeterValues à plusieurs mesures et
+phases, réponse GetConfiguration complète) avec chaque backend installé, et
+affiche le temps moyen par trame :
+
+    python -m benchmarks.bench_codec --iterations 20000 --output bench_codec.json
+"""
+import argparse
+import json
+import timeit
+from datetime import datetime, timezone
+
+from app.codec import BACKENDS, Frame, load_backend
+from benchmarks.stats import git_revision
+
+MEASURANDS = [
+    ("Energy.Active.Import.Register", "Wh", None),
+    ("Power.Active.Import", "W", None),
+    ("Current.Import", "A", "L1"),
+    ("Current.Import", "A", "L2"),
+    ("Current.Import", "A", "L3"),
+    ("Voltage", "V", "L1-N"),
+    ("Voltage", "V", "L2-N"),
+    ("Voltage", "V", "L3-N"),
+    ("SoC", "Percent", None),
+]
+
+
+def meter_values_frame() -> Frame:
+    sampled_value = []
+    for measurand, unit, phase in MEASURANDS:
+        value = {"value": "1234.5", "context": "Sample.Periodic", "format": "Raw", "measurand": measurand, "location": "Outlet", "unit": unit}
+        if phase:
+            value["phase"] = phase
+        sampled_value.append(value)
+    return Frame.call("8d5b0a3e-0c3f-4d0e-9b7a-2f6f0f1c9a11", "MeterValues", {
+        "connectorId": 1,
+        "transactionId": 4242,
+        "meterValue": [{"timestamp": "2024-05-21T15:00:00Z", "sampledValue": sampled_value}],
+    })
+
+
+def get_configuration_frame() -> Frame:
+    return Frame.result("5e2f8c1a-7b4d-4a55-8e0f-9d1c3b2a6f70", {
+        "configurationKey": [
+            {"key": f"ConfigurationKey{n:02d}", "readonly": n % 3 == 0, "value": str(n * 60)}
+            for n in range(60)
+        ],
+        "unknownKey": [],
+    })
+
+
+def measure(backend: str, frame: Frame, iterations: int) -> dict:
+    _, dumps, loads = load_backend(backend)
+    message = frame.to_list()
+    raw = dumps(message)
+    encode = timeit.timeit(lambda: dumps(frame.to_list()), number=iterations)
+    decode = timeit.timeit(lambda: Frame.from_list(loads(raw)), number=iterations)
+    return {
+        "bytes": len(raw),
+        "encode_us": round(encode / iterations * 1e6, 3),
+        "decode_us": round(decode / iterations * 1e6, 3),
+    }
+
+
+def run(iterations: int) -> dict:
+    frames = {"MeterValues": meter_values_frame(), "GetConfiguration": get_configuration_frame()}
+    results = {}
+    for backend in BACKENDS:
+        try:
+            load_backend(backend)
+        except ImportError:
+            print(f"{backend:<8} non installé")
+            continue
+        results[backend] = {name: measure(backend, frame, iterations) for name, frame in frames.items()}
+        for name, result in results[backend].items():
+            print(f"{backend:<8} {name:<17} {result['bytes']:>6} o  encode {result['encode_us']:>8.3f} µs  decode {result['decode_us']:>8.3f} µs")
+    return {
+        "revision": git_revision(),
+        "date": datetime.now(timezone.utc).isoformat(),
+        "iterations": iterations,
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark des backends JSON du codec OCPP-J")
+    parser.add_argument("--iterations", type=int, default=20000, help="Nombre d'encodages et de décodages par trame")
+    parser.add_argument("--output", default="bench_codec.json", help="Fichier JSON de résultats")
+    args = parser.parse_args()
+
+    report = run(args.iterations)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Résultats écrits dans {args.output}")
+
+
+if __name__ == "__main__":
+    main()
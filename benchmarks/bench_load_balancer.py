@@ -0,0 +1,85 @@
+"""
+Micro-benchmark du recalcul de l'équilibrage de charge (`app.allocation`).
+
+Construit un site de `--connectors` connecteurs (puissances de 7,4 à 22 kW,
+priorités et consommations mesurées variées, capacité inférieure à la
+demande totale) et mesure le temps d'un recalcul complet, puis celui qui
+suit le début d'une nouvelle session :
+
+    python -m benchmarks.bench_load_balancer --connectors 10000 --output bench_load_balancer.json
+"""
+import argparse
+import json
+import timeit
+from datetime import datetime, timezone
+
+import numpy as np
+
+from app.allocation import SiteState
+from benchmarks.stats import git_revision
+
+
+def build_site(connectors: int, seed: int = 0) -> SiteState:
+    rng = np.random.default_rng(seed)
+    rating = rng.choice([7400.0, 11000.0, 22000.0], connectors)
+    state = SiteState(
+        float(rating.sum() * 0.4),
+        [f"cp-{n // 2:05d}" for n in range(connectors)],
+        [n % 2 + 1 for n in range(connectors)],
+        rating,
+        np.full(connectors, 1380.0),
+        rng.choice([1.0, 2.0, 3.0], connectors),
+    )
+    state.active[:] = rng.random(connectors) < 0.8
+    state.transaction_ids[:] = np.arange(connectors)
+    # Un quart des véhicules se limitent eux-mêmes
+    measured = rng.random(connectors) < 0.25
+    state.power[measured] = rating[measured] * rng.uniform(0.1, 0.5, measured.sum())
+    return state
+
+
+def run(connectors: int, iterations: int, threshold: float) -> dict:
+    state = build_site(connectors)
+    full = timeit.timeit(lambda: state.rebalance(threshold), number=iterations) / iterations
+    # Limites acceptées : le recalcul suivant n'envoie que ce qui change
+    changed, limits = state.rebalance(threshold)
+    state.limit[changed] = limits
+    idle = int(np.flatnonzero(~state.active)[0])
+    state.active[idle] = True
+    started = timeit.default_timer()
+    changed, _ = state.rebalance(threshold)
+    after_start = timeit.default_timer() - started
+    result = {
+        "connectors": connectors,
+        "active": int(state.active.sum()),
+        "rebalance_ms": round(full * 1000, 3),
+        "session_start_ms": round(after_start * 1000, 3),
+        "changed_after_session_start": int(changed.size),
+    }
+    print(f"{connectors} connecteurs ({result['active']} actifs) : recalcul {result['rebalance_ms']:.3f} ms, "
+          f"début de session {result['session_start_ms']:.3f} ms, {result['changed_after_session_start']} limite(s) à envoyer")
+    return {
+        "revision": git_revision(),
+        "date": datetime.now(timezone.utc).isoformat(),
+        "iterations": iterations,
+        "threshold_w": threshold,
+        "results": result,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark du recalcul de l'équilibrage de charge")
+    parser.add_argument("--connectors", type=int, default=10000, help="Nombre de connecteurs du site")
+    parser.add_argument("--iterations", type=int, default=200, help="Nombre de recalculs mesurés")
+    parser.add_argument("--threshold", type=float, default=100, help="Écart minimal (W) pour envoyer une nouvelle limite")
+    parser.add_argument("--output", default="bench_load_balancer.json", help="Fichier JSON de résultats")
+    args = parser.parse_args()
+
+    report = run(args.connectors, args.iterations, args.threshold)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Résultats écrits dans {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Micro-benchmark de l'ingestion des valeurs de compteur (`app.meter_store`).
+
+Ingère des MeterValues réalistes (9 mesures dont courants et tensions par
+phase, relevé toutes les 10 s sur une flotte de points de charge) dans les
+tampons colonnes, puis les écrit en segments, et affiche le débit
+d'ingestion par cœur et la taille d'un échantillon sur disque comparée à sa
+taille en JSON :
+
+    python -m benchmarks.bench_meter_ingest --samples 1000000 --output bench_meter_ingest.json
+"""
+import argparse
+import json
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from app.meter_store import COLUMNS, MeterColumns, MeterStore
+from benchmarks.bench_codec import MEASURANDS
+from benchmarks.stats import git_revision
+
+
+def meter_values(charge_points: int, readings: int, seed: int = 0) -> list:
+    """Relevés (point de charge, connecteur, transaction, meterValue) toutes les 10 s."""
+    rng = random.Random(seed)
+    start = datetime(2024, 5, 21, 15, tzinfo=timezone.utc)
+    messages = []
+    for reading in range(readings):
+        timestamp = (start + timedelta(seconds=10 * reading)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        for charge_point in range(charge_points):
+            sampled_value = []
+            for measurand, unit, phase in MEASURANDS:
+                value = {"value": f"{rng.uniform(0, 50000):.1f}", "context": "Sample.Periodic", "format": "Raw", "measurand": measurand, "location": "Outlet", "unit": unit}
+                if phase:
+                    value["phase"] = phase
+                sampled_value.append(value)
+            messages.append((f"cp-{charge_point:05d}", 1, 1000 + charge_point, [{"timestamp": timestamp, "sampledValue": sampled_value}]))
+    return messages
+
+
+def slice_columns(columns: MeterColumns, offset: int, size: int) -> MeterColumns:
+    part = MeterColumns()
+    for name, _ in COLUMNS:
+        setattr(part, name, getattr(columns, name)[offset:offset + size])
+    return part
+
+
+def run(samples: int, charge_points: int, flush_rows: int) -> dict:
+    readings = max(samples // (charge_points * len(MEASURANDS)), 1)
+    messages = meter_values(charge_points, readings)
+    total = len(messages) * len(MEASURANDS)
+    json_bytes = sum(len(json.dumps(meter_value)) for _, _, _, meter_value in messages)
+    with tempfile.TemporaryDirectory() as path:
+        # Écriture des segments mesurée à part : l'ingestion seule, puis l'écriture seule
+        store = MeterStore(path, flush_rows=total + 1)
+        started = time.perf_counter()
+        for charge_point_id, connector_id, transaction_id, meter_value in messages:
+            store.ingest(charge_point_id, connector_id, transaction_id, meter_value)
+        ingest = time.perf_counter() - started
+        columns, dictionaries = store._swap()
+        started = time.perf_counter()
+        for offset in range(0, total, flush_rows):
+            store.write_segment(slice_columns(columns, offset, flush_rows), dictionaries)
+        write = time.perf_counter() - started
+    result = {
+        "samples": total,
+        "charge_points": charge_points,
+        "ingest_samples_per_s": round(total / ingest),
+        "write_samples_per_s": round(total / write),
+        "segments": store.segments,
+        "disk_bytes_per_sample": round(store.bytes_written / total, 2),
+        "json_bytes_per_sample": round(json_bytes / total, 2),
+    }
+    print(f"{total} échantillons : ingestion {result['ingest_samples_per_s']:,} éch./s, écriture {result['write_samples_per_s']:,} éch./s, "
+          f"{result['disk_bytes_per_sample']} o/éch. sur disque contre {result['json_bytes_per_sample']} o/éch. en JSON")
+    return {
+        "revision": git_revision(),
+        "date": datetime.now(timezone.utc).isoformat(),
+        "flush_rows": flush_rows,
+        "results": result,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark de l'ingestion des valeurs de compteur")
+    parser.add_argument("--samples", type=int, default=1000000, help="Nombre approximatif d'échantillons ingérés")
+    parser.add_argument("--charge-points", type=int, default=1000, help="Nombre de points de charge de la flotte simulée")
+    parser.add_argument("--flush-rows", type=int, default=65536, help="Échantillons par segment")
+    parser.add_argument("--output", default="bench_meter_ingest.json", help="Fichier JSON de résultats")
+    args = parser.parse_args()
+
+    report = run(args.samples, args.charge_points, args.flush_rows)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Résultats écrits dans {args.output}")
+
+
+if __name__ == "__main__":
+    main()
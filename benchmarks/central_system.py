@@ -0,0 +1,194 @@
+import asyncio
+import itertools
+import json
+import logging
+import random
+from datetime import datetime, timezone
+from typing import Callable, Union
+
+import websockets
+
+# MessageTypeId OCPP-J
+CALL = 2
+CALLRESULT = 3
+CALLERROR = 4
+
+DEFAULT_CONFIGURATION = {
+    "HeartbeatInterval": "300",
+    "MeterValueSampleInterval": "60",
+    "ConnectionTimeOut": "60",
+    "NumberOfConnectors": "2",
+    "AuthorizeRemoteTxRequests": "true",
+    "LocalAuthorizeOffline": "true",
+}
+
+
+def now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class CentralSystem:
+    """
+    Serveur central OCPP 1.6J local, en remplacement de SteVe pour les tests
+    et les benchmarks.
+
+    Il accepte n'importe quel chemin `.../<charge_point_id>`, répond à chaque
+    CALL avec une réponse plausible après `delay` secondes (± `jitter`), et
+    garde la configuration modifiée par ChangeConfiguration et les profils
+    posés par SetChargingProfile. `delay` peut aussi être une fonction
+    `(charge_point_id, action, payload) -> secondes`.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, delay: Union[float, Callable] = 0.0, jitter: float = 0.0):
+        self.host = host
+        self.port = port
+        self.delay = delay
+        self.jitter = jitter
+        self.connections = 0
+        self.paths = []
+        self.calls = {}
+        self.inbound = []
+        self.clients = {}
+        self.configuration = {}
+        self.charging_profiles = {}
+        self._transaction_ids = itertools.count(1)
+        self._server = None
+        self._tasks = set()
+
+    @property
+    def base_url(self) -> str:
+        return f"ws://{self.host}:{self.port}/steve/websocket/CentralSystemService"
+
+    def url_for(self, charge_point_id: str) -> str:
+        return f"{self.base_url}/{charge_point_id}"
+
+    async def start(self):
+        self._server = await websockets.serve(self._handle, self.host, self.port, subprotocols=["ocpp1.6"], compression=None)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def send_call(self, charge_point_id: str, unique_id: str, action: str, payload: dict):
+        """Envoie un CALL non sollicité au point de charge connecté."""
+        await self.clients[charge_point_id].send(json.dumps([CALL, unique_id, action, payload]))
+
+    async def _handle(self, ws):
+        charge_point_id = ws.request.path.rsplit("/", 1)[-1]
+        self.connections += 1
+        self.paths.append(ws.request.path)
+        self.clients[charge_point_id] = ws
+        try:
+            async for raw in ws:
+                message = json.loads(raw)
+                if message[0] == CALL:
+                    task = asyncio.create_task(self._reply(ws, charge_point_id, message))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+                else:
+                    self.inbound.append(message)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            if self.clients.get(charge_point_id) is ws:
+                del self.clients[charge_point_id]
+
+    async def _reply(self, ws, charge_point_id: str, message: list):
+        _, unique_id, action, payload = message
+        self.calls[action] = self.calls.get(action, 0) + 1
+        delay = self.delay(charge_point_id, action, payload) if callable(self.delay) else self.delay
+        if self.jitter:
+            delay += random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        handler = getattr(self, f"on_{action}", None)
+        if handler is None:
+            response = [CALLERROR, unique_id, "NotImplemented", f"Action {action} non supportée", {}]
+        else:
+            response = [CALLRESULT, unique_id, handler(charge_point_id, payload)]
+        try:
+            await ws.send(json.dumps(response))
+        except websockets.ConnectionClosed:
+            logging.debug("Réponse %s non envoyée: connexion fermée", action)
+
+    # Messages envoyés par le point de charge
+
+    def on_BootNotification(self, charge_point_id, payload):
+        return {"status": "Accepted", "currentTime": now(), "interval": 300}
+
+    def on_Heartbeat(self, charge_point_id, payload):
+        return {"currentTime": now()}
+
+    def on_Authorize(self, charge_point_id, payload):
+        return {"idTagInfo": {"status": "Accepted"}}
+
+    def on_StartTransaction(self, charge_point_id, payload):
+        return {"transactionId": next(self._transaction_ids), "idTagInfo": {"status": "Accepted"}}
+
+    def on_StopTransaction(self, charge_point_id, payload):
+        return {"idTagInfo": {"status": "Accepted"}}
+
+    def on_StatusNotification(self, charge_point_id, payload):
+        return {}
+
+    def on_MeterValues(self, charge_point_id, payload):
+        return {}
+
+    def on_DataTransfer(self, charge_point_id, payload):
+        return {"status": "Accepted", "data": payload.get("data")}
+
+    # Commandes que l'API relaie vers l'amont
+
+    def on_RemoteStartTransaction(self, charge_point_id, payload):
+        return {"status": "Accepted"}
+
+    def on_RemoteStopTransaction(self, charge_point_id, payload):
+        return {"status": "Accepted"}
+
+    def on_UnlockConnector(self, charge_point_id, payload):
+        return {"status": "Unlocked"}
+
+    def on_GetConfiguration(self, charge_point_id, payload):
+        configuration = {**DEFAULT_CONFIGURATION, **self.configuration.get(charge_point_id, {})}
+        keys = payload.get("key") or list(configuration)
+        return {
+            "configurationKey": [{"key": key, "readonly": False, "value": configuration[key]} for key in keys if key in configuration],
+            "unknownKey": [key for key in keys if key not in configuration],
+        }
+
+    def on_ChangeConfiguration(self, charge_point_id, payload):
+        if payload["key"] not in DEFAULT_CONFIGURATION:
+            return {"status": "NotSupported"}
+        self.configuration.setdefault(charge_point_id, {})[payload["key"]] = payload["value"]
+        return {"status": "Accepted"}
+
+    def on_SetChargingProfile(self, charge_point_id, payload):
+        self.charging_profiles[(charge_point_id, payload["connectorId"])] = payload["csChargingProfiles"]
+        return {"status": "Accepted"}
+
+
+async def main(host: str, port: int, delay: float, jitter: float):
+    async with CentralSystem(host, port, delay, jitter) as central_system:
+        logging.info("Serveur central OCPP local à l'écoute sur %s/<charge_point_id>", central_system.base_url)
+        await asyncio.Future()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serveur central OCPP 1.6J local (remplaçant de SteVe)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8180)
+    parser.add_argument("--delay", type=float, default=0.0, help="Délai de réponse en secondes")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Variation aléatoire du délai, en secondes")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(args.host, args.port, args.delay, args.jitter))
@@ -0,0 +1,222 @@
+"""
+Générateur de charge : simule une flotte de points de charge OCPP 1.6J.
+
+Chaque point de charge simulé est un `app.websocket.ChargePoint` connecté au
+serveur central, qui suit un cycle de vie réaliste : BootNotification,
+Heartbeat périodique, puis des sessions Authorize, StartTransaction,
+MeterValues périodiques et StopTransaction. Le rapport donne le débit de
+messages atteint et les latences de réponse du serveur central par action :
+
+    python -m benchmarks.load_generator --url ws://localhost:8180/steve/websocket/CentralSystemService \\
+        --charge-points 5000 --processes 4 --duration 120 --output load_results.json
+
+Sans `--url`, un serveur central local (`benchmarks.central_system`) est
+démarré dans le processus.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import websockets
+
+from app.websocket import ChargePoint
+from benchmarks.central_system import CentralSystem, now
+from benchmarks.stats import percentile, git_revision
+
+
+class Recorder:
+    """Latences (en secondes) et erreurs par action OCPP."""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, action: str, latency: float):
+        samples = self.latencies.get(action)
+        if samples is None:
+            samples = self.latencies[action] = array("d")
+        samples.append(latency)
+
+    def error(self, action: str):
+        self.errors[action] = self.errors.get(action, 0) + 1
+
+    def merge(self, other: "Recorder"):
+        for action, samples in other.latencies.items():
+            self.latencies.setdefault(action, array("d")).extend(samples)
+        for action, count in other.errors.items():
+            self.errors[action] = self.errors.get(action, 0) + count
+
+    def report(self, elapsed: float) -> dict:
+        actions = {}
+        for action in sorted(set(self.latencies) | set(self.errors)):
+            samples = sorted(self.latencies.get(action, ()))
+            actions[action] = {
+                "messages": len(samples),
+                "errors": self.errors.get(action, 0),
+                "rate_per_s": round(len(samples) / elapsed, 1),
+                "p50_ms": round(percentile(samples, 50) * 1000, 3),
+                "p95_ms": round(percentile(samples, 95) * 1000, 3),
+                "p99_ms": round(percentile(samples, 99) * 1000, 3),
+            }
+        total = sum(len(samples) for samples in self.latencies.values())
+        return {"messages": total, "rate_per_s": round(total / elapsed, 1), "actions": actions}
+
+
+class SimulatedChargePoint(ChargePoint):
+    """ChargePoint qui mesure la latence de chaque appel vers le serveur central."""
+
+    def __init__(self, id, connection, recorder: Recorder):
+        super().__init__(id, connection)
+        self.recorder = recorder
+
+    async def call(self, payload, *args, **kwargs):
+        action = type(payload).__name__
+        if action.endswith("Payload"):
+            action = action[:-len("Payload")]
+        started = time.perf_counter()
+        try:
+            response = await super().call(payload, *args, suppress=False, **kwargs)
+        except Exception:
+            self.recorder.error(action)
+            raise
+        self.recorder.record(action, time.perf_counter() - started)
+        return response
+
+
+async def heartbeat_loop(charge_point: ChargePoint, interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        await charge_point.send_heartbeat()
+
+
+async def simulate(charge_point_id: str, url: str, args, recorder: Recorder, start_delay: float):
+    """Cycle de vie complet d'un point de charge simulé, jusqu'à son annulation."""
+    await asyncio.sleep(start_delay)
+    try:
+        ws = await websockets.connect(url, subprotocols=["ocpp1.6"], compression=None, ping_interval=None)
+    except (OSError, asyncio.TimeoutError, websockets.WebSocketException):
+        recorder.error("connect")
+        return
+    charge_point = SimulatedChargePoint(charge_point_id, ws, recorder)
+    tasks = [asyncio.create_task(charge_point.start())]
+    try:
+        await charge_point.send_boot_notification()
+        await charge_point.status_notification(1, "Available", now())
+        tasks.append(asyncio.create_task(heartbeat_loop(charge_point, args.heartbeat_interval)))
+        id_tag = f"TAG-{charge_point_id}"
+        energy_wh = 0
+        while True:
+            await asyncio.sleep(random.expovariate(1 / args.idle_time))
+            await charge_point.authorize(id_tag)
+            response = await charge_point.start_transaction(1, id_tag, energy_wh, now())
+            transaction_id = response.transaction_id if response else 0
+            await charge_point.status_notification(1, "Charging", now())
+            session_end = time.monotonic() + random.expovariate(1 / args.session_duration)
+            while time.monotonic() < session_end:
+                await asyncio.sleep(args.meter_interval)
+                energy_wh += int(args.power_w * args.meter_interval / 3600)
+                await charge_point.send_meter_values(1, transaction_id, energy_wh, now())
+            await charge_point.stop_transaction(transaction_id, energy_wh, now())
+            await charge_point.status_notification(1, "Available", now())
+    finally:
+        for task in tasks:
+            task.cancel()
+        await ws.close()
+
+
+async def run_fleet(base_url: str, charge_point_ids, args) -> Recorder:
+    recorder = Recorder()
+    ramp = args.ramp / max(len(charge_point_ids), 1)
+    tasks = [
+        asyncio.create_task(simulate(charge_point_id, f"{base_url}/{charge_point_id}", args, recorder, index * ramp))
+        for index, charge_point_id in enumerate(charge_point_ids)
+    ]
+    await asyncio.sleep(args.duration)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return recorder
+
+
+def run_worker(base_url: str, charge_point_ids, args) -> Recorder:
+    """Point d'entrée d'un processus de la flotte."""
+    logging.getLogger().setLevel(args.log_level)
+    return asyncio.run(run_fleet(base_url, charge_point_ids, args))
+
+
+async def run(args) -> dict:
+    charge_point_ids = [f"{args.prefix}{index:05d}" for index in range(args.charge_points)]
+    central_system = None
+    base_url = args.url
+    if base_url is None:
+        central_system = await CentralSystem(delay=args.delay, jitter=args.jitter).start()
+        base_url = central_system.base_url
+
+    started = time.perf_counter()
+    try:
+        if args.processes > 1:
+            loop = asyncio.get_running_loop()
+            chunk = math.ceil(len(charge_point_ids) / args.processes)
+            with ProcessPoolExecutor(args.processes) as executor:
+                recorders = await asyncio.gather(*(
+                    loop.run_in_executor(executor, run_worker, base_url, charge_point_ids[offset:offset + chunk], args)
+                    for offset in range(0, len(charge_point_ids), chunk)
+                ))
+            recorder = Recorder()
+            for worker_recorder in recorders:
+                recorder.merge(worker_recorder)
+        else:
+            recorder = await run_fleet(base_url, charge_point_ids, args)
+    finally:
+        if central_system is not None:
+            await central_system.stop()
+
+    return {
+        "benchmark": "load_generator",
+        "revision": git_revision(),
+        "date": datetime.now(timezone.utc).isoformat(),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        **recorder.report(time.perf_counter() - started),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulateur de flotte de points de charge OCPP 1.6J")
+    parser.add_argument("--url", help="URL du serveur central sans l'identifiant du point de charge (défaut : serveur local)")
+    parser.add_argument("--charge-points", type=int, default=100, help="Nombre de points de charge simulés")
+    parser.add_argument("--processes", type=int, default=1, help="Nombre de processus entre lesquels répartir la flotte")
+    parser.add_argument("--prefix", default="sim-", help="Préfixe des identifiants de points de charge")
+    parser.add_argument("--duration", type=float, default=60, help="Durée de la simulation (s)")
+    parser.add_argument("--ramp", type=float, default=10, help="Durée de la montée en charge des connexions (s)")
+    parser.add_argument("--heartbeat-interval", type=float, default=60, help="Intervalle entre deux Heartbeat (s)")
+    parser.add_argument("--meter-interval", type=float, default=10, help="Intervalle entre deux MeterValues en charge (s)")
+    parser.add_argument("--idle-time", type=float, default=30, help="Durée moyenne entre deux sessions (s)")
+    parser.add_argument("--session-duration", type=float, default=60, help="Durée moyenne d'une session de charge (s)")
+    parser.add_argument("--power-w", type=float, default=11000, help="Puissance de charge simulée (W)")
+    parser.add_argument("--delay", type=float, default=0.0, help="Délai de réponse du serveur central local (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Variation du délai du serveur central local (s)")
+    parser.add_argument("--log-level", default="CRITICAL", help="Niveau de log pendant la simulation (les erreurs sont comptées dans le rapport)")
+    parser.add_argument("--output", help="Fichier JSON de résultats")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level)
+    report = asyncio.run(run(args))
+    print(f"{report['messages']} messages, {report['rate_per_s']} msg/s")
+    for action, stats in report["actions"].items():
+        print(f"  {action:20} {stats['rate_per_s']:>9} msg/s  p50={stats['p50_ms']:>8} ms  "
+              f"p95={stats['p95_ms']:>8} ms  p99={stats['p99_ms']:>8} ms  erreurs={stats['errors']}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Résultats écrits dans {args.output}")
+
+
+if __name__ == "__main__":
+    main()
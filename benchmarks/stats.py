@@ -0,0 +1,33 @@
+import math
+import subprocess
+from typing import List, Sequence
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    """Percentile `q` (0-100) par la méthode du rang le plus proche."""
+    if not sorted_values:
+        return float("nan")
+    rank = max(math.ceil(q / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+
+def summarize(latencies: List[float], elapsed: float, errors: int = 0) -> dict:
+    """Résumé d'une série de latences (en secondes) mesurées sur `elapsed` secondes."""
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "throughput_rps": round(len(values) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3) if values else float("nan"),
+    }
+
+
+def git_revision() -> str:
+    """Commit courant, pour comparer les résultats d'une révision à l'autre."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
@@ -1,2 +1,6 @@
 export PORT=8001
-uvicorn app.main:app --host 0.0.0.0 --port $PORT --reload
\ No newline at end of file
+# APP_ENV=dev : rechargement automatique à chaque modification du code
+if [ "$APP_ENV" = "dev" ]; then
+    exec uvicorn app.main:app --host 0.0.0.0 --port $PORT --reload
+fi
+exec python -m app.serve --host 0.0.0.0 --port $PORT
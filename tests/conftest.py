@@ -0,0 +1,45 @@
+import asyncio
+import os
+import tempfile
+import threading
+import httpx
+import pytest
+from dotenv import load_dotenv
+from benchmarks.central_system import CentralSystem
+
+load_dotenv()
+
+# Journal des transactions, file hors ligne et valeurs de compteur propres à la session de tests
+_data_dir = tempfile.mkdtemp()
+os.environ.setdefault("TRANSACTION_DB_PATH", os.path.join(_data_dir, "transactions.db"))
+os.environ.setdefault("OFFLINE_QUEUE_PATH", os.path.join(_data_dir, "offline_queue.db"))
+os.environ.setdefault("METER_STORE_PATH", os.path.join(_data_dir, "meter_data"))
+
+# Sans OCPP_TEST_LIVE=1, l'application vise un serveur central local lancé
+# pour la session de tests plutôt que le SteVe configuré dans .env.
+if not os.getenv("OCPP_TEST_LIVE"):
+    _loop = asyncio.new_event_loop()
+    threading.Thread(target=_loop.run_forever, daemon=True).start()
+    _central_system = asyncio.run_coroutine_threadsafe(CentralSystem().start(), _loop).result()
+    os.environ["WEBSOCKET_URL_LOCALHOST"] = _central_system.url_for(os.getenv("CHARGE_POINT_ID", "charger-01"))
+
+
+@pytest.fixture
+async def central_system():
+    """Serveur central local propre au test, sur la boucle du test."""
+    async with CentralSystem() as central_system:
+        yield central_system
+
+
+@pytest.fixture
+async def client(central_system, monkeypatch):
+    """Client HTTP de l'application, dont les points de charge pointent vers `central_system`."""
+    from app.main import app
+    from app.registry import registry
+
+    monkeypatch.setattr(registry, "base_url", central_system.base_url)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+    for charge_point_id in list(registry._sessions):
+        if charge_point_id not in registry._pinned:
+            await registry._sessions.pop(charge_point_id).close()
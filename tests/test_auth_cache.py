@@ -0,0 +1,33 @@
+from app.auth_cache import AuthorizationCache, authorization_cache
+
+
+def test_only_accepted_id_tags_are_cached():
+    cache = AuthorizationCache()
+    cache.put("TAG-1", {"status": "Accepted"})
+    assert cache.get("TAG-1") == {"status": "Accepted"}
+    cache.put("TAG-1", {"status": "Blocked"})
+    assert cache.get("TAG-1") is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_expired_and_least_recently_used_entries_are_dropped():
+    cache = AuthorizationCache(max_entries=2)
+    cache.put("TAG-OLD", {"status": "Accepted", "expiryDate": "2000-01-01T00:00:00Z"})
+    assert cache.get("TAG-OLD") is None
+    cache.put("TAG-1", {"status": "Accepted"})
+    cache.put("TAG-2", {"status": "Accepted"})
+    cache.get("TAG-1")
+    cache.put("TAG-3", {"status": "Accepted"})
+    assert cache.get("TAG-2") is None
+    assert cache.get("TAG-1") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+async def test_authorize_is_served_from_cache(client, central_system):
+    authorization_cache.clear()
+    for _ in range(3):
+        response = await client.post("/charge-points/cp-A/authorize", json={"id_tag": "TAG-CACHE"})
+        assert response.json()["id_tag_info"]["idTagInfo"]["status"] == "Accepted"
+    assert central_system.calls["Authorize"] == 1
+    stats = (await client.get("/authorization-cache")).json()
+    assert stats["hits"] == 2
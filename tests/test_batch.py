@@ -0,0 +1,18 @@
+import json
+
+
+async def test_batch_streams_results_as_they_complete(client, central_system):
+    central_system.delay = lambda charge_point_id, action, payload: (5 - int(charge_point_id[3:])) * 0.02
+    targets = [{"cp_id": f"cp-{n}"} for n in range(5)]
+    response = await client.post("/batch", json={
+        "action": "UnlockConnector",
+        "payload": {"connectorId": 1},
+        "targets": targets,
+        "concurrency": 5,
+    })
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    results = [json.loads(line) for line in response.text.splitlines()]
+    # Le point de charge le plus rapide répond en premier
+    assert [result["cp_id"] for result in results] == [f"cp-{n}" for n in reversed(range(5))]
+    assert all(result["response"] == {"status": "Unlocked"} for result in results)
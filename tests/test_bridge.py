@@ -0,0 +1,40 @@
+import json
+from fastapi.testclient import TestClient
+from app.main import app
+
+
+def receive_replies(websocket, count):
+    replies = {}
+    while len(replies) < count:
+        frame = websocket.receive_json()
+        if frame["type"] != "event":
+            replies[frame["id"]] = frame
+    return replies
+
+
+def test_bridge_matches_responses_to_request_ids():
+    with TestClient(app) as client:
+        with client.websocket_connect("/ws") as websocket:
+            websocket.send_text(json.dumps({"id": "a", "command": "heartbeat"}))
+            websocket.send_text(json.dumps({"id": "b", "action": "Authorize", "payload": {"idTag": "ABC123"}}))
+            websocket.send_text(json.dumps({"id": "c", "command": "status_notification", "payload": {"connectorId": 2}}))
+            replies = receive_replies(websocket, 3)
+    assert "currentTime" in replies["a"]["payload"]
+    assert replies["b"]["payload"] == {"idTagInfo": {"status": "Accepted"}}
+    assert replies["c"] == {"id": "c", "type": "result", "action": "StatusNotification", "payload": {}}
+
+
+def test_bridge_reports_invalid_requests():
+    with TestClient(app) as client:
+        with client.websocket_connect("/ws") as websocket:
+            websocket.send_text("reboot_everything")
+            assert websocket.receive_json() == {"id": None, "type": "error", "error": "Commande inconnue: reboot_everything"}
+
+
+def test_bridge_forwards_charge_point_events():
+    with TestClient(app) as client:
+        with client.websocket_connect("/ws") as websocket:
+            websocket.send_text("start_charging")
+            frames = [websocket.receive_json(), websocket.receive_json()]
+    events = [frame["event"] for frame in frames if frame["type"] == "event"]
+    assert events[0]["type"] == "transaction.started"
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+import websockets
+
+from app.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from app.connection import ConnectionManager
+from app.registry import registry
+
+
+def test_breaker_opens_after_threshold_and_closes_after_successful_probe():
+    breaker = CircuitBreaker("cp-1", failure_threshold=2, backoff_base=0, backoff_max=0)
+    breaker.record_failure(OSError("refused"))
+    assert breaker.state == CLOSED
+    breaker.record_failure(OSError("refused"))
+    assert breaker.state == OPEN
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success()
+    assert [transition["to"] for transition in breaker.transitions] == [OPEN, HALF_OPEN, CLOSED]
+
+
+def test_backoff_grows_while_probes_fail():
+    breaker = CircuitBreaker("cp-1", failure_threshold=1, backoff_base=10, backoff_max=25)
+    breaker.record_failure(OSError("refused"))
+    first = breaker.retry_in()
+    breaker.state = HALF_OPEN
+    breaker.record_failure(OSError("refused"))
+    assert 5 <= first <= 10 and 10 <= breaker.retry_in() <= 20
+
+
+async def test_open_circuit_fails_fast_with_503(client, monkeypatch):
+    monkeypatch.setattr(registry, "base_url", "ws://127.0.0.1:1")
+    for _ in range(3):
+        response = await client.post("/charge-points/cp-down/unlock-connector", json={"connector_id": 1})
+        assert "Connect call failed" in response.json()["error"]
+    response = await client.post("/charge-points/cp-down/unlock-connector", json={"connector_id": 1})
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+    [breaker] = (await client.get("/circuit-breakers", params={"state": "open"})).json()
+    assert breaker["chargePointId"] == "cp-down"
+
+
+async def test_cancelled_half_open_probe_reopens_circuit(monkeypatch):
+    async def hang(*args, **kwargs):
+        await asyncio.sleep(3600)
+
+    monkeypatch.setattr(websockets, "connect", hang)
+    session = ConnectionManager("ws://127.0.0.1:1/cp-probe", "cp-probe")
+    session.breaker.record_failure(OSError("refused"))
+    session.breaker.state, session.breaker.retry_at = OPEN, 0.0
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(session.connect(), 0.05)
+    assert session.breaker.state == OPEN and session.breaker.allow()
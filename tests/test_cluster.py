@@ -0,0 +1,108 @@
+import asyncio
+import json
+import tempfile
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+import app.cluster
+from app.cluster import ClusterMiddleware, Forwarder, HashRing, forwarder, ring, socket_path
+from app.registry import registry
+
+
+def test_ring_spreads_charge_points_and_moves_few_on_resize():
+    ids = [f"cp-{n}" for n in range(4000)]
+    ring = HashRing(4)
+    owners = [ring.owner(charge_point_id) for charge_point_id in ids]
+    assert all(800 < owners.count(worker) < 1200 for worker in range(4))
+    grown = HashRing(5)
+    moved = sum(ring.owner(charge_point_id) != grown.owner(charge_point_id) for charge_point_id in ids)
+    assert moved < len(ids) * 0.3
+
+
+async def test_requests_for_other_workers_are_forwarded_over_unix_socket():
+    ring = HashRing(2)
+    remote = next(f"cp-{n}" for n in range(100) if ring.owner(f"cp-{n}") == 1)
+    local = next(f"cp-{n}" for n in range(100) if ring.owner(f"cp-{n}") == 0)
+
+    def worker_app(index):
+        app = FastAPI()
+
+        @app.post("/charge-points/{cp_id}/heartbeat")
+        async def heartbeat(cp_id: str, request: Request):
+            return {"worker": index, "cp_id": cp_id, "body": (await request.json())}
+
+        return app
+
+    socket_dir = tempfile.mkdtemp()
+    server = uvicorn.Server(uvicorn.Config(worker_app(1), uds=socket_path(socket_dir, 1), lifespan="off", log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    forwarder = Forwarder(socket_dir)
+    app = ClusterMiddleware(worker_app(0), ring=ring, index=0, forward=forwarder)
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.post(f"/charge-points/{remote}/heartbeat", json={"n": 1})
+            assert response.json() == {"worker": 1, "cp_id": remote, "body": {"n": 1}}
+            response = await client.post(f"/charge-points/{local}/heartbeat", json={"n": 2})
+            assert response.json()["worker"] == 0
+    finally:
+        await forwarder.close()
+        server.should_exit = True
+        await task
+
+
+async def test_fleet_routes_reach_charge_points_of_other_workers(client, central_system, monkeypatch):
+    # Le worker courant est le 0 d'un cluster de 2 ; le worker 1 répond sur son socket Unix
+    two = HashRing(2)
+    for name in ("workers", "_keys", "_owners", "_cache"):
+        monkeypatch.setattr(ring, name, getattr(two, name))
+    monkeypatch.setattr(app.cluster, "CLUSTER_WORKERS", 2)
+    remote = next(f"cp-far-{n}" for n in range(100) if two.owner(f"cp-far-{n}") == 1)
+    local = next(f"cp-near-{n}" for n in range(100) if two.owner(f"cp-near-{n}") == 0)
+
+    worker = FastAPI()
+
+    @worker.post("/cluster/call")
+    async def call(request: Request):
+        body = await request.json()
+        return {"frame": [3, "id", {"status": "Accepted", "worker": 1, "cp_id": body["cp_id"]}]}
+
+    switched = []
+
+    @worker.put("/logging/debug/{charge_point_id}")
+    async def enable_debug(charge_point_id: str):
+        switched.append(charge_point_id)
+        return {}
+
+    @worker.get("/statuses")
+    async def statuses():
+        return [{"chargePointId": remote, "connectorId": 1, "status": "Charging", "updatedAt": "2024-05-21T15:00:00+00:00", "age": 1.0}]
+
+    socket_dir = tempfile.mkdtemp()
+    monkeypatch.setattr(forwarder, "socket_dir", socket_dir)
+    server = uvicorn.Server(uvicorn.Config(worker, uds=socket_path(socket_dir, 1), lifespan="off", log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    try:
+        response = await client.post("/batch", json={"action": "UnlockConnector", "payload": {"connectorId": 1}, "targets": [{"cp_id": remote}, {"cp_id": local}]})
+        results = {line["cp_id"]: line for line in map(json.loads, response.text.splitlines())}
+        assert results[remote]["response"] == {"status": "Accepted", "worker": 1, "cp_id": remote}
+        assert "worker" not in results[local]["response"]
+        # Aucune seconde connexion ouverte ici vers le point de charge du worker 1
+        assert remote not in registry and central_system.calls["UnlockConnector"] == 1
+
+        assert remote in {entry["chargePointId"] for entry in (await client.get("/statuses")).json()}
+
+        # Mode debug activé sur tous les workers, dont le propriétaire du point de charge
+        await client.put(f"/logging/debug/{remote}")
+        assert switched == [remote]
+        await client.delete(f"/logging/debug/{remote}")
+
+        site = {"grid_limit_w": 10000, "connectors": [{"cp_id": remote, "connector_id": 1, "max_power_w": 7400}]}
+        assert "worker 1" in (await client.put("/sites/far", json=site)).json()["error"]
+    finally:
+        await forwarder.close()
+        server.should_exit = True
+        await task
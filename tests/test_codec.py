@@ -0,0 +1,24 @@
+import pytest
+
+from app.codec import CALLERROR, Frame, FrameError, load_backend
+
+
+@pytest.mark.parametrize("backend", ["json", "orjson", "msgspec"])
+def test_frames_round_trip_with_each_backend(backend):
+    if backend != "json":
+        pytest.importorskip(backend)
+    _, dumps, loads = load_backend(backend)
+    frame = Frame.call("id-1", "MeterValues", {"connectorId": 1, "meterValue": []})
+    assert Frame.from_list(loads(dumps(frame.to_list()))).to_list() == frame.to_list()
+
+
+def test_call_error_is_decoded_once_into_fields():
+    frame = Frame.decode('[4,"id-2","NotImplemented","Action inconnue",{}]')
+    assert frame.message_type == CALLERROR and frame.is_error
+    assert (frame.unique_id, frame.error_code, frame.error_description) == ("id-2", "NotImplemented", "Action inconnue")
+
+
+@pytest.mark.parametrize("raw", ["not json", "[9, \"id\"]", "[3, \"id\"]", "{}"])
+def test_malformed_frames_are_rejected(raw):
+    with pytest.raises(FrameError):
+        Frame.decode(raw)
@@ -0,0 +1,37 @@
+from app.config_cache import ConfigurationCache
+
+
+async def test_configuration_is_served_from_cache_after_full_read(client, central_system):
+    url = "/charge-points/cp-config/get-configuration"
+    assert len((await client.post(url, json={})).json()["configuration_key"]) == 6
+    response = (await client.post(url, json={"key": ["HeartbeatInterval", "Unknown"]})).json()
+    assert response["configuration_key"][0]["value"] == "300"
+    assert response["unknown_key"] == ["Unknown"]
+    assert central_system.calls["GetConfiguration"] == 1
+
+    change = await client.post("/charge-points/cp-config/change-configuration", json={"key": "HeartbeatInterval", "value": "60"})
+    assert change.json()["status"] == "Accepted"
+    response = (await client.post(url, json={"key": ["HeartbeatInterval"]})).json()
+    assert response["configuration_key"][0]["value"] == "60"
+    assert central_system.calls["GetConfiguration"] == 1
+
+
+def test_reboot_required_marks_key_stale():
+    cache = ConfigurationCache()
+    cache.store("cp-1", [{"key": "HeartbeatInterval", "readonly": False, "value": "300"}], complete=True)
+    cache.write("cp-1", "HeartbeatInterval", "60", stale=True)
+    assert cache.lookup("cp-1", ["HeartbeatInterval"]) is None
+    cache.store("cp-1", [{"key": "HeartbeatInterval", "readonly": False, "value": "60"}], complete=False)
+    assert cache.lookup("cp-1", ["HeartbeatInterval"])[0][0]["value"] == "60"
+
+
+def test_keys_read_alone_expire():
+    cache = ConfigurationCache(max_age=60)
+    cache.store("cp-1", [{"key": "HeartbeatInterval", "readonly": False, "value": "300"}], complete=False)
+    assert cache.lookup("cp-1", ["HeartbeatInterval"]) is not None
+    cache.get("cp-1").fetched["HeartbeatInterval"] -= 61
+    assert cache.lookup("cp-1", ["HeartbeatInterval"]) is None
+    # Configuration complète ancienne : servie, et relue en arrière-plan
+    cache.store("cp-1", [{"key": "HeartbeatInterval", "readonly": False, "value": "300"}], complete=True)
+    cache.get("cp-1").fetched_at -= 61
+    assert cache.lookup("cp-1", ["HeartbeatInterval"]) is not None and cache.needs_refresh("cp-1")
@@ -0,0 +1,54 @@
+import asyncio
+from app.connection import ConnectionManager, on_call, call_handlers
+
+
+async def test_connection_is_reused(central_system):
+    manager = ConnectionManager(central_system.url_for("charger-01"))
+    for _ in range(5):
+        response = await manager.call("Heartbeat", {})
+        assert response.message_type == 3
+    assert manager.connect_count == 1
+    assert central_system.connections == 1
+    await manager.close()
+
+
+async def test_reconnects_after_close(central_system):
+    manager = ConnectionManager(central_system.url_for("charger-01"))
+    await manager.call("Heartbeat", {})
+    await manager._ws.close()
+    await manager.call("Heartbeat", {})
+    assert manager.connect_count == 2
+    await manager.close()
+
+
+async def test_concurrent_calls_are_correlated(central_system):
+    # Les réponses arrivent dans l'ordre inverse des envois
+    central_system.delay = lambda charge_point_id, action, payload: (10 - int(payload["data"])) * 0.01
+    manager = ConnectionManager(central_system.url_for("charger-01"))
+    responses = await asyncio.gather(*(
+        manager.call("DataTransfer", {"vendorId": "test", "data": str(n)}) for n in range(10)
+    ))
+    assert [response.payload["data"] for response in responses] == [str(n) for n in range(10)]
+    assert manager.pending_calls == 0
+    await manager.close()
+
+
+async def test_inbound_call_is_dispatched(central_system):
+    manager = ConnectionManager(central_system.url_for("charger-01"))
+
+    @on_call("TriggerMessage")
+    async def trigger_message(connection, payload):
+        return {"status": "Accepted"}
+
+    try:
+        await manager.call("Heartbeat", {})
+        await central_system.send_call("charger-01", "cs-1", "TriggerMessage", {"requestedMessage": "Heartbeat"})
+        await central_system.send_call("charger-01", "cs-2", "Reset", {"type": "Soft"})
+        while len(central_system.inbound) < 2:
+            await asyncio.sleep(0.01)
+        inbound = {message[1]: message for message in central_system.inbound}
+        assert inbound["cs-1"] == [3, "cs-1", {"status": "Accepted"}]
+        assert inbound["cs-2"][2] == "NotImplemented"
+    finally:
+        call_handlers.pop("TriggerMessage", None)
+        await manager.close()
@@ -0,0 +1,43 @@
+import pytest
+from app.connection import ConnectionManager
+from app.deadlines import CallTimeoutError, call_budget, call_deadline, parse_call_timeouts
+
+
+def test_parse_call_timeouts_overrides_defaults():
+    timeouts = parse_call_timeouts("Heartbeat=2, DataTransfer=45")
+    assert timeouts["Heartbeat"] == 2
+    assert timeouts["DataTransfer"] == 45
+    assert timeouts["GetDiagnostics"] == 120
+
+
+def test_budget_is_capped_by_request_deadline():
+    assert call_budget("Heartbeat", 5) == 5
+    token = call_deadline.set(0)
+    try:
+        assert call_budget("Heartbeat", 5) <= 0
+    finally:
+        call_deadline.reset(token)
+
+
+async def test_timed_out_call_frees_its_pending_entry(central_system):
+    central_system.delay = 1
+    manager = ConnectionManager(central_system.url_for("charger-01"))
+    with pytest.raises(CallTimeoutError):
+        await manager.call("Heartbeat", {}, timeout=0.05)
+    assert manager.pending_calls == 0
+    # La connexion reste utilisable après l'abandon
+    central_system.delay = 0
+    response = await manager.call("Heartbeat", {})
+    assert not response.is_error
+    await manager.close()
+
+
+async def test_deadline_header_returns_504(client, central_system):
+    central_system.delay = 1
+    response = await client.post("/charge-points/cp-slow/unlock-connector", json={"connector_id": 1}, headers={"X-Deadline-Ms": "50"})
+    assert response.status_code == 504
+
+
+async def test_invalid_deadline_header_returns_400(client):
+    response = await client.post("/charge-points/cp-slow/unlock-connector", json={"connector_id": 1}, headers={"X-Deadline-Ms": "soon"})
+    assert response.status_code == 400
@@ -0,0 +1,53 @@
+import pytest
+from fastapi import WebSocketDisconnect
+from fastapi.testclient import TestClient
+from app.events import EventBus, Subscription
+from app.main import app
+
+
+def test_slow_subscriber_gets_coalesced_status():
+    subscription = Subscription(maxsize=10)
+    for status in ("Preparing", "Charging", "SuspendedEV"):
+        subscription.push({"type": "status", "chargePointId": "cp-A", "connectorId": 1, "status": status})
+    assert len(subscription._pending) == 1
+    assert next(iter(subscription._pending.values()))["status"] == "SuspendedEV"
+
+
+def test_full_queue_drops_oldest_events():
+    subscription = Subscription(maxsize=2)
+    for transaction_id in range(3):
+        subscription.push({"type": "transaction.started", "chargePointId": "cp-A", "connectorId": 1, "transactionId": transaction_id})
+    assert [event["transactionId"] for event in subscription._pending.values()] == [1, 2]
+    assert subscription.dropped == 1
+
+
+def test_bus_applies_filters():
+    bus = EventBus()
+    with bus.subscribe(charge_point_id="cp-A", connector_id=2) as subscription:
+        bus.publish("status", "cp-A", 1, status="Available")
+        bus.publish("status", "cp-B", 2, status="Available")
+        bus.publish("status", "cp-A", 2, status="Faulted")
+        assert [event["status"] for event in subscription._pending.values()] == ["Faulted"]
+    assert len(bus) == 0
+
+
+def test_websocket_receives_transaction_events():
+    with TestClient(app) as client:
+        with client.websocket_connect("/ws/events?types=transaction.started,transaction.stopped") as websocket:
+            client.post("/start", params={"connector_id": 2, "id_tag": "TAG-EVENTS"})
+            event = websocket.receive_json()
+            client.post("/stop", params={"transaction_id": event["transactionId"]})
+            stopped = websocket.receive_json()
+    assert event["type"] == "transaction.started"
+    assert event["connectorId"] == 2
+    assert event["transactionId"] is not None
+    # Connecteur retrouvé dans le journal, StopTransaction ne le précisant pas
+    assert (stopped["type"], stopped["connectorId"]) == ("transaction.stopped", 2)
+
+
+def test_websocket_rejects_invalid_connector_id():
+    with TestClient(app) as client:
+        with client.websocket_connect("/ws/events?connector_id=abc") as websocket:
+            with pytest.raises(WebSocketDisconnect) as closed:
+                websocket.receive_json()
+    assert closed.value.code == 1008
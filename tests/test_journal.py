@@ -0,0 +1,60 @@
+import asyncio
+
+from app.journal import TransactionJournal
+
+
+async def test_start_and_stop_are_journaled_and_deduplicated(client, central_system):
+    params = {"connector_id": 1, "id_tag": "TAG-J", "timestamp": "2024-01-01T10:00:00Z"}
+    first = (await client.post("/charge-points/cp-journal/start", params=params)).json()
+    again = (await client.post("/charge-points/cp-journal/start", params=params)).json()
+    assert first["transactionId"] == again["transactionId"]
+    assert central_system.calls["StartTransaction"] == 1
+
+    stop = {"transaction_id": first["transactionId"], "meter_stop": 1500, "timestamp": "2024-01-01T11:00:00Z"}
+    for _ in range(2):
+        assert (await client.post("/charge-points/cp-journal/stop", params=stop)).json()["transactionId"] == first["transactionId"]
+    assert central_system.calls["StopTransaction"] == 1
+
+    [transaction] = (await client.get("/transactions", params={"id_tag": "TAG-J"})).json()
+    assert (transaction["chargePointId"], transaction["meterStop"]) == ("cp-journal", 1500)
+
+
+async def test_open_transactions_survive_restart(tmp_path):
+    path = str(tmp_path / "journal.db")
+    journal = TransactionJournal(path, flush_interval=0)
+    journal.record_start("cp-1", {"connectorId": 2, "idTag": "TAG", "meterStart": 0, "timestamp": "t0"}, {"transactionId": 7, "idTagInfo": {"status": "Accepted"}})
+    await journal.close()
+    reopened = TransactionJournal(path)
+    assert reopened.find_start("cp-1", 2, "TAG", "t0") == 7
+    assert reopened.connector_of("cp-1", 7) == 2
+    assert [row["transactionId"] for row in await reopened.query(open_only=True)] == [7]
+    await reopened.close()
+
+
+async def test_stops_are_deduplicated_after_restart_and_refused_starts_skipped(tmp_path):
+    path = str(tmp_path / "journal.db")
+    journal = TransactionJournal(path, flush_interval=0)
+    journal.record_start("cp-1", {"connectorId": 1, "idTag": "TAG", "meterStart": 0, "timestamp": "t0"}, {"transactionId": 7, "idTagInfo": {"status": "Accepted"}})
+    journal.record_start("cp-1", {"connectorId": 2, "idTag": "BLOCKED", "meterStart": 0, "timestamp": "t0"}, {"transactionId": 8, "idTagInfo": {"status": "Blocked"}})
+    journal.record_stop("cp-1", {"transactionId": 7, "meterStop": 100, "timestamp": "t1"}, {"idTagInfo": {"status": "Accepted"}})
+    await journal.close()
+    reopened = TransactionJournal(path)
+    assert await reopened.find_stop("cp-1", 7) == {}
+    assert await reopened.find_stop("cp-1", 9) is None
+    assert reopened.find_start("cp-1", 2, "BLOCKED", "t0") is None
+    assert [row["transactionId"] for row in await reopened.query()] == [7]
+    await reopened.close()
+
+
+async def test_first_stop_does_not_wait_for_the_batch(tmp_path):
+    journal = TransactionJournal(str(tmp_path / "journal.db"), flush_interval=60)
+    journal.record_start("cp-1", {"connectorId": 1, "idTag": "TAG", "meterStart": 0, "timestamp": "t0"}, {"transactionId": 7, "idTagInfo": {"status": "Accepted"}})
+    assert await asyncio.wait_for(journal.find_stop("cp-1", 7), 1) is None
+    assert await asyncio.wait_for(journal.find_stop("cp-1", 8), 1) is None
+    journal.record_stop("cp-1", {"transactionId": 7, "meterStop": 100, "timestamp": "t1"}, {"idTagInfo": {"status": "Accepted"}})
+    assert await journal.find_stop("cp-1", 7) == {"idTagInfo": {"status": "Accepted"}}
+    # Lot annulé : écrit à l'arrêt de la tâche, sans attendre les 60 s
+    flusher = journal._flusher
+    flusher.cancel()
+    await asyncio.gather(flusher, return_exceptions=True)
+    await journal.close()
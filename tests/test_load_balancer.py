@@ -0,0 +1,52 @@
+import numpy as np
+
+from app.allocation import SiteState, allocate
+
+
+def test_allocation_shares_capacity_by_priority_within_caps():
+    active = np.array([True, True, True, False])
+    demand = np.array([22000.0, 22000.0, 3000.0, 22000.0])
+    minimum = np.full(4, 1380.0)
+    allocation = allocate(20000, active, demand, minimum, np.array([1.0, 2.0, 1.0, 1.0]))
+    assert allocation.sum() == np.float64(20000)
+    # Le véhicule limité à 3 kW reçoit sa demande, le reste est partagé 1:2
+    assert allocation[2] == 3000 and allocation[3] == 0
+    assert np.isclose(allocation[1] - 1380, 2 * (allocation[0] - 1380))
+
+
+def test_minimums_beyond_capacity_pause_lowest_priority():
+    active = np.ones(3, dtype=bool)
+    allocation = allocate(3000, active, np.full(3, 7400.0), np.full(3, 1380.0), np.array([1.0, 3.0, 2.0]))
+    assert allocation[0] == 0
+    assert allocation[1:].sum() == 3000 and (allocation[1:] >= 1380).all()
+
+
+def test_self_limited_vehicle_frees_power_and_stays_stable():
+    state = SiteState(20000, ["cp-1", "cp-2"], [1, 1], [22000, 22000], [1380, 1380], [1, 1])
+    state.active[:] = True
+    state.power[0] = 4000
+    changed, limits = state.rebalance(100)
+    assert limits.tolist() == [4400, 15600]
+    state.limit[changed] = limits
+    assert state.rebalance(100)[0].size == 0
+
+
+async def test_site_pushes_only_changed_limits(client, central_system):
+    connectors = [{"cp_id": f"cp-site-{n}", "max_power_w": 11000} for n in range(3)]
+    site = (await client.put("/sites/depot", json={"grid_limit_w": 15000, "connectors": connectors})).json()
+    assert site["active_sessions"] == 0
+
+    for n in range(2):
+        await client.post(f"/charge-points/cp-site-{n}/start", params={"id_tag": "TAG-S", "timestamp": f"2024-01-01T10:0{n}:00Z"})
+    result = (await client.post("/sites/depot/rebalance")).json()
+    assert (result["changed"], result["accepted"]) == (2, 2)
+    limits = [central_system.charging_profiles[(f"cp-site-{n}", 1)]["chargingSchedule"]["chargingSchedulePeriod"][0]["limit"] for n in range(2)]
+    assert limits == [7500, 7500]
+
+    # Répartition inchangée : aucun nouvel envoi
+    assert (await client.post("/sites/depot/rebalance")).json()["changed"] == 0
+    assert central_system.calls["SetChargingProfile"] == 2
+
+    await client.post("/charge-points/cp-site-2/start", params={"id_tag": "TAG-S", "timestamp": "2024-01-01T10:02:00Z"})
+    assert (await client.post("/sites/depot/rebalance")).json()["changed"] == 3
+    assert (await client.get("/sites/depot")).json()["allocated_w"] == 15000
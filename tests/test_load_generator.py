@@ -0,0 +1,13 @@
+import argparse
+from benchmarks.load_generator import run_fleet
+
+
+async def test_simulated_fleet_runs_full_lifecycle(central_system):
+    args = argparse.Namespace(
+        heartbeat_interval=0.1, meter_interval=0.05, idle_time=0.05, session_duration=0.2, power_w=11000, ramp=0.1, duration=1.0,
+    )
+    recorder = await run_fleet(central_system.base_url, ["sim-1", "sim-2", "sim-3"], args)
+    assert len(recorder.latencies["BootNotification"]) == 3
+    for action in ("Heartbeat", "Authorize", "StartTransaction", "MeterValues", "StopTransaction"):
+        assert len(recorder.latencies[action]) > 0
+    assert recorder.errors == {}
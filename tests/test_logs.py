@@ -0,0 +1,52 @@
+import json
+import logging
+import queue
+import weakref
+from app.codec import Frame
+from app.logs import DeferredQueueHandler, JsonFormatter, PayloadLogPolicy
+
+
+def test_json_formatter_includes_extra_fields():
+    record = logging.LogRecord("app", logging.INFO, __file__, 1, "CALL %s", ("Heartbeat",), None)
+    record.charge_point_id = "cp-1"
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "CALL Heartbeat"
+    assert entry["level"] == "INFO"
+    assert entry["charge_point_id"] == "cp-1"
+
+
+def test_payloads_are_logged_on_error_or_for_debug_charge_points(caplog):
+    policy = PayloadLogPolicy(sample_rate=0, debug_charge_points="cp-debug")
+    caplog.set_level(logging.INFO)
+    policy.log_call("cp-1", "Heartbeat", {}, Frame.result("1", {"currentTime": "now"}))
+    assert not caplog.records
+    policy.log_call("cp-1", "Reset", {"type": "Soft"}, Frame.error("2", "NotImplemented", "non supportée"), error=True)
+    policy.log_call("cp-debug", "Heartbeat", {}, Frame.result("3", {}))
+    assert [record.charge_point_id for record in caplog.records] == ["cp-1", "cp-debug"]
+    assert caplog.records[0].response[2] == "NotImplemented"
+
+
+async def test_debug_override_can_be_switched_at_runtime(client):
+    response = await client.put("/logging/debug/cp-7")
+    assert "cp-7" in response.json()["debug_charge_points"]
+    response = await client.delete("/logging/debug/cp-7")
+    assert "cp-7" not in response.json()["debug_charge_points"]
+    assert (await client.put("/logging/sample-rate", params={"rate": 2})).status_code == 422
+
+
+def test_queued_records_carry_a_snapshot_of_whitelisted_fields():
+    class Connection:
+        pass
+
+    handler = DeferredQueueHandler(queue.SimpleQueue())
+    request = {"idTag": "TAG"}
+    connection = Connection()
+    record = logging.LogRecord("app", logging.INFO, __file__, 1, "CALL %s", ("Authorize",), None)
+    record.__dict__.update(charge_point_id="cp-1", request=request, websocket=weakref.proxy(connection))
+    prepared = handler.prepare(record)
+    # Modifié ou libéré après l'appel, avant que le listener ne formate l'enregistrement
+    request["idTag"] = "AUTRE"
+    del connection
+    entry = json.loads(JsonFormatter().format(prepared))
+    assert entry["request"] == {"idTag": "TAG"} and entry["charge_point_id"] == "cp-1"
+    assert "websocket" not in entry and "websocket" in vars(record)
@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+from types import SimpleNamespace
+
+from app.journal import transaction_journal
+from app.meter_store import COLUMNS, MeterStore, meter_store, read_segment, store_transaction_data
+
+METER_VALUE = [{
+    "timestamp": "2024-05-21T15:00:00Z",
+    "sampledValue": [
+        {"value": "1234.5", "measurand": "Energy.Active.Import.Register", "unit": "Wh"},
+        {"value": "7.2", "measurand": "Power.Active.Import", "unit": "kW"},
+        {"value": "16", "measurand": "Current.Import", "phase": "L1", "unit": "A"},
+        {"value": "16.1", "measurand": "Current.Import", "phase": "L2", "unit": "A"},
+        {"value": "c2lnbmVk", "format": "SignedData"},
+    ],
+}]
+
+
+async def test_samples_are_buffered_as_columns_and_flushed_to_segments(tmp_path):
+    store = MeterStore(str(tmp_path), flush_rows=6, flush_interval=60)
+    assert store.ingest("cp-1", 2, 42, METER_VALUE) == 4
+    assert store.rejected == 1 and store.buffered == 4 and not store.segment_paths()
+
+    # Lot plein : le segment est écrit sans attendre flush_interval
+    store.ingest("cp-1", 2, 42, [{"timestamp": "2024-05-21T16:00:00Z", "sampledValue": [{"value": "9000"}, {"value": "20", "measurand": "SoC"}]}])
+    await asyncio.sleep(0.1)
+    [path] = store.segment_paths()
+    segment = read_segment(path)
+    columns, dictionaries = segment["columns"], segment["dictionaries"]
+    assert segment["rows"] == 6 and store.buffered == 0
+    assert [dictionaries["measurand"][code] for code in columns["measurand"]] == [
+        "Energy.Active.Import.Register", "Power.Active.Import", "Current.Import", "Current.Import", "Energy.Active.Import.Register", "SoC",
+    ]
+    assert [dictionaries["phase"][code] for code in columns["phase"][2:4]] == ["L1", "L2"]
+    assert list(columns["value"]) == [1234.5, 7.2, 16.0, 16.1, 9000.0, 20.0]
+    assert set(columns["connector"]) == {2} and set(columns["transaction"]) == {42}
+    assert columns["timestamp"][-1] - columns["timestamp"][0] == 3600
+    await store.close()
+
+
+async def test_meter_values_route_stores_samples(client, central_system):
+    before = meter_store.ingested
+    response = await client.post("/charge-points/cp-meter/meter-values", json={"connector_id": 1, "transaction_id": 7, "meter_value": METER_VALUE})
+    assert response.json()["meter_value"] == {}
+    assert meter_store.ingested - before == 4
+    await meter_store.flush()
+    stats = (await client.get("/meter-store")).json()
+    assert stats["buffered"] == 0 and "Power.Active.Import" in stats["measurands"]
+
+
+async def test_transaction_data_takes_the_connector_from_the_journal():
+    transaction_journal.record_start("cp-meter-stop", {"connectorId": 3, "idTag": "TAG", "meterStart": 0, "timestamp": "t0"}, {"transactionId": 77, "idTagInfo": {"status": "Accepted"}})
+    transaction_journal.record_stop("cp-meter-stop", {"transactionId": 77, "meterStop": 10, "timestamp": "t1"}, {})
+    await meter_store.flush()
+    store_transaction_data(SimpleNamespace(charge_point_id="cp-meter-stop"), {"transactionId": 77, "transactionData": METER_VALUE}, {})
+    assert list(meter_store._columns.connector) == [3] * 4
+    await meter_store.flush()
+
+
+async def test_close_waits_for_the_write_in_progress(tmp_path):
+    store = MeterStore(str(tmp_path), flush_rows=4, flush_interval=60)
+    write_segment, writes, running = store.write_segment, [], []
+
+    def slow_write(columns, dictionaries):
+        running.append(columns)
+        writes.append((len(columns), len(running)))
+        time.sleep(0.1)
+        running.remove(columns)
+        return write_segment(columns, dictionaries)
+
+    store.write_segment = slow_write
+    store.ingest("cp-1", 1, None, METER_VALUE)
+    await asyncio.sleep(0.01)
+    # Échantillons reçus pendant l'écriture du premier lot
+    store.ingest("cp-1", 1, None, METER_VALUE[:1] + [{"timestamp": "2024-05-21T15:00:10Z", "sampledValue": [{"value": "1"}]}])
+    await store.close()
+    # Second lot écrit après le premier, jamais en même temps
+    assert writes == [(4, 1), (5, 1)] and store.buffered == 0
+    assert sum(read_segment(path)["rows"] for path in store.segment_paths()) == 9
+
+
+def test_malformed_meter_values_are_rejected():
+    store = MeterStore("unused")
+    assert store.ingest("cp-1", 1, None, ["texte", {"timestamp": "2024-05-21T15:00:00Z", "sampledValue": "1"}]) == 0
+    assert store.ingest("cp-1", 1, None, "texte") == 0
+    assert store.rejected == 3
+
+
+def test_invalid_fields_never_misalign_columns():
+    store = MeterStore("unused")
+    samples = [{"value": "1", "phase": ["L1"]}, {"value": "2", "unit": 5}] + [{"value": "3", "unit": f"u{n}"} for n in range(70000)]
+    store.ingest("cp-1", 1, None, [{"timestamp": "2024-05-21T15:00:00Z", "sampledValue": samples}])
+    assert store.ingest("cp-1", "1", None, METER_VALUE) == 0
+    lengths = {len(getattr(store._columns, name)) for name, _ in COLUMNS}
+    # Codes d'unité épuisés : les échantillons suivants sont refusés, les colonnes restent alignées
+    assert lengths == {65535} and store.rejected == 2 + 70000 - 65535 + 1
@@ -0,0 +1,33 @@
+from app.connection import ConnectionManager
+from app.metrics import Histogram, ocpp_call_duration, ocpp_call_errors
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("latency_seconds", "Latence", ("route",), buckets=(0.1, 1))
+    for value in (0.05, 0.5, 5):
+        histogram.observe(value, "/a")
+    lines = histogram.render()
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{route="/a",le="1"} 2' in lines
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{route="/a"} 3' in lines
+
+
+async def test_call_phases_and_errors_are_recorded(central_system):
+    manager = ConnectionManager(central_system.url_for("charger-01"))
+    before = ocpp_call_duration.count("Heartbeat", "recv")
+    errors = ocpp_call_errors.value("Reset", "NotImplemented")
+    await manager.call("Heartbeat", {})
+    await manager.call("Reset", {"type": "Soft"})
+    assert ocpp_call_duration.count("Heartbeat", "recv") == before + 1
+    assert ocpp_call_errors.value("Reset", "NotImplemented") == errors + 1
+    await manager.close()
+
+
+async def test_metrics_endpoint_exposes_routes_and_gauges(client):
+    await client.post("/charge-points/cp-metrics/unlock-connector", json={"connector_id": 1})
+    response = await client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'route="/charge-points/{cp_id}/unlock-connector"' in response.text
+    assert "ocpp_upstream_connections " in response.text
+    assert "# TYPE ocpp_call_duration_seconds histogram" in response.text
@@ -0,0 +1,81 @@
+import asyncio
+import json
+
+import pytest
+
+from app.connection import ConnectionManager
+from app.offline_queue import OfflineQueue, offline_queue
+from app.registry import registry
+from app.scheduler import QueueFullError
+from app.validation import PayloadValidationError
+
+
+async def test_transaction_messages_are_queued_then_replayed_in_order(central_system, tmp_path, monkeypatch):
+    received = []
+    central_system.delay = lambda charge_point_id, action, payload: received.append((action, payload)) or 0
+    queue = OfflineQueue(str(tmp_path / "queue.db"), replay_rate=1000)
+    down = ConnectionManager("ws://127.0.0.1:1/cp-offline", "cp-offline")
+    start = {"connectorId": 1, "idTag": "TAG", "meterStart": 0, "timestamp": "2024-01-01T10:00:00Z"}
+    stop = {"transactionId": 1, "meterStop": 4200, "timestamp": "2024-01-01T11:00:00Z"}
+
+    assert await queue.send_or_enqueue(down, "StartTransaction", start) is None
+    assert await queue.send_or_enqueue(down, "StopTransaction", stop) is None
+    assert down.connect_failures == 1
+    with pytest.raises(OSError):
+        await queue.send_or_enqueue(down, "Heartbeat", {})
+    assert queue.stats()["by_charge_point"] == {"cp-offline": 2}
+
+    monkeypatch.setattr(registry, "base_url", central_system.base_url)
+    try:
+        assert await queue.drain("cp-offline") == 2
+        assert queue.depth() == 0
+    finally:
+        await registry._sessions.pop("cp-offline").close()
+        await queue.close()
+    assert received == [("StartTransaction", start), ("StopTransaction", stop)]
+
+
+async def test_deadline_expiry_is_not_queued(client, central_system):
+    central_system.delay = 0.5
+    response = await client.post("/charge-points/cp-late/start", headers={"X-Deadline-Ms": "50"})
+    assert response.status_code == 504
+    assert offline_queue.depth("cp-late") == 0
+
+
+async def test_full_scheduler_queue_pauses_replay(tmp_path, monkeypatch):
+    class BusySession:
+        async def call(self, action, payload):
+            raise QueueFullError("cp-busy", "transaction", 1.0)
+
+    queue = OfflineQueue(str(tmp_path / "queue.db"), replay_rate=1000)
+    await asyncio.gather(*(queue.enqueue("cp-busy", "MeterValues", {"connectorId": 1, "meterValue": [n]}) for n in range(3)))
+    monkeypatch.setattr(registry, "get", lambda charge_point_id: BusySession())
+    try:
+        # Le rejeu s'interrompt sans erreur et garde les messages pour le prochain intervalle
+        assert await queue.drain("cp-busy") == 0
+        assert queue.depth("cp-busy") == 3
+        assert [json.loads(row[0])["meterValue"] for row in queue._db.execute("SELECT payload FROM offline_queue ORDER BY id")] == [[0], [1], [2]]
+    finally:
+        await queue.close()
+
+
+async def test_invalid_payloads_are_refused_before_queueing_and_skipped_on_replay(central_system, tmp_path, monkeypatch):
+    queue = OfflineQueue(str(tmp_path / "queue.db"), replay_rate=1000)
+    down = ConnectionManager("ws://127.0.0.1:1/cp-invalid", "cp-invalid")
+    valid = {"connectorId": 1, "meterValue": [{"timestamp": "2024-01-01T10:00:00Z", "sampledValue": [{"value": "10"}]}]}
+    with pytest.raises(PayloadValidationError):
+        await queue.send_or_enqueue(down, "MeterValues", {"meterValue": [{"foo": 1}]})
+    assert queue.depth("cp-invalid") == 0
+
+    # Message non conforme déjà en file (écrit avant la validation) : écarté au rejeu sans bloquer le suivant
+    await queue.enqueue("cp-invalid", "MeterValues", {"meterValue": [{"foo": 1}]})
+    await queue.enqueue("cp-invalid", "MeterValues", valid)
+    monkeypatch.setattr(registry, "base_url", central_system.base_url)
+    try:
+        assert await queue.drain("cp-invalid") == 2
+        assert (queue.depth("cp-invalid"), queue.rejected) == (0, 1)
+        assert central_system.calls["MeterValues"] == 1
+    finally:
+        await registry._sessions.pop("cp-invalid").close()
+        await queue.close()
+        await down.close()
@@ -0,0 +1,32 @@
+import asyncio
+from app.registry import SessionRegistry
+
+
+async def test_charge_point_routes_use_their_own_connection(client, central_system):
+    for charge_point_id in ("cp-A", "cp-B", "cp-A"):
+        response = await client.get(f"/charge-points/{charge_point_id}/heartbeat")
+        assert response.status_code == 200
+        assert "current_time" in response.json()
+    assert sorted(path.rsplit("/", 1)[1] for path in central_system.paths) == ["cp-A", "cp-B"]
+
+
+async def test_idle_sessions_are_evicted(central_system):
+    sessions = SessionRegistry(central_system.base_url, idle_timeout=0)
+    await sessions.get("cp-A").call("Heartbeat", {})
+    assert "cp-A" in sessions
+    await sessions.evict_idle()
+    assert len(sessions) == 0
+
+
+async def test_drain_waits_for_pending_calls(central_system):
+    central_system.delay = 0.2
+    sessions = SessionRegistry(central_system.base_url)
+    await sessions.get("cp-A").connect()
+    call = asyncio.create_task(sessions.get("cp-A").call("Heartbeat", {}))
+    await asyncio.sleep(0.05)
+    assert sessions.pending_calls() == 1
+    assert await sessions.drain(timeout=2) == 0
+    # La réponse est arrivée : la tâche n'a plus qu'à reprendre la main
+    response = await asyncio.wait_for(call, 0.5)
+    assert not response.is_error
+    await sessions.close()
@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from app.codec import Frame
+from app.registry import registry
+from app.rollout import RolloutError, RolloutJob
+
+
+async def rollout(client, configuration, cp_ids):
+    job = (await client.post("/rollouts", json={"configuration": configuration, "targets": {"cp_ids": cp_ids}})).json()
+    response = await client.get(f"/rollouts/{job['id']}/stream")
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+async def test_rollout_changes_only_differing_keys(client, central_system):
+    central_system.configuration["cp-ro-0"] = {"HeartbeatInterval": "600"}
+    cp_ids = [f"cp-ro-{n}" for n in range(3)]
+    configuration = {"HeartbeatInterval": "600", "MeterValueSampleInterval": "30"}
+    *results, summary = await rollout(client, configuration, cp_ids)
+    assert sorted(result["cp_id"] for result in results) == cp_ids
+    assert (summary["state"], summary["changed"], summary["failed"]) == ("completed", 3, 0)
+    assert central_system.calls["ChangeConfiguration"] == 5
+    assert central_system.configuration["cp-ro-2"] == configuration
+
+    # Configuration connue du cache et déjà conforme : aucun CALL
+    *results, summary = await rollout(client, configuration, cp_ids)
+    assert summary["unchanged"] == 3
+    assert (central_system.calls["GetConfiguration"], central_system.calls["ChangeConfiguration"]) == (3, 5)
+
+
+async def test_unknown_key_fails_target(client, central_system):
+    [result, summary] = await rollout(client, {"NoSuchKey": "1"}, ["cp-ro-unknown"])
+    assert result["skipped"] == {"NoSuchKey": "UnknownKey"}
+    assert summary["failed"] == 1 and "ChangeConfiguration" not in central_system.calls
+
+
+async def test_transport_errors_are_retried(monkeypatch):
+    attempts = []
+
+    async def flaky_call(charge_point_id, action, payload):
+        attempts.append(charge_point_id)
+        if len(attempts) < 3:
+            raise ConnectionError("connexion fermée")
+        return Frame.result("id", {"status": "Accepted"})
+
+    monkeypatch.setattr(registry, "call", flaky_call)
+    job = RolloutJob({"HeartbeatInterval": "600"}, ["cp"], concurrency=1, max_attempts=3, retry_delay=0)
+    assert await job._call("cp", "ChangeConfiguration", {}) == {"status": "Accepted"}
+    assert job.retries == 2
+
+
+async def test_call_errors_fail_without_retry(monkeypatch):
+    attempts = []
+
+    async def refusing_call(charge_point_id, action, payload):
+        attempts.append(action)
+        return Frame.error("id", "NotSupported", "action non supportée")
+
+    monkeypatch.setattr(registry, "call", refusing_call)
+    job = RolloutJob({"HeartbeatInterval": "600"}, ["cp"], concurrency=1, max_attempts=3, retry_delay=0)
+    with pytest.raises(RolloutError, match="NotSupported"):
+        await job._call("cp", "ChangeConfiguration", {})
+    assert (len(attempts), job.retries) == (1, 0)
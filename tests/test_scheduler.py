@@ -0,0 +1,50 @@
+import asyncio
+import pytest
+from app.registry import registry
+from app.scheduler import BULK, CRITICAL, CallScheduler, QueueFullError, parse_call_priorities
+
+
+async def test_urgent_calls_overtake_queued_bulk_calls():
+    scheduler = CallScheduler("cp-1", rate=50, burst=1)
+    await scheduler.acquire(BULK)
+    order = []
+
+    async def call(priority, name):
+        await scheduler.acquire(priority)
+        order.append(name)
+
+    tasks = [asyncio.create_task(call(BULK, f"config-{n}")) for n in range(3)]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(call(CRITICAL, "unlock")))
+    await asyncio.gather(*tasks)
+    assert order == ["unlock", "config-0", "config-1", "config-2"]
+
+
+async def test_full_queue_rejects_and_timed_out_waiter_frees_its_slot():
+    scheduler = CallScheduler("cp-1", rate=1, burst=1, max_queue=1)
+    await scheduler.acquire(BULK)
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(scheduler.acquire(BULK), 0.05)
+    assert scheduler.depth() == 0
+    waiter = asyncio.create_task(scheduler.acquire(BULK))
+    await asyncio.sleep(0)
+    with pytest.raises(QueueFullError):
+        await scheduler.acquire(BULK)
+    waiter.cancel()
+
+
+def test_priorities_can_be_overridden():
+    assert parse_call_priorities("DataTransfer=bulk")["DataTransfer"] == BULK
+    with pytest.raises(ValueError):
+        parse_call_priorities("Reset=urgent")
+
+
+async def test_full_queue_answers_429(client):
+    registry.get("cp-busy").scheduler = CallScheduler("cp-busy", rate=0.1, burst=1, max_queue=1)
+    responses = await asyncio.gather(*(
+        client.post("/charge-points/cp-busy/unlock-connector", json={"connector_id": 1}, headers={"X-Deadline-Ms": "300"})
+        for _ in range(3)
+    ))
+    assert sorted(response.status_code for response in responses) == [200, 429, 504]
+    stats = (await client.get("/scheduler")).json()["priorities"][CRITICAL]
+    assert stats["rejected"] >= 1
@@ -0,0 +1,32 @@
+from app.status_store import status_store
+
+
+async def test_status_is_served_from_memory(client, central_system):
+    status_store.clear()
+    response = await client.get("/charge-points/cp-A/status", params={"connector_id": 2, "status": "Charging"})
+    assert response.json()["status"] == "Charging"
+    assert central_system.calls["StatusNotification"] == 1
+
+    response = await client.get("/charge-points/cp-A/status", params={"connector_id": 2})
+    assert response.json()["status"] == "Charging"
+    assert response.json()["age"] >= 0
+    assert central_system.calls["StatusNotification"] == 1
+
+    await client.get("/charge-points/cp-A/status", params={"connector_id": 2, "refresh": True})
+    assert central_system.calls["StatusNotification"] == 2
+    assert status_store.get("cp-A", 2).status == "Available"
+
+    # Un statut fourni par l'appelant est toujours envoyé
+    response = await client.get("/charge-points/cp-A/status", params={"connector_id": 2, "status": "Faulted", "error_code": "GroundFailure"})
+    assert (response.json()["status"], response.json()["errorCode"]) == ("Faulted", "GroundFailure")
+    assert central_system.calls["StatusNotification"] == 3
+    assert status_store.get("cp-A", 2).status == "Faulted"
+
+
+async def test_list_statuses(client):
+    status_store.clear()
+    await client.get("/charge-points/cp-A/status", params={"connector_id": 1, "status": "Available"})
+    await client.get("/charge-points/cp-B/status", params={"connector_id": 1, "status": "Faulted"})
+    response = await client.get("/statuses", params={"status": "Faulted"})
+    assert [(entry["chargePointId"], entry["connectorId"]) for entry in response.json()] == [("cp-B", 1)]
+    assert len((await client.get("/statuses")).json()) == 2
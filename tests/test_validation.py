@@ -0,0 +1,27 @@
+import pytest
+
+from app.connection import ConnectionManager
+from app.validation import PayloadValidationError, SchemaValidation, get_validator, schema_validation
+
+
+def test_validators_are_built_once_per_action_and_direction():
+    assert get_validator("1.6", "Heartbeat", "request") is get_validator("1.6", "Heartbeat", "request")
+    assert get_validator("1.6", "Heartbeat", "request") is not get_validator("1.6", "Heartbeat", "response")
+    assert get_validator("1.6", "NoSuchAction", "request") is None
+
+
+def test_policy_skips_trusted_actions_and_samples():
+    validation = SchemaValidation(mode="sample", sample_rate=0.0, skip_actions={"MeterValues"})
+    assert not validation.should_validate("MeterValues")
+    assert not validation.should_validate("Authorize")
+    assert SchemaValidation(mode="full", skip_actions={"MeterValues"}).should_validate("Authorize")
+    assert validation.stats()["actions"]["MeterValues"]["skipped"] == 1
+
+
+async def test_invalid_request_is_rejected_before_sending(central_system, monkeypatch):
+    monkeypatch.setattr(schema_validation, "mode", "full")
+    manager = ConnectionManager(central_system.url_for("charger-01"))
+    with pytest.raises(PayloadValidationError):
+        await manager.call("Authorize", {"idTag": 42})
+    assert central_system.calls.get("Authorize") is None
+    await manager.close()